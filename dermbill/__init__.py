@@ -8,8 +8,15 @@ revenue through proper documentation and coding.
 
 __version__ = "1.0.0"
 
-from .analyzer import DermBillAnalyzer
-from .models import AnalysisResult, BillingCode, DocumentationEnhancement, FutureOpportunity
+# Public names are imported lazily (PEP 562) so that importing a submodule
+# such as dermbill.cli doesn't pull in the analyzer and its dependencies
+_LAZY_EXPORTS = {
+    "DermBillAnalyzer": ".analyzer",
+    "AnalysisResult": ".models",
+    "BillingCode": ".models",
+    "DocumentationEnhancement": ".models",
+    "FutureOpportunity": ".models",
+}
 
 __all__ = [
     "DermBillAnalyzer",
@@ -18,3 +25,18 @@ __all__ = [
     "DocumentationEnhancement",
     "FutureOpportunity",
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
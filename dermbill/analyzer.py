@@ -9,22 +9,238 @@ Orchestrates the four-step billing optimization workflow:
 """
 
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from .models import (
     AnalysisResult,
+    BillingCode,
     ExtractedEntities,
     CurrentBilling,
+    DocumentationEnhancement,
     DocumentationEnhancements,
     FutureOpportunities,
+    FutureOpportunity,
 )
 from .codes import CPTCodeDatabase, get_code_database
-from .scenarios import ScenarioMatcher, get_scenario_matcher
+from .scenarios import NormalizedNote, ScenarioMatcher, get_scenario_matcher
+from .entities import extract_entities_regex
 from .rules import is_g2211_eligible
 from .llm import LLMClient, get_llm_client
 
 
+# Procedure keyword -> code category, in classification priority order
+PROCEDURE_CATEGORY_KEYWORDS = {
+    "biopsy": "Biopsy",
+    "excision": "Excision",
+    "destruct": "Destruction",
+    "cryo": "Destruction",
+    "repair": "Repair",
+    "closure": "Repair",
+    "flap": "Flap",
+    "graft": "Graft",
+    "mohs": "Mohs",
+}
+_PROCEDURE_CATEGORY_RE = re.compile("|".join(PROCEDURE_CATEGORY_KEYWORDS))
+_KEYWORD_PRIORITY = {keyword: i for i, keyword in enumerate(PROCEDURE_CATEGORY_KEYWORDS)}
+
+# Notes analyzed at once by analyze_notes; each note keeps up to two LLM calls in flight
+MAX_CONCURRENT_NOTES = 4
+
+# Established patient E/M codes that G2211 can be added to
+ESTABLISHED_EM_CODES = frozenset({"99212", "99213", "99214", "99215"})
+
+# Short office follow-ups for exactly one diagnosis with no procedures or
+# measurements bill as a low-complexity established visit. With the trivial-note
+# fast path on, analyze_async codes them as this without calling the LLM
+TRIVIAL_NOTE_MAX_CHARS = 400
+TRIVIAL_NOTE_CODE = "99213"
+# Wording that rules a note out of the fast path: encounters that aren't an
+# established patient office E/M, and high-risk drug monitoring (moderate MDM or more)
+TRIVIAL_NOTE_EXCLUSIONS = {
+    "new_patient": (r"new (?:patient|pt)", r"initial (?:visit|consult)", r"consult"),
+    "no_encounter": (
+        r"no[- ]show", r"did not (?:show|come|arrive)", r"cancel", r"missed (?:appointment|appt|visit)",
+        r"resched", r"voicemail", r"no visit",
+    ),
+    "not_office": (
+        r"tele(?:phone|health|medicine)", r"phone", r"portal", r"video", r"virtual",
+        r"e-?visit", r"message", r"refill", r"called",
+    ),
+    "high_risk_drug": (
+        r"methotrexate", r"mtx", r"cyclosporin", r"isotretinoin", r"accutane", r"absorica",
+        r"claravis", r"acitretin", r"azathioprine", r"mycophenolate", r"cellcept",
+        r"hydroxychloroquine", r"plaquenil", r"dapsone", r"thalidomide",
+        r"prednison", r"rituximab", r"biologic", r"systemic", r"immunosuppress",
+        r"\w+mab", r"\w+cept", r"\w+citinib", r"humira", r"enbrel", r"stelara", r"cosentyx",
+        r"taltz", r"tremfya", r"skyrizi", r"dupixent", r"otezla", r"apremilast", r"sotyktu",
+        r"\blabs?\b", r"lfts?", r"cbc", r"ipledge",
+    ),
+}
+_TRIVIAL_NOTE_EXCLUSION_RE = re.compile(
+    "|".join(f"(?:{pattern})" for patterns in TRIVIAL_NOTE_EXCLUSIONS.values() for pattern in patterns),
+    re.IGNORECASE,
+)
+
+# Rule file -> procedure keywords that pull it into the corpus context
+RULE_TRIGGER_KEYWORDS = {
+    "Repair_Aggregation": frozenset({"repair", "closure", "suture"}),
+    "Measurement_Rules": frozenset({"excision", "biopsy", "flap"}),
+}
+# One named group per rule file so a single scan reports every triggered rule
+_RULE_TRIGGER_RE = re.compile("|".join(
+    f"(?P<{rule_name}>{'|'.join(sorted(keywords))})"
+    for rule_name, keywords in RULE_TRIGGER_KEYWORDS.items()
+))
+
+
+@lru_cache(maxsize=None)
+def _load_insights(corpus_dir: Path) -> str:
+    """Read Clinical_Billing_Insights.md once per process."""
+    filepath = corpus_dir / "Clinical_Billing_Insights.md"
+    if filepath.exists():
+        return filepath.read_text(encoding="utf-8")
+    return ""
+
+
+@lru_cache(maxsize=None)
+def _load_rules_dir(corpus_dir: Path) -> dict[str, str]:
+    """Read every rules/*.md file in a single directory scan, once per process."""
+    rules: dict[str, str] = {}
+    try:
+        entries = list(os.scandir(corpus_dir / "rules"))
+    except FileNotFoundError:
+        return rules
+
+    for entry in entries:
+        if entry.name.endswith(".md") and entry.is_file():
+            with open(entry.path, "rb") as f:
+                rules[entry.name[:-3]] = f.read().decode("utf-8")
+    return rules
+
+
+def _load_rule(corpus_dir: Path, name: str) -> str:
+    """Get the content of rules/<name>.md, or "" if it doesn't exist."""
+    return _load_rules_dir(corpus_dir).get(name, "")
+
+
+# Character budget for the clinical insights excerpt included in prompts
+INSIGHTS_EXCERPT_CHARS = 5000
+
+
+@lru_cache(maxsize=None)
+def _load_insights_excerpt(corpus_dir: Path) -> str:
+    """Cut the clinical insights excerpt used in prompts once per process."""
+    insights = _load_insights(corpus_dir)
+    if len(insights) <= INSIGHTS_EXCERPT_CHARS:
+        return insights
+
+    # End on a paragraph boundary rather than mid-sentence when possible
+    cut = insights.rfind("\n\n", 0, INSIGHTS_EXCERPT_CHARS)
+    if cut <= 0:
+        cut = INSIGHTS_EXCERPT_CHARS
+    return insights[:cut] + "\n..."
+
+
+def preload_corpus(corpus_dir: Optional[Path] = None) -> None:
+    """
+    Warm the corpus file caches so the first analysis skips disk reads.
+
+    Args:
+        corpus_dir: Path to corpus directory. If None, uses default.
+    """
+    if corpus_dir is None:
+        corpus_dir = Path(__file__).parent.parent
+    corpus_dir = Path(corpus_dir)
+
+    _load_insights_excerpt(corpus_dir)
+    _load_rules_dir(corpus_dir)
+
+
+# Suggested context_char_budget (~8k tokens) for deployments that want to cap
+# prompt size; trimming is off by default and only ever drops insights sections
+CORPUS_CONTEXT_CHAR_BUDGET = 32000
+# Insights sections this short (headings, overviews) are always kept to preserve structure
+MIN_TRIMMABLE_SECTION_CHARS = 300
+# Heading of the clinical insights excerpt, the only trimmable part of the corpus context
+INSIGHTS_HEADING = "## CLINICAL BILLING INSIGHTS (Excerpt)"
+
+# Entity words too common to say anything about a section's relevance
+_RELEVANCE_STOPWORDS = frozenset({
+    "with", "left", "right", "from", "that", "this", "were", "performed",
+    "lesion", "lesions", "area", "areas", "site", "sites",
+})
+_WORD_RE = re.compile(r"[a-z0-9]{4,}")
+
+
+@lru_cache(maxsize=16)
+def _context_sections(context: str) -> tuple[tuple[str, str], ...]:
+    """Split text at level-2 and level-3 headings into (section, lowercased section) pairs."""
+    return tuple((section, section.lower()) for section in re.split(r"\n(?=#{2,3} )", context))
+
+
+def _relevance_terms(entities: ExtractedEntities) -> frozenset[str]:
+    """Distinctive words from the extracted diagnoses, procedures and medications."""
+    text = " ".join(entities.diagnoses + entities.procedures + entities.medications).lower()
+    return frozenset(_WORD_RE.findall(text)) - _RELEVANCE_STOPWORDS
+
+
+def _rules_to_load(entities: ExtractedEntities) -> tuple[str, ...]:
+    """Rule files for the note's procedures, in prompt order."""
+    rules = ["Modifiers", "Medical_Necessity"]
+    proc_text = " ".join(entities.procedures).lower()
+    triggered = {m.lastgroup for m in _RULE_TRIGGER_RE.finditer(proc_text)}
+    rules.extend(name for name in RULE_TRIGGER_KEYWORDS if name in triggered)
+    if len(entities.procedures) > 1:
+        rules.append("NCCI_Edits")
+    return tuple(rules)
+
+
+def _trim_corpus_context(context: str, terms: frozenset[str], budget: Optional[int]) -> str:
+    """
+    Fit corpus context into a character budget by trimming the clinical insights excerpt.
+
+    The code category block and the triggered rule files are always kept whole,
+    even over budget, since the model needs every rule that applies to the note.
+    Insights sections are ranked by how many of the note's terms they mention,
+    shorter sections first on ties, and the ones that fit are kept in their
+    original order. Short structural sections are always kept.
+
+    Args:
+        context: Full corpus context
+        terms: Lowercased relevance terms from the note's entities
+        budget: Maximum context length in characters, or None for no limit
+
+    Returns:
+        The context, with its insights trimmed if it was over budget
+    """
+    if budget is None or len(context) <= budget:
+        return context
+    head, heading, insights = context.partition(INSIGHTS_HEADING)
+    if not heading:
+        return context
+
+    sections = _context_sections(insights)
+    keep = [len(section) < MIN_TRIMMABLE_SECTION_CHARS for section, _ in sections]
+    used = len(head) + len(heading) + sum(
+        len(section) + 1 for (section, _), kept in zip(sections, keep) if kept
+    )
+
+    ranked = sorted(
+        (i for i, kept in enumerate(keep) if not kept),
+        key=lambda i: (-sum(term in sections[i][1] for term in terms), len(sections[i][0])),
+    )
+    for i in ranked:
+        size = len(sections[i][0]) + 1
+        if used + size <= budget:
+            keep[i] = True
+            used += size
+
+    return head + heading + "\n".join(section for (section, _), kept in zip(sections, keep) if kept)
+
+
 class DermBillAnalyzer:
     """Main analyzer for dermatology billing optimization."""
 
@@ -32,6 +248,8 @@ class DermBillAnalyzer:
         self,
         corpus_dir: Optional[str] = None,
         llm_client: Optional[LLMClient] = None,
+        context_char_budget: Optional[int] = None,
+        trivial_note_fast_path: Optional[bool] = None,
     ):
         """
         Initialize the analyzer.
@@ -39,18 +257,48 @@ class DermBillAnalyzer:
         Args:
             corpus_dir: Path to corpus directory. If None, uses default.
             llm_client: LLM client instance. If None, creates one.
+            context_char_budget: Character limit for the corpus context sent to
+                the LLM (e.g. CORPUS_CONTEXT_CHAR_BUDGET); only the clinical
+                insights excerpt is trimmed to meet it. If None, the full context
+                is always sent.
+            trivial_note_fast_path: Bill short single-problem follow-ups as 99213
+                without calling the LLM. If None, uses DERMBILL_TRIVIAL_NOTE_FAST_PATH
+                env var (default off).
         """
         if corpus_dir is None:
             corpus_dir = Path(__file__).parent.parent
 
         self.corpus_dir = Path(corpus_dir)
-        self.code_db = CPTCodeDatabase(self.corpus_dir / "CPT_Master_Reference.xlsx")
-        self.scenario_matcher = ScenarioMatcher(self.corpus_dir / "scenarios")
+
+        # Share the process-wide code database (warmed at API startup) and
+        # scenario matcher when they point at the same corpus
+        excel_path = self.corpus_dir / "CPT_Master_Reference.xlsx"
+        shared_db = get_code_database()
+        if shared_db.excel_path == excel_path:
+            self.code_db = shared_db
+        else:
+            self.code_db = CPTCodeDatabase(excel_path)
+
+        scenarios_dir = self.corpus_dir / "scenarios"
+        shared_matcher = get_scenario_matcher()
+        if shared_matcher.scenarios_dir == scenarios_dir:
+            self.scenario_matcher = shared_matcher
+        else:
+            self.scenario_matcher = ScenarioMatcher(scenarios_dir)
+
         self.llm_client = llm_client
+        self.context_char_budget = context_char_budget
 
-        # Load corpus files
-        self._clinical_insights: Optional[str] = None
-        self._rules_content: dict[str, str] = {}
+        if trivial_note_fast_path is None:
+            trivial_note_fast_path = os.getenv(
+                "DERMBILL_TRIVIAL_NOTE_FAST_PATH", ""
+            ).lower() in ("1", "true", "yes")
+        self.trivial_note_fast_path = trivial_note_fast_path
+        # Notes answered by the fast path, for reviewing how often it fires
+        self.trivial_notes_skipped = 0
+
+        # Corpus context, keyed by (categories, rule names)
+        self._context_cache: dict[tuple[frozenset[str], tuple[str, ...]], str] = {}
 
     def _get_llm_client(self) -> LLMClient:
         """Get or create LLM client."""
@@ -60,13 +308,7 @@ class DermBillAnalyzer:
 
     def _load_clinical_insights(self) -> str:
         """Load the Clinical_Billing_Insights.md file."""
-        if self._clinical_insights is None:
-            filepath = self.corpus_dir / "Clinical_Billing_Insights.md"
-            if filepath.exists():
-                self._clinical_insights = filepath.read_text(encoding="utf-8")
-            else:
-                self._clinical_insights = ""
-        return self._clinical_insights
+        return _load_insights(self.corpus_dir)
 
     def _load_rules(self, rule_names: list[str]) -> str:
         """
@@ -79,62 +321,71 @@ class DermBillAnalyzer:
             Combined rule content
         """
         content_parts = []
-        rules_dir = self.corpus_dir / "rules"
 
         for name in rule_names:
-            if name not in self._rules_content:
-                filepath = rules_dir / f"{name}.md"
-                if filepath.exists():
-                    self._rules_content[name] = filepath.read_text(encoding="utf-8")
-                else:
-                    self._rules_content[name] = ""
-
-            if self._rules_content[name]:
-                content_parts.append(f"## {name}\n{self._rules_content[name]}")
+            content = _load_rule(self.corpus_dir, name)
+            if content:
+                content_parts.append(f"## {name}\n{content}")
 
         return "\n\n".join(content_parts)
 
+    def _warm_corpus(self) -> None:
+        """Read the corpus files and code categories that corpus context is built from."""
+        preload_corpus(self.corpus_dir)
+        try:
+            self.code_db.categories_df
+        except FileNotFoundError:
+            pass  # Only an error if the context actually needs category info
+
+    def _procedure_categories(self, procedures_lower: list[str]) -> frozenset[str]:
+        """
+        Map extracted procedures to code categories.
+
+        Args:
+            procedures_lower: Extracted procedures, lowercased
+
+        Returns:
+            Set of category names seen across the procedures
+        """
+        categories_seen = set()
+        for proc_lower in procedures_lower:
+            # One scan per procedure; the highest-priority keyword decides the category
+            hits = _PROCEDURE_CATEGORY_RE.findall(proc_lower)
+            if hits:
+                keyword = min(hits, key=_KEYWORD_PRIORITY.__getitem__)
+                categories_seen.add(PROCEDURE_CATEGORY_KEYWORDS[keyword])
+        return frozenset(categories_seen)
+
     def _build_corpus_context(
         self,
-        entities: ExtractedEntities,
-        include_rules: list[str],
+        categories_key: frozenset[str],
+        rules_key: tuple[str, ...],
     ) -> str:
         """
         Build context from corpus for LLM prompts.
 
+        The result only depends on the categories and rules involved, so it is
+        cached per analyzer; there are few distinct combinations in practice.
+
         Args:
-            entities: Extracted entities to match scenarios
-            include_rules: Rule files to include
+            categories_key: Code categories to describe
+            rules_key: Rule file names to include, in prompt order
 
         Returns:
             Combined corpus context string
         """
+        cache_key = (categories_key, rules_key)
+        if cache_key in self._context_cache:
+            return self._context_cache[cache_key]
+
         context_parts = []
 
-        # Add relevant code information
+        # Add relevant code information (sheets load lazily on first access),
+        # in category table order so equal keys always give the same prompt
         code_db = self.code_db
-        code_db.load()
-
-        # Get category info for relevant procedures
-        categories_seen = set()
-        for proc in entities.procedures:
-            proc_lower = proc.lower()
-            if "biopsy" in proc_lower:
-                categories_seen.add("Biopsy")
-            elif "excision" in proc_lower:
-                categories_seen.add("Excision")
-            elif "destruct" in proc_lower or "cryo" in proc_lower:
-                categories_seen.add("Destruction")
-            elif "repair" in proc_lower or "closure" in proc_lower:
-                categories_seen.add("Repair")
-            elif "flap" in proc_lower:
-                categories_seen.add("Flap")
-            elif "graft" in proc_lower:
-                categories_seen.add("Graft")
-            elif "mohs" in proc_lower:
-                categories_seen.add("Mohs")
-
-        for category in categories_seen:
+        for category in dict.fromkeys(PROCEDURE_CATEGORY_KEYWORDS.values()):
+            if category not in categories_key:
+                continue
             cat_info = code_db.get_category_info(category)
             if cat_info:
                 context_parts.append(
@@ -144,22 +395,20 @@ class DermBillAnalyzer:
                 )
 
         # Add rules content
-        rules_content = self._load_rules(include_rules)
+        rules_content = self._load_rules(list(rules_key))
         if rules_content:
             context_parts.append(f"## BILLING RULES\n{rules_content}")
 
         # Add clinical insights excerpt
-        insights = self._load_clinical_insights()
-        if insights:
-            # Include relevant sections based on diagnoses
-            context_parts.append("## CLINICAL BILLING INSIGHTS (Excerpt)")
+        insights_excerpt = _load_insights_excerpt(self.corpus_dir)
+        if insights_excerpt:
             # For now, include a summary - could be more selective
-            if len(insights) > 5000:
-                context_parts.append(insights[:5000] + "...")
-            else:
-                context_parts.append(insights)
+            context_parts.append(INSIGHTS_HEADING)
+            context_parts.append(insights_excerpt)
 
-        return "\n\n".join(context_parts)
+        context = "\n\n".join(context_parts)
+        self._context_cache[cache_key] = context
+        return context
 
     async def analyze_async(self, note_text: str) -> AnalysisResult:
         """
@@ -175,63 +424,189 @@ class DermBillAnalyzer:
         import asyncio
         print("[ANALYZER] Starting analysis...", flush=True)
 
+        trivial = self._trivial_result(note_text)
+        if trivial is not None:
+            return trivial
+
         llm = self._get_llm_client()
         print(f"[ANALYZER] Using model: {llm.model}", flush=True)
 
-        # Step 1: Entity Extraction (must be done first)
+        entities, scenario_content, corpus_context = await self._prepare_analysis(note_text)
+
+        # Steps 2+3 and 4 run in PARALLEL
+        print("[ANALYZER] Steps 2-3 & 4: Running billing/enhancements and opportunities in parallel...", flush=True)
+        start = time.time()
+
+        # Run both LLM calls concurrently, sharing one serialization of the entities
+        entities_json = entities.model_dump_json(indent=2)
+        enhancements_task = llm.identify_enhancements_async(
+            note_text, entities, corpus_context, entities_json=entities_json
+        )
+        opportunities_task = llm.identify_opportunities_async(
+            note_text, entities, scenario_content, corpus_context, entities_json=entities_json
+        )
+
+        (current_billing, doc_enhancements), future_opps = await asyncio.gather(
+            enhancements_task,
+            opportunities_task
+        )
+
+        print(f"[ANALYZER] Steps 2-4 complete in {time.time()-start:.1f}s (parallel)", flush=True)
+        print("[ANALYZER] All steps complete!", flush=True)
+        return self._build_result(note_text, entities, current_billing, doc_enhancements, future_opps)
+
+    async def _prepare_analysis(self, note_text: str) -> tuple[ExtractedEntities, str, str]:
+        """
+        Extract entities and gather the scenario and corpus context for a note.
+
+        Args:
+            note_text: Clinical note text to analyze
+
+        Returns:
+            Tuple of (entities, scenario_content, corpus_context)
+        """
+        import time
+        import asyncio
+        llm = self._get_llm_client()
+
+        # Lowercase and tokenize the note once for keyword matching
+        note = NormalizedNote.from_text(note_text)
+
+        # Step 1: Entity Extraction (must be done first). Scenario matching only
+        # needs the note text and the corpus reads don't depend on the note at all,
+        # so both run in threads while the LLM call is in flight
         print("[ANALYZER] Step 1: Extracting entities...", flush=True)
         start = time.time()
-        entities = llm.extract_entities(note_text)
+        entities, scenario_matches, _ = await asyncio.gather(
+            llm.extract_entities_async(note_text),
+            asyncio.to_thread(self.scenario_matcher.match_scenarios, note, max_matches=3),
+            asyncio.to_thread(self._warm_corpus),
+        )
         print(f"[ANALYZER] Step 1 complete in {time.time()-start:.1f}s", flush=True)
 
-        # Match scenarios based on entities
-        scenario_matches = self.scenario_matcher.match_scenarios(note_text)
         scenario_content = ""
         if scenario_matches:
-            scenario_content = scenario_matches[0].content
+            parts = [scenario_matches[0].content]
             for match in scenario_matches[1:3]:
-                scenario_content += f"\n\n---\n\n# Additional: {match.name}\n{match.content}"
+                parts.append(f"# Additional: {match.name}\n{match.content}")
+            scenario_content = "\n\n---\n\n".join(parts)
+
+        # Build corpus context (may load the CPT workbook on a cold analyzer)
+        procedures_lower = [p.lower() for p in entities.procedures]
+        categories_key = self._procedure_categories(procedures_lower)
+        corpus_context = await asyncio.to_thread(
+            self._build_corpus_context, categories_key, _rules_to_load(entities)
+        )
+        corpus_context = _trim_corpus_context(
+            corpus_context, _relevance_terms(entities), self.context_char_budget
+        )
+        return entities, scenario_content, corpus_context
 
-        # Determine which rules to load based on procedures
-        rules_to_load = ["Modifiers", "Medical_Necessity"]
-        proc_text = " ".join(entities.procedures).lower()
-        if any(x in proc_text for x in ["repair", "closure", "suture"]):
-            rules_to_load.append("Repair_Aggregation")
-        if any(x in proc_text for x in ["excision", "biopsy", "flap"]):
-            rules_to_load.append("Measurement_Rules")
-        if len(entities.procedures) > 1:
-            rules_to_load.append("NCCI_Edits")
+    async def iter_enhancements(self, note_text: str) -> AsyncIterator[DocumentationEnhancement]:
+        """
+        Stream the documentation enhancements for a note as they are generated.
 
-        # Build corpus context
-        corpus_context = self._build_corpus_context(entities, rules_to_load)
+        Args:
+            note_text: Clinical note text to analyze
 
-        # Steps 2+3 and 4 run in PARALLEL
-        print("[ANALYZER] Steps 2-3 & 4: Running billing/enhancements and opportunities in parallel...", flush=True)
-        start = time.time()
+        Yields:
+            DocumentationEnhancement objects in response order
+        """
+        llm = self._get_llm_client()
+        entities, _, corpus_context = await self._prepare_analysis(note_text)
+        async for enhancement in llm.iter_enhancements(note_text, entities, corpus_context):
+            yield enhancement
 
-        # Run both LLM calls concurrently
-        enhancements_task = llm.identify_enhancements_async(note_text, entities, corpus_context)
-        opportunities_task = llm.identify_opportunities_async(note_text, entities, scenario_content, corpus_context)
+    async def iter_opportunities(self, note_text: str) -> AsyncIterator[FutureOpportunity]:
+        """
+        Stream the future opportunities for a note as they are generated.
 
-        (current_billing, doc_enhancements), future_opps = await asyncio.gather(
-            enhancements_task,
-            opportunities_task
-        )
+        Args:
+            note_text: Clinical note text to analyze
 
-        print(f"[ANALYZER] Steps 2-4 complete in {time.time()-start:.1f}s (parallel)", flush=True)
+        Yields:
+            FutureOpportunity objects in response order
+        """
+        llm = self._get_llm_client()
+        entities, scenario_content, corpus_context = await self._prepare_analysis(note_text)
+        async for opportunity in llm.iter_opportunities(
+            note_text, entities, scenario_content, corpus_context
+        ):
+            yield opportunity
+
+    def _trivial_result(self, note_text: str) -> Optional[AnalysisResult]:
+        """
+        Canned 99213 analysis for a trivial note, or None if the note needs the LLM.
+
+        A note is trivial when it is short, names exactly one diagnosis, has no
+        procedures or measurements, and has none of the TRIVIAL_NOTE_EXCLUSIONS
+        wording (new patient, no-show, telephone/portal/refill-only contact,
+        high-risk systemic drugs). Only applies when trivial_note_fast_path is on
+        and the code database has TRIVIAL_NOTE_CODE.
+        """
+        if not self.trivial_note_fast_path or len(note_text) >= TRIVIAL_NOTE_MAX_CHARS:
+            return None
+        if _TRIVIAL_NOTE_EXCLUSION_RE.search(note_text):
+            return None
+        entities = extract_entities_regex(note_text)
+        if entities.procedures or entities.measurements or len(entities.diagnoses) != 1:
+            return None
+        # Description and wRVU come from the code database like every other result
+        code_info = self.code_db.get_code(TRIVIAL_NOTE_CODE)
+        if code_info is None:
+            return None
+        # The regex extraction is cached; the result gets its own copy
+        entities = entities.model_copy(deep=True)
+
+        self.trivial_notes_skipped += 1
+        print(
+            f"[ANALYZER] Trivial note ({len(note_text)} chars), skipping LLM calls "
+            f"({self.trivial_notes_skipped} so far)",
+            flush=True,
+        )
+        current_billing = CurrentBilling(
+            codes=[
+                BillingCode(
+                    code=code_info.code,
+                    description=code_info.description,
+                    wRVU=code_info.wRVU,
+                    documentation_note="Short single-problem follow-up; coded without LLM analysis",
+                    diagnosis=entities.diagnoses[0],
+                )
+            ],
+            total_wRVU=code_info.wRVU,
+        )
+        return self._build_result(
+            note_text,
+            entities,
+            current_billing,
+            DocumentationEnhancements(enhanced_total_wRVU=code_info.wRVU),
+            FutureOpportunities(),
+        )
 
+    def _build_result(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        current_billing: CurrentBilling,
+        doc_enhancements: DocumentationEnhancements,
+        future_opps: FutureOpportunities,
+    ) -> AnalysisResult:
+        """Assemble the final AnalysisResult, flagging a missed G2211 add-on."""
         # Check G2211 eligibility
         if is_g2211_eligible(entities.diagnoses):
-            has_g2211 = any(c.code == "G2211" for c in current_billing.codes)
-            if not has_g2211:
-                em_codes = ["99212", "99213", "99214", "99215"]
-                has_em = any(c.code in em_codes for c in current_billing.codes)
-                if has_em:
-                    current_billing.documentation_gaps.append(
-                        "G2211 (chronic condition add-on, +0.33 wRVU) may be applicable - ensure chronic condition is documented"
-                    )
+            has_g2211 = has_em = False
+            for c in current_billing.codes:
+                if c.code == "G2211":
+                    has_g2211 = True
+                    break
+                if c.code in ESTABLISHED_EM_CODES:
+                    has_em = True
+            if has_em and not has_g2211:
+                current_billing.documentation_gaps.append(
+                    "G2211 (chronic condition add-on, +0.33 wRVU) may be applicable - ensure chronic condition is documented"
+                )
 
-        print("[ANALYZER] All steps complete!", flush=True)
         return AnalysisResult(
             entities=entities,
             current_billing=current_billing,
@@ -245,7 +620,104 @@ class DermBillAnalyzer:
         Synchronous wrapper for analyze_async.
         """
         import asyncio
-        return asyncio.get_event_loop().run_until_complete(self.analyze_async(note_text))
+        return asyncio.run(self.analyze_async(note_text))
+
+    async def analyze_notes_async(
+        self,
+        notes: list[str],
+        max_concurrency: int = MAX_CONCURRENT_NOTES,
+    ) -> list[AnalysisResult]:
+        """
+        Analyze many clinical notes concurrently.
+
+        Each note runs the full analyze_async pipeline; at most max_concurrency
+        notes are in flight at once so bulk runs stay within API rate limits.
+        When the LLM client has use_batch_api set, entity extraction still runs
+        per note, but the enhancements and opportunities calls for all notes go
+        out as one Message Batches job at half the token price; a batch that
+        doesn't finish within BATCH_MAX_WAIT is cancelled and its notes are
+        analyzed with direct calls instead. Identical notes (re-runs,
+        copy-forward visits) are analyzed once.
+
+        Args:
+            notes: Clinical note texts to analyze
+            max_concurrency: Maximum number of notes analyzed at the same time
+
+        Returns:
+            AnalysisResults in the same order as notes
+        """
+        import asyncio
+        semaphore = asyncio.Semaphore(max_concurrency)
+        unique_notes = list(dict.fromkeys(notes))
+
+        async def analyze_one(note_text: str) -> AnalysisResult:
+            async with semaphore:
+                return await self.analyze_async(note_text)
+
+        async def prepare_one(note_text: str) -> tuple[ExtractedEntities, str, str]:
+            async with semaphore:
+                return await self._prepare_analysis(note_text)
+
+        async def identify_one(
+            note_text: str, entities: ExtractedEntities, scenario_content: str, corpus_context: str
+        ) -> tuple[CurrentBilling, DocumentationEnhancements, FutureOpportunities]:
+            async with semaphore:
+                entities_json = entities.model_dump_json(indent=2)
+                (current_billing, doc_enhancements), future_opps = await asyncio.gather(
+                    llm.identify_enhancements_async(
+                        note_text, entities, corpus_context, entities_json=entities_json
+                    ),
+                    llm.identify_opportunities_async(
+                        note_text, entities, scenario_content, corpus_context, entities_json=entities_json
+                    ),
+                )
+                return current_billing, doc_enhancements, future_opps
+
+        llm = self._get_llm_client()
+        if not llm.use_batch_api or len(unique_notes) <= 1:
+            results = await asyncio.gather(*(analyze_one(note) for note in unique_notes))
+        else:
+            # Trivial notes are answered without the LLM, as in analyze_async
+            by_note = {note: self._trivial_result(note) for note in unique_notes}
+            llm_notes = [note for note, result in by_note.items() if result is None]
+            if llm_notes:
+                prepared = await asyncio.gather(*(prepare_one(note) for note in llm_notes))
+                batch_notes = [
+                    (note_text, entities, scenario_content, corpus_context)
+                    for note_text, (entities, scenario_content, corpus_context) in zip(llm_notes, prepared)
+                ]
+                try:
+                    analyses = await asyncio.to_thread(llm.identify_batch, batch_notes)
+                except TimeoutError as e:
+                    # The batch was cancelled; make the calls directly instead
+                    print(f"[ANALYZER] {e}; analyzing notes concurrently", flush=True)
+                    analyses = await asyncio.gather(*(identify_one(*note) for note in batch_notes))
+                by_note.update(
+                    (note_text, self._build_result(note_text, entities, *analysis))
+                    for note_text, (entities, _, _), analysis in zip(llm_notes, prepared, analyses)
+                )
+            results = list(by_note.values())
+
+        # Repeated notes get their own copy, so callers can modify results independently
+        by_note = dict(zip(unique_notes, results))
+        returned = set()
+        ordered = []
+        for note_text in notes:
+            result = by_note[note_text]
+            ordered.append(result.model_copy(deep=True) if note_text in returned else result)
+            returned.add(note_text)
+        return ordered
+
+    def analyze_notes(
+        self,
+        notes: list[str],
+        max_concurrency: int = MAX_CONCURRENT_NOTES,
+    ) -> list[AnalysisResult]:
+        """
+        Synchronous wrapper for analyze_notes_async.
+        """
+        import asyncio
+        return asyncio.run(self.analyze_notes_async(notes, max_concurrency))
 
     def lookup_code(self, code: str) -> Optional[dict]:
         """
@@ -269,6 +741,12 @@ class DermBillAnalyzer:
         return self.scenario_matcher.get_scenario_content(name)
 
 
+@lru_cache(maxsize=1)
+def _default_analyzer() -> DermBillAnalyzer:
+    """Get the process-wide analyzer used by analyze_note."""
+    return DermBillAnalyzer()
+
+
 # Convenience function for quick analysis
 def analyze_note(note_text: str) -> AnalysisResult:
     """
@@ -280,5 +758,4 @@ def analyze_note(note_text: str) -> AnalysisResult:
     Returns:
         Complete AnalysisResult
     """
-    analyzer = DermBillAnalyzer()
-    return analyzer.analyze(note_text)
+    return _default_analyzer().analyze(note_text)
@@ -3,6 +3,8 @@ FastAPI REST API Server for DermBill AI
 
 Endpoints:
     POST /analyze - Analyze a clinical note
+    POST /analyze/enhancements/stream - Stream documentation enhancements (SSE)
+    POST /analyze/opportunities/stream - Stream future opportunities (SSE)
     GET /codes/{code} - Look up a CPT/HCPCS code
     GET /scenarios - List available scenarios
     GET /scenarios/{name} - Get a specific scenario
@@ -12,13 +14,14 @@ Endpoints:
 import os
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Callable, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from fastapi.sse import EventSourceResponse, ServerSentEvent
 from dotenv import load_dotenv
 
 # Handle both relative imports (when run as module) and absolute imports (Vercel)
@@ -33,10 +36,10 @@ try:
         RegenerateNoteRequest,
         RegenerateNoteResponse,
     )
-    from .analyzer import DermBillAnalyzer
+    from .analyzer import DermBillAnalyzer, preload_corpus
     from .codes import get_code_database
     from .scenarios import get_scenario_matcher
-    from .llm import get_llm_client
+    from .llm import get_llm_client, close_llm_clients
     from . import __version__
 except ImportError:
     # When run directly by Vercel, add parent directory to path
@@ -51,10 +54,10 @@ except ImportError:
         RegenerateNoteRequest,
         RegenerateNoteResponse,
     )
-    from analyzer import DermBillAnalyzer
+    from analyzer import DermBillAnalyzer, preload_corpus
     from codes import get_code_database
     from scenarios import get_scenario_matcher
-    from llm import get_llm_client
+    from llm import get_llm_client, close_llm_clients
     __version__ = "1.0.0"
 
 
@@ -76,15 +79,23 @@ def get_analyzer() -> DermBillAnalyzer:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler for startup/shutdown."""
-    # Startup: Pre-load the code database for faster first requests
+    # Startup: Pre-load the code database, corpus files, scenarios and the
+    # analyzer so the first /analyze request doesn't pay for them
     try:
         db = get_code_database()
         db.load()
     except Exception:
         pass  # Don't fail startup if corpus isn't available
+    preload_corpus()
+    try:
+        analyzer = get_analyzer()
+        for name in analyzer.list_scenarios():
+            analyzer.get_scenario(name)
+    except Exception:
+        pass
     yield
-    # Shutdown: cleanup if needed
-    pass
+    # Shutdown: close pooled API connections
+    await close_llm_clients()
 
 
 # Create FastAPI app
@@ -128,17 +139,11 @@ async def root():
 @app.get("/health", response_model=HealthResponse, tags=["System"])
 async def health_check():
     """Health check endpoint."""
-    try:
-        db = get_code_database()
-        db.load()
-        corpus_loaded = True
-    except Exception:
-        corpus_loaded = False
-
+    # The code database is loaded once at startup; don't re-check the workbook per hit
     return HealthResponse(
         status="healthy",
         version=__version__,
-        corpus_loaded=corpus_loaded,
+        corpus_loaded=get_code_database().is_loaded,
     )
 
 
@@ -173,6 +178,52 @@ async def analyze_note(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+async def _event_stream(stream: Callable[[], AsyncIterator], name: str) -> AsyncIterator:
+    """
+    Relay the items of stream() as server-sent events.
+
+    Each item is sent as an unnamed event. The stream ends with a "done" event
+    carrying the item count, or an "error" event whose data has the failure detail.
+    """
+    import traceback
+    count = 0
+    try:
+        async for item in stream():
+            count += 1
+            yield item
+    except Exception as e:
+        print(f"[STREAM] Exception: {e}\n{traceback.format_exc()}", flush=True)
+        yield ServerSentEvent(event="error", data={"detail": f"Analysis error: {str(e)}"})
+        return
+    yield ServerSentEvent(event="done", data={name: count})
+
+
+@app.post("/analyze/enhancements/stream", response_class=EventSourceResponse, tags=["Analysis"])
+async def stream_enhancements(request: AnalyzeRequest):
+    """
+    Stream documentation enhancements for a clinical note as server-sent events.
+
+    Each unnamed event carries one DocumentationEnhancement; the stream ends
+    with a "done" or "error" event. The bundled frontend still uses /analyze.
+    """
+    async for event in _event_stream(lambda: get_analyzer().iter_enhancements(request.note), "enhancements"):
+        yield event
+
+
+@app.post("/analyze/opportunities/stream", response_class=EventSourceResponse, tags=["Analysis"])
+async def stream_opportunities(request: AnalyzeRequest):
+    """
+    Stream future opportunities for a clinical note as server-sent events.
+
+    Each unnamed event carries one FutureOpportunity, so a client can render
+    opportunity cards while the rest of the analysis is still generating.
+    The stream ends with a "done" or "error" event. The bundled frontend
+    still uses /analyze.
+    """
+    async for event in _event_stream(lambda: get_analyzer().iter_opportunities(request.note), "opportunities"):
+        yield event
+
+
 @app.post("/regenerate-note", response_model=RegenerateNoteResponse, tags=["Analysis"])
 async def regenerate_note(request: RegenerateNoteRequest):
     """
@@ -10,13 +10,18 @@ Usage:
 """
 
 import argparse
-import json
 import sys
 from pathlib import Path
 
+import orjson
 from dotenv import load_dotenv
 
 
+def dump_json(data) -> str:
+    """Serialize data as indented JSON for CLI output."""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+
+
 def cmd_analyze(args):
     """Analyze a clinical note."""
     from .analyzer import DermBillAnalyzer
@@ -42,123 +47,127 @@ def cmd_analyze(args):
 
     # Output
     if args.format == "json":
-        print(json.dumps(result.model_dump(), indent=2))
+        print(result.model_dump_json(indent=2))
     else:
         print_analysis_report(result)
 
 
 def print_analysis_report(result):
     """Print a human-readable analysis report."""
-    print("=" * 70)
-    print("DERMBILL AI - BILLING OPTIMIZATION REPORT")
-    print("=" * 70)
-    print()
+    # Collect lines and emit them in a single write
+    out: list[str] = []
+    out.append("=" * 70)
+    out.append("DERMBILL AI - BILLING OPTIMIZATION REPORT")
+    out.append("=" * 70)
+    out.append("")
 
     # Step 1: Entities
-    print("STEP 1: EXTRACTED ENTITIES")
-    print("-" * 40)
+    out.append("STEP 1: EXTRACTED ENTITIES")
+    out.append("-" * 40)
     entities = result.entities
     if entities.diagnoses:
-        print(f"Diagnoses: {', '.join(entities.diagnoses)}")
+        out.append(f"Diagnoses: {', '.join(entities.diagnoses)}")
     if entities.procedures:
-        print(f"Procedures: {', '.join(entities.procedures)}")
+        out.append(f"Procedures: {', '.join(entities.procedures)}")
     if entities.anatomic_sites:
-        print(f"Sites: {', '.join(entities.anatomic_sites)}")
+        out.append(f"Sites: {', '.join(entities.anatomic_sites)}")
     if entities.measurements:
-        print(f"Measurements: {len(entities.measurements)} found")
+        out.append(f"Measurements: {len(entities.measurements)} found")
     if entities.medications:
-        print(f"Medications: {', '.join(entities.medications)}")
-    print()
+        out.append(f"Medications: {', '.join(entities.medications)}")
+    out.append("")
 
     # Step 2: Current Billing
-    print("STEP 2: CURRENT MAXIMUM BILLING")
-    print("-" * 40)
+    out.append("STEP 2: CURRENT MAXIMUM BILLING")
+    out.append("-" * 40)
     current = result.current_billing
     if current.codes:
-        print(f"{'Code':<10} {'Mod':<5} {'Description':<35} {'wRVU':>8} {'Status':<15}")
-        print("-" * 75)
+        out.append(f"{'Code':<10} {'Mod':<5} {'Description':<35} {'wRVU':>8} {'Status':<15}")
+        out.append("-" * 75)
         for code in current.codes:
             mod = code.modifier or ""
             desc = code.description[:35] if code.description else ""
-            print(f"{code.code:<10} {mod:<5} {desc:<35} {code.wRVU:>8.2f} {code.status:<15}")
-        print("-" * 75)
-        print(f"{'TOTAL wRVU:':<52} {current.total_wRVU:>8.2f}")
+            out.append(f"{code.code:<10} {mod:<5} {desc:<35} {code.wRVU:>8.2f} {code.status:<15}")
+        out.append("-" * 75)
+        out.append(f"{'TOTAL wRVU:':<52} {current.total_wRVU:>8.2f}")
     else:
-        print("No billable codes identified from current documentation.")
+        out.append("No billable codes identified from current documentation.")
 
     if current.documentation_gaps:
-        print()
-        print("Documentation Gaps:")
+        out.append("")
+        out.append("Documentation Gaps:")
         for gap in current.documentation_gaps:
-            print(f"  - {gap}")
-    print()
+            out.append(f"  - {gap}")
+    out.append("")
 
     # Step 3: Enhancements
-    print("STEP 3: DOCUMENTATION ENHANCEMENTS")
-    print("-" * 40)
+    out.append("STEP 3: DOCUMENTATION ENHANCEMENTS")
+    out.append("-" * 40)
     enhancements = result.documentation_enhancements
     if enhancements.enhancements:
         for i, enh in enumerate(enhancements.enhancements, 1):
-            print(f"{i}. [{enh.priority.upper()}] {enh.issue}")
+            out.append(f"{i}. [{enh.priority.upper()}] {enh.issue}")
             if enh.current_code:
-                print(f"   Current: {enh.current_code} ({enh.current_wRVU:.2f} wRVU)")
+                out.append(f"   Current: {enh.current_code} ({enh.current_wRVU:.2f} wRVU)")
             if enh.enhanced_code:
-                print(f"   Enhanced: {enh.enhanced_code} ({enh.enhanced_wRVU:.2f} wRVU)")
-            print(f"   Add: \"{enh.suggested_addition}\"")
-            print(f"   Delta: +{enh.delta_wRVU:.2f} wRVU")
-            print()
+                out.append(f"   Enhanced: {enh.enhanced_code} ({enh.enhanced_wRVU:.2f} wRVU)")
+            out.append(f"   Add: \"{enh.suggested_addition}\"")
+            out.append(f"   Delta: +{enh.delta_wRVU:.2f} wRVU")
+            out.append("")
 
         if enhancements.suggested_addendum:
-            print("SUGGESTED ADDENDUM:")
-            print("-" * 40)
-            print(enhancements.suggested_addendum)
-            print()
+            out.append("SUGGESTED ADDENDUM:")
+            out.append("-" * 40)
+            out.append(enhancements.suggested_addendum)
+            out.append("")
 
-        print(f"Enhanced Total wRVU: {enhancements.enhanced_total_wRVU:.2f}")
-        print(f"Improvement: +{enhancements.improvement:.2f} wRVU")
+        out.append(f"Enhanced Total wRVU: {enhancements.enhanced_total_wRVU:.2f}")
+        out.append(f"Improvement: +{enhancements.improvement:.2f} wRVU")
     else:
-        print("No documentation enhancements identified.")
-    print()
+        out.append("No documentation enhancements identified.")
+    out.append("")
 
     # Step 4: Future Opportunities
-    print("STEP 4: FUTURE OPPORTUNITIES ('NEXT TIME')")
-    print("-" * 40)
+    out.append("STEP 4: FUTURE OPPORTUNITIES ('NEXT TIME')")
+    out.append("-" * 40)
     opportunities = result.future_opportunities
     if opportunities.opportunities:
         for i, opp in enumerate(opportunities.opportunities, 1):
-            print(f"{i}. [{opp.category.upper()}] {opp.finding}")
-            print(f"   Opportunity: {opp.opportunity}")
-            print(f"   Action: {opp.action}")
+            out.append(f"{i}. [{opp.category.upper()}] {opp.finding}")
+            out.append(f"   Opportunity: {opp.opportunity}")
+            out.append(f"   Action: {opp.action}")
             if opp.potential_code:
-                print(f"   Potential: {opp.potential_code.code} - {opp.potential_code.description} ({opp.potential_code.wRVU:.2f} wRVU)")
-            print(f"   Teaching: {opp.teaching_point}")
-            print()
+                out.append(f"   Potential: {opp.potential_code.code} - {opp.potential_code.description} ({opp.potential_code.wRVU:.2f} wRVU)")
+            out.append(f"   Teaching: {opp.teaching_point}")
+            out.append("")
 
-        print(f"Total Potential Additional wRVU: {opportunities.total_potential_additional_wRVU:.2f}")
+        out.append(f"Total Potential Additional wRVU: {opportunities.total_potential_additional_wRVU:.2f}")
     else:
-        print("No future opportunities identified.")
-    print()
+        out.append("No future opportunities identified.")
+    out.append("")
 
     # Optimized Notes
     if enhancements.optimized_note:
-        print("=" * 70)
-        print("OPTIMIZED NOTE (Documentation Enhancements Applied)")
-        print("=" * 70)
-        print(enhancements.optimized_note)
-        print()
+        out.append("=" * 70)
+        out.append("OPTIMIZED NOTE (Documentation Enhancements Applied)")
+        out.append("=" * 70)
+        out.append(enhancements.optimized_note)
+        out.append("")
 
     if opportunities.optimized_note:
-        print("=" * 70)
-        print("OPTIMIZED NOTE (All Opportunities Captured)")
-        print("=" * 70)
-        print(opportunities.optimized_note)
-        print()
+        out.append("=" * 70)
+        out.append("OPTIMIZED NOTE (All Opportunities Captured)")
+        out.append("=" * 70)
+        out.append(opportunities.optimized_note)
+        out.append("")
 
     # Compliance notice
-    print("=" * 70)
-    print("COMPLIANCE NOTICE")
-    print("=" * 70)
-    print(result.compliance_notice)
+    out.append("=" * 70)
+    out.append("COMPLIANCE NOTICE")
+    out.append("=" * 70)
+    out.append(result.compliance_notice)
+
+    sys.stdout.write("\n".join(out) + "\n")
 
 
 def cmd_code(args):
@@ -173,7 +182,7 @@ def cmd_code(args):
         sys.exit(1)
 
     if args.format == "json":
-        print(json.dumps(code_info.model_dump(), indent=2))
+        print(code_info.model_dump_json(indent=2))
     else:
         print(f"Code: {code_info.code}")
         print(f"Category: {code_info.category}")
@@ -205,7 +214,7 @@ def cmd_scenarios(args):
     scenarios = matcher.list_scenarios()
 
     if args.format == "json":
-        print(json.dumps({"scenarios": scenarios}, indent=2))
+        print(dump_json({"scenarios": scenarios}))
     else:
         print("Available Scenarios:")
         print("-" * 40)
@@ -226,7 +235,7 @@ def cmd_scenario(args):
         sys.exit(1)
 
     if args.format == "json":
-        print(json.dumps({"name": args.name, "content": content}, indent=2))
+        print(dump_json({"name": args.name, "content": content}))
     else:
         print(content)
 
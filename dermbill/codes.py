@@ -6,15 +6,133 @@ wRVU calculations, and optimization notes.
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Optional
-from functools import lru_cache
+from typing import Iterable, Optional
 
 import pandas as pd
 
 from .models import CodeLookupResponse
 
 
+# Workbook sheets loaded into the database
+SHEET_NAMES = ("CPT_Codes", "Modifiers", "Category_Index")
+
+# Low-cardinality CPT_Codes text columns stored as pandas categoricals; string
+# filters on them then run once per distinct value instead of once per row
+CATEGORICAL_CODE_COLUMNS = ("Category", "Subcategory", "Anatomic_Site", "Size_Range", "Add_On_Code")
+
+# wRVU multipliers applied for modifiers when totalling a bill
+MODIFIER_WRVU_MULTIPLIERS = {
+    "50": 1.5,  # Bilateral - typically 1.5x
+}
+
+# Use the Rust-based calamine reader when python-calamine is installed; it
+# parses .xlsx files several times faster than openpyxl
+EXCEL_ENGINE = "calamine" if find_spec("python_calamine") is not None else "openpyxl"
+
+
+# CodeLookupResponse text fields -> (CPT_Codes column, value for missing cells)
+CODE_TEXT_FIELDS = {
+    "category": ("Category", ""),
+    "subcategory": ("Subcategory", None),
+    "description": ("Official_Description", ""),
+    "detailed_explanation": ("Detailed_Explanation", None),
+    "anatomic_site": ("Anatomic_Site", None),
+    "size_range": ("Size_Range", None),
+    "documentation_requirements": ("Documentation_Requirements", None),
+    "optimization_notes": ("Optimization_Notes", None),
+    "global_period": ("Global_Period", None),
+    "related_codes": ("Related_Codes", None),
+    "modifier_notes": ("Modifier_Notes", None),
+}
+
+
+def _str_column(df: pd.DataFrame, column: str, default: Optional[str]) -> list[Optional[str]]:
+    """Get a column as a list of strings, with missing cells (or a missing column) as default."""
+    if column not in df:
+        return [default] * len(df)
+    values = df[column]
+    return [str(v) if present else default for v, present in zip(values.tolist(), values.notna().tolist())]
+
+
+def _build_code_index(df: pd.DataFrame) -> dict[str, CodeLookupResponse]:
+    """
+    Build CodeLookupResponse objects for every CPT_Codes row, keyed by code.
+
+    Columns are converted in one pass each rather than row by row. The first
+    row wins when a code appears more than once.
+    """
+    text_columns = {
+        field: _str_column(df, column, default)
+        for field, (column, default) in CODE_TEXT_FIELDS.items()
+    }
+    wrvus = [float(v) if present else 0.0 for v, present in zip(df["wRVU"].tolist(), df["wRVU"].notna().tolist())]
+    if "Add_On_Code" in df:
+        addons = [str(v).lower() == "yes" for v in df["Add_On_Code"].tolist()]
+    else:
+        addons = [False] * len(df)
+
+    index: dict[str, CodeLookupResponse] = {}
+    for i, code in enumerate(df["Code"].astype(str).tolist()):
+        if code not in index:
+            index[code] = CodeLookupResponse(
+                code=code,
+                wRVU=wrvus[i],
+                is_addon=addons[i],
+                **{field: values[i] for field, values in text_columns.items()},
+            )
+    return index
+
+
+def _build_search_columns(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """
+    Build lowercased copies of the CPT_Codes columns that search_codes filters on.
+
+    Categorical columns stay categorical so filters still run once per
+    distinct value. The keyword filter searches both description columns,
+    which are joined into a single column (with a NUL separator no search
+    term can span).
+    """
+    columns = {}
+    for column in ("Category", "Subcategory", "Anatomic_Site"):
+        values = df[column].str.lower()
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            values = values.astype("category")
+        columns[column] = values
+
+    columns["keyword"] = (
+        df["Official_Description"].fillna("").str.lower()
+        + "\0"
+        + df["Detailed_Explanation"].fillna("").str.lower()
+    )
+    return columns
+
+
+def _modifier_from_row(row: dict) -> dict:
+    """Build a modifier info dict from a Modifiers sheet row."""
+    return {
+        "modifier": str(row["Modifier"]),
+        "name": str(row["Name"]) if pd.notna(row["Name"]) else "",
+        "definition": str(row["Definition"]) if pd.notna(row["Definition"]) else "",
+        "when_to_use": str(row["When_To_Use"]) if pd.notna(row["When_To_Use"]) else "",
+        "when_not_to_use": str(row["When_NOT_To_Use"]) if pd.notna(row["When_NOT_To_Use"]) else "",
+        "derm_examples": str(row["Derm_Examples"]) if pd.notna(row["Derm_Examples"]) else "",
+        "revenue_impact": str(row["Revenue_Impact"]) if pd.notna(row["Revenue_Impact"]) else "",
+        "audit_risk": str(row["Audit_Risk"]) if pd.notna(row["Audit_Risk"]) else "",
+    }
+
+
+def _category_from_row(row) -> dict:
+    """Build a category info dict from a Category_Index sheet row."""
+    return {
+        "category": str(row["Category"]),
+        "description": str(row["Description"]) if pd.notna(row["Description"]) else "",
+        "code_range": str(row["Code_Range"]) if pd.notna(row["Code_Range"]) else "",
+        "key_optimization_points": str(row["Key_Optimization_Points"]) if pd.notna(row["Key_Optimization_Points"]) else "",
+    }
+
+
 class CPTCodeDatabase:
     """Database for CPT/HCPCS code lookups."""
 
@@ -31,53 +149,165 @@ class CPTCodeDatabase:
             excel_path = base_dir / "CPT_Master_Reference.xlsx"
 
         self.excel_path = Path(excel_path)
+        # Pickled copy of the parsed sheets, much faster to load than the .xlsx
+        self.snapshot_path = self.excel_path.with_suffix(".pkl")
         self._codes_df: Optional[pd.DataFrame] = None
         self._modifiers_df: Optional[pd.DataFrame] = None
         self._categories_df: Optional[pd.DataFrame] = None
-        self._loaded = False
+        # Lookup indexes built once at load time
+        self._code_cache: dict[str, CodeLookupResponse] = {}
+        self._modifier_cache: dict[str, dict] = {}
+        self._wrvu_by_code: dict[str, float] = {}
+        self._search_columns: dict[str, pd.Series] = {}
+        self._category_list: list[dict] = []
+        self._category_cache: dict[str, Optional[dict]] = {}
+        # Sheets read so far (from the snapshot or the workbook); each sheet
+        # is only read when something first needs it
+        self._sheets: Optional[dict[str, pd.DataFrame]] = None
+        self._xlsx: Optional[pd.ExcelFile] = None
 
     def load(self) -> None:
         """Load all sheets from the Excel file."""
-        if self._loaded:
+        self._load_codes()
+        self._load_modifiers()
+        self._load_categories()
+
+    def _get_sheet(self, name: str) -> pd.DataFrame:
+        """
+        Get one workbook sheet, reading it on first use.
+
+        All sheets come from the pickled snapshot when it is fresh. Otherwise
+        only the requested sheet is parsed from the workbook, and the snapshot
+        is rewritten once every sheet has been read.
+
+        Args:
+            name: Sheet name from SHEET_NAMES
+
+        Returns:
+            The sheet as a DataFrame
+        """
+        if self._sheets is None:
+            if not self.excel_path.exists():
+                raise FileNotFoundError(f"CPT reference file not found: {self.excel_path}")
+            self._sheets = self._read_snapshot() or {}
+
+        if name not in self._sheets:
+            if self._xlsx is None:
+                self._xlsx = pd.ExcelFile(self.excel_path, engine=EXCEL_ENGINE)
+            df = pd.read_excel(self._xlsx, sheet_name=name)
+            if name == "CPT_Codes":
+                df["Code"] = df["Code"].astype(str)
+            elif name == "Modifiers":
+                df["Modifier"] = df["Modifier"].astype(str)
+            self._sheets[name] = df
+
+            if all(sheet in self._sheets for sheet in SHEET_NAMES):
+                self._xlsx.close()
+                self._xlsx = None
+                self._write_snapshot(self._sheets)
+
+        return self._sheets[name]
+
+    def _load_codes(self) -> None:
+        """Load the CPT_Codes sheet and build the code indexes."""
+        if self._codes_df is not None:
+            return
+
+        df = self._get_sheet("CPT_Codes")
+        for column in CATEGORICAL_CODE_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype("category")
+
+        # Index codes by value; the first row wins on duplicates
+        self._code_cache = _build_code_index(df)
+        self._wrvu_by_code = {code: info.wRVU for code, info in self._code_cache.items()}
+        self._search_columns = _build_search_columns(df)
+        self._codes_df = df
+
+    def _load_modifiers(self) -> None:
+        """Load the Modifiers sheet and build the modifier index."""
+        if self._modifiers_df is not None:
             return
 
-        if not self.excel_path.exists():
-            raise FileNotFoundError(f"CPT reference file not found: {self.excel_path}")
+        df = self._get_sheet("Modifiers")
+        for row in df.to_dict("records"):
+            modifier = str(row["Modifier"])
+            if modifier not in self._modifier_cache:
+                self._modifier_cache[modifier] = _modifier_from_row(row)
+        self._modifiers_df = df
 
-        xlsx = pd.ExcelFile(self.excel_path)
+    def _load_categories(self) -> None:
+        """Load the Category_Index sheet."""
+        if self._categories_df is not None:
+            return
 
-        # Load CPT codes
-        self._codes_df = pd.read_excel(xlsx, sheet_name="CPT_Codes")
-        self._codes_df["Code"] = self._codes_df["Code"].astype(str)
+        df = self._get_sheet("Category_Index")
+        self._category_list = [_category_from_row(row) for row in df.to_dict("records")]
+        self._categories_df = df
 
-        # Load modifiers
-        self._modifiers_df = pd.read_excel(xlsx, sheet_name="Modifiers")
-        self._modifiers_df["Modifier"] = self._modifiers_df["Modifier"].astype(str)
+    def _read_snapshot(self) -> Optional[dict[str, pd.DataFrame]]:
+        """
+        Read the pickled sheet snapshot if it is at least as new as the workbook.
 
-        # Load category index
-        self._categories_df = pd.read_excel(xlsx, sheet_name="Category_Index")
+        Returns:
+            Dict of sheet name to DataFrame, or None if the snapshot can't be used
+        """
+        try:
+            if self.snapshot_path.stat().st_mtime < self.excel_path.stat().st_mtime:
+                return None
+            sheets = pd.read_pickle(self.snapshot_path)
+        except Exception:
+            # Missing, written by an incompatible pandas version, or unreadable
+            return None
 
-        self._loaded = True
+        if not isinstance(sheets, dict) or any(name not in sheets for name in SHEET_NAMES):
+            return None
+        return sheets
+
+    def _write_snapshot(self, sheets: dict[str, pd.DataFrame]) -> None:
+        """Write the parsed sheets next to the workbook for faster future loads."""
+        tmp_path = self.snapshot_path.with_suffix(".pkl.tmp")
+        try:
+            pd.to_pickle(sheets, tmp_path)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            pass  # Read-only deployments just keep parsing the workbook
+
+    def reload(self) -> None:
+        """Drop the loaded sheets and lookup caches and load the workbook again."""
+        self._sheets = None
+        self._codes_df = None
+        self._modifiers_df = None
+        self._categories_df = None
+        self._code_cache = {}
+        self._modifier_cache = {}
+        self._wrvu_by_code = {}
+        self._search_columns = {}
+        self._category_list = []
+        self._category_cache = {}
+        self.load()
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether all the Excel sheets have been loaded."""
+        return all(df is not None for df in (self._codes_df, self._modifiers_df, self._categories_df))
 
     @property
     def codes_df(self) -> pd.DataFrame:
         """Get the codes dataframe, loading if necessary."""
-        if not self._loaded:
-            self.load()
+        self._load_codes()
         return self._codes_df
 
     @property
     def modifiers_df(self) -> pd.DataFrame:
         """Get the modifiers dataframe, loading if necessary."""
-        if not self._loaded:
-            self.load()
+        self._load_modifiers()
         return self._modifiers_df
 
     @property
     def categories_df(self) -> pd.DataFrame:
         """Get the categories dataframe, loading if necessary."""
-        if not self._loaded:
-            self.load()
+        self._load_categories()
         return self._categories_df
 
     def get_code(self, code: str) -> Optional[CodeLookupResponse]:
@@ -90,31 +320,8 @@ class CPTCodeDatabase:
         Returns:
             CodeLookupResponse or None if not found
         """
-        code = str(code).strip()
-        df = self.codes_df
-
-        match = df[df["Code"] == code]
-        if match.empty:
-            return None
-
-        row = match.iloc[0]
-
-        return CodeLookupResponse(
-            code=str(row["Code"]),
-            category=str(row["Category"]) if pd.notna(row["Category"]) else "",
-            subcategory=str(row["Subcategory"]) if pd.notna(row.get("Subcategory")) else None,
-            description=str(row["Official_Description"]) if pd.notna(row["Official_Description"]) else "",
-            detailed_explanation=str(row["Detailed_Explanation"]) if pd.notna(row.get("Detailed_Explanation")) else None,
-            anatomic_site=str(row["Anatomic_Site"]) if pd.notna(row.get("Anatomic_Site")) else None,
-            size_range=str(row["Size_Range"]) if pd.notna(row.get("Size_Range")) else None,
-            documentation_requirements=str(row["Documentation_Requirements"]) if pd.notna(row.get("Documentation_Requirements")) else None,
-            optimization_notes=str(row["Optimization_Notes"]) if pd.notna(row.get("Optimization_Notes")) else None,
-            wRVU=float(row["wRVU"]) if pd.notna(row["wRVU"]) else 0.0,
-            global_period=str(row["Global_Period"]) if pd.notna(row.get("Global_Period")) else None,
-            is_addon=str(row.get("Add_On_Code", "No")).lower() == "yes",
-            related_codes=str(row["Related_Codes"]) if pd.notna(row.get("Related_Codes")) else None,
-            modifier_notes=str(row["Modifier_Notes"]) if pd.notna(row.get("Modifier_Notes")) else None,
-        )
+        self._load_codes()
+        return self._code_cache.get(str(code).strip())
 
     def get_wRVU(self, code: str) -> float:
         """
@@ -126,8 +333,36 @@ class CPTCodeDatabase:
         Returns:
             wRVU value or 0.0 if not found
         """
-        code_info = self.get_code(code)
-        return code_info.wRVU if code_info else 0.0
+        self._load_codes()
+        return self._wrvu_by_code.get(str(code).strip(), 0.0)
+
+    def get_codes(self, codes: Iterable[str]) -> list[Optional[CodeLookupResponse]]:
+        """
+        Look up several codes at once.
+
+        Args:
+            codes: The codes to look up
+
+        Returns:
+            CodeLookupResponse (or None if not found) for each code, in order
+        """
+        self._load_codes()
+        code_cache = self._code_cache
+        return [code_cache.get(str(code).strip()) for code in codes]
+
+    def get_wRVUs(self, codes: Iterable[str]) -> list[float]:
+        """
+        Get the wRVUs for several codes at once.
+
+        Args:
+            codes: The CPT/HCPCS codes
+
+        Returns:
+            wRVU (or 0.0 if not found) for each code, in order
+        """
+        self._load_codes()
+        wrvu_by_code = self._wrvu_by_code
+        return [wrvu_by_code.get(str(code).strip(), 0.0) for code in codes]
 
     def search_codes(
         self,
@@ -152,34 +387,32 @@ class CPTCodeDatabase:
         Returns:
             List of matching codes
         """
-        df = self.codes_df.copy()
+        df = self.codes_df
+        columns = self._search_columns
+
+        # Combine every filter into one mask over the full table; text filters
+        # are literal substring matches against the pre-lowercased columns
+        mask = pd.Series(True, index=df.index)
 
         if category:
-            df = df[df["Category"].str.contains(category, case=False, na=False)]
+            mask &= columns["Category"].str.contains(category.lower(), regex=False, na=False)
 
         if subcategory:
-            df = df[df["Subcategory"].str.contains(subcategory, case=False, na=False)]
+            mask &= columns["Subcategory"].str.contains(subcategory.lower(), regex=False, na=False)
 
         if anatomic_site:
-            df = df[df["Anatomic_Site"].str.contains(anatomic_site, case=False, na=False)]
+            mask &= columns["Anatomic_Site"].str.contains(anatomic_site.lower(), regex=False, na=False)
 
         if keyword:
-            df = df[
-                df["Official_Description"].str.contains(keyword, case=False, na=False) |
-                df["Detailed_Explanation"].str.contains(keyword, case=False, na=False)
-            ]
+            mask &= columns["keyword"].str.contains(keyword.lower(), regex=False, na=False)
 
         if min_wRVU is not None:
-            df = df[df["wRVU"] >= min_wRVU]
+            mask &= df["wRVU"] >= min_wRVU
 
         if max_wRVU is not None:
-            df = df[df["wRVU"] <= max_wRVU]
-
-        results = []
-        for _, row in df.iterrows():
-            results.append(self.get_code(str(row["Code"])))
+            mask &= df["wRVU"] <= max_wRVU
 
-        return [r for r in results if r is not None]
+        return [r for r in self.get_codes(df["Code"][mask]) if r is not None]
 
     def get_codes_by_category(self, category: str) -> list[CodeLookupResponse]:
         """Get all codes in a category."""
@@ -195,34 +428,13 @@ class CPTCodeDatabase:
         Returns:
             Modifier information dict or None
         """
-        modifier = str(modifier).strip().lstrip("-")
-        df = self.modifiers_df
-
-        match = df[df["Modifier"] == modifier]
-        if match.empty:
-            return None
-
-        row = match.iloc[0]
-        return {
-            "modifier": str(row["Modifier"]),
-            "name": str(row["Name"]) if pd.notna(row["Name"]) else "",
-            "definition": str(row["Definition"]) if pd.notna(row["Definition"]) else "",
-            "when_to_use": str(row["When_To_Use"]) if pd.notna(row["When_To_Use"]) else "",
-            "when_not_to_use": str(row["When_NOT_To_Use"]) if pd.notna(row["When_NOT_To_Use"]) else "",
-            "derm_examples": str(row["Derm_Examples"]) if pd.notna(row["Derm_Examples"]) else "",
-            "revenue_impact": str(row["Revenue_Impact"]) if pd.notna(row["Revenue_Impact"]) else "",
-            "audit_risk": str(row["Audit_Risk"]) if pd.notna(row["Audit_Risk"]) else "",
-        }
+        self._load_modifiers()
+        return self._modifier_cache.get(str(modifier).strip().lstrip("-"))
 
     def get_all_modifiers(self) -> list[dict]:
         """Get all modifiers."""
-        self.load()
-        results = []
-        for _, row in self.modifiers_df.iterrows():
-            mod = self.get_modifier(str(row["Modifier"]))
-            if mod:
-                results.append(mod)
-        return results
+        self._load_modifiers()
+        return list(self._modifier_cache.values())
 
     def get_category_info(self, category: str) -> Optional[dict]:
         """
@@ -234,32 +446,20 @@ class CPTCodeDatabase:
         Returns:
             Category info dict or None
         """
-        df = self.categories_df
+        if category in self._category_cache:
+            return self._category_cache[category]
 
-        match = df[df["Category"].str.contains(category, case=False, na=False)]
-        if match.empty:
-            return None
+        self._load_categories()
 
-        row = match.iloc[0]
-        return {
-            "category": str(row["Category"]),
-            "description": str(row["Description"]) if pd.notna(row["Description"]) else "",
-            "code_range": str(row["Code_Range"]) if pd.notna(row["Code_Range"]) else "",
-            "key_optimization_points": str(row["Key_Optimization_Points"]) if pd.notna(row["Key_Optimization_Points"]) else "",
-        }
+        needle = category.lower()
+        info = next((c for c in self._category_list if needle in c["category"].lower()), None)
+        self._category_cache[category] = info
+        return info
 
     def get_all_categories(self) -> list[dict]:
         """Get all categories with their info."""
-        self.load()
-        results = []
-        for _, row in self.categories_df.iterrows():
-            results.append({
-                "category": str(row["Category"]),
-                "description": str(row["Description"]) if pd.notna(row["Description"]) else "",
-                "code_range": str(row["Code_Range"]) if pd.notna(row["Code_Range"]) else "",
-                "key_optimization_points": str(row["Key_Optimization_Points"]) if pd.notna(row["Key_Optimization_Points"]) else "",
-            })
-        return results
+        self._load_categories()
+        return list(self._category_list)
 
     def calculate_total_wRVU(self, codes: list[tuple[str, int, Optional[str]]]) -> float:
         """
@@ -271,13 +471,13 @@ class CPTCodeDatabase:
         Returns:
             Total wRVU
         """
+        base_wRVUs = self.get_wRVUs(code for code, _, _ in codes)
+        multipliers = MODIFIER_WRVU_MULTIPLIERS
+
         total = 0.0
-        for code, units, modifier in codes:
-            base_wRVU = self.get_wRVU(code)
+        for base_wRVU, (_, units, modifier) in zip(base_wRVUs, codes):
             # Apply modifier adjustments
-            if modifier == "50":  # Bilateral - typically 1.5x
-                base_wRVU *= 1.5
-            total += base_wRVU * units
+            total += base_wRVU * multipliers.get(modifier, 1.0) * units
         return round(total, 2)
 
     def is_addon_code(self, code: str) -> bool:
@@ -6,20 +6,28 @@ This is the foundation for all subsequent billing analysis.
 """
 
 import re
+from functools import lru_cache
+from string import Template
 from typing import Optional
 
+try:
+    # Optional linear-time engine for the multi-pattern entity scans
+    import re2 as _fused_re
+except ImportError:
+    _fused_re = re
+
 from .models import ExtractedEntities, ExtractedEntity
 
 
 # Prompt template for entity extraction
-ENTITY_EXTRACTION_PROMPT = """You are a medical billing expert analyzing a dermatology clinical note.
+ENTITY_EXTRACTION_PROMPT = Template("""You are a medical billing expert analyzing a dermatology clinical note.
 Extract all relevant billing entities from the following note.
 
 Return a JSON object with these fields:
 - diagnoses: list of conditions/diagnoses mentioned (strings)
 - procedures: list of procedures performed (strings, include technique details)
 - anatomic_sites: list of body locations mentioned (strings)
-- measurements: list of objects with {{type, value, unit, context}} for any sizes, counts, or lengths
+- measurements: list of objects with {type, value, unit, context} for any sizes, counts, or lengths
 - medications: list of medications prescribed or administered (strings)
 - time_documentation: string with any time documentation found, or null
 
@@ -33,10 +41,235 @@ Be thorough - identify ALL:
 
 Clinical Note:
 ---
-{note_text}
+$note_text
 ---
 
-Respond with only valid JSON, no markdown formatting."""
+Respond with only valid JSON, no markdown formatting.""")
+
+
+def _size(groups: tuple) -> dict:
+    return {"type": "size", "value": float(groups[0]), "unit": groups[1]}
+
+
+def _dimensions(groups: tuple) -> dict:
+    return {"type": "dimensions", "value": f"{groups[0]} x {groups[1]}", "unit": groups[2]}
+
+
+def _margin(groups: tuple) -> dict:
+    return {"type": "margin", "value": float(groups[0]), "unit": groups[1]}
+
+
+def _area(groups: tuple) -> dict:
+    return {"type": "area", "value": float(groups[0]), "unit": "sq cm"}
+
+
+# Size patterns: X mm, X cm, X x Y mm, etc. Tried in this order at each
+# position, so "2 x 3 cm" is one dimensions match rather than also a 3 cm
+# size, and "4 mm margin" is a margin rather than also a size.
+SIZE_EXTRACTORS = {
+    "dimensions": _dimensions,
+    "margin": _margin,
+    "area": _area,
+    "size": _size,
+}
+
+SIZE_PATTERN = re.compile(
+    # X x Y cm (dimensions)
+    r'(?P<dimensions>(\d+\.?\d*)\s*[xX×]\s*(\d+\.?\d*)\s*(cm|mm))'
+    # X mm margins
+    r'|(?P<margin>(\d+\.?\d*)\s*(mm|cm)\s*margin)'
+    # sq cm (square centimeters)
+    r'|(?P<area>(\d+\.?\d*)\s*(sq\.?\s*cm|cm2|cm²))'
+    # X.X cm or X cm
+    r'|(?P<size>(\d+\.?\d*)\s*(cm|mm)\s*(?:lesion|mass|nodule|plaque|defect)?)',
+    re.IGNORECASE,
+)
+
+# Count patterns: X lesions, X AKs, etc. as (pattern, type, unit)
+COUNT_PATTERNS = [
+    (re.compile(r'(\d+)\s*(?:actinic keratoses|aks?|actinic lesions)', re.IGNORECASE), "ak_count", "lesions"),
+    (re.compile(r'(\d+)\s*(?:warts?|verruca)', re.IGNORECASE), "wart_count", "lesions"),
+    (re.compile(r'(\d+)\s*(?:lesions?|spots?|moles?|nevi)', re.IGNORECASE), "lesion_count", "lesions"),
+    (re.compile(r'(\d+)\s*(?:nails?)', re.IGNORECASE), "nail_count", "nails"),
+    (re.compile(r'(\d+)\s*(?:biops(?:y|ies))', re.IGNORECASE), "biopsy_count", "biopsies"),
+    (re.compile(r'(\d+)\s*(?:blocks?)', re.IGNORECASE), "block_count", "blocks"),
+    (re.compile(r'(\d+)\s*(?:stages?)', re.IGNORECASE), "stage_count", "stages"),
+]
+
+
+def _compile_groups(groups: dict[str, str]) -> re.Pattern:
+    """
+    Fuse named pattern bodies into one case-insensitive alternation.
+
+    Uses RE2 (google-re2) when installed, which matches in linear time with
+    the same leftmost-first semantics; otherwise falls back to re.
+    """
+    alternation = "|".join(f"(?P<{name}>{body})" for name, body in groups.items())
+    return _fused_re.compile(f"(?i){alternation}")
+
+
+# Pattern families for list entities, per entity type, in output order
+
+# Common dermatology anatomic sites
+SITE_GROUPS = {
+    "head": (
+        r'\b(scalp|forehead|temple|face|cheek|chin|nose|nasal|ear|auricular|'
+        r'periorbital|eyelid|lip|perioral|neck)\b'
+    ),
+    "trunk": (
+        r'\b(chest|back|trunk|abdomen|flank|shoulder|axilla|axillary|'
+        r'breast|umbilical|gluteal|buttock)\b'
+    ),
+    "extremity": (
+        r'\b(arm|forearm|upper arm|elbow|wrist|hand|palm|finger|'
+        r'leg|thigh|knee|shin|calf|ankle|foot|toe|heel|sole)\b'
+    ),
+    "specific": (
+        r'\b(dorsal hand|dorsal foot|plantar|palmar|interdigital|'
+        r'nail|subungual|periungual)\b'
+    ),
+    "directional": (
+        r'\b(left|right|bilateral|anterior|posterior|medial|lateral)\s+'
+        r'(scalp|forehead|temple|face|cheek|chin|nose|ear|neck|'
+        r'chest|back|trunk|arm|forearm|hand|leg|thigh|foot)\b'
+    ),
+}
+
+PROCEDURE_GROUPS = {
+    "biopsy": (
+        r'\b(shave biops[yies]+|punch biops[yies]+|incisional biops[yies]+|'
+        r'excisional biops[yies]+|skin biops[yies]+)\b'
+    ),
+    "destruction": (
+        r'\b(cryotherapy|cryosurgery|liquid nitrogen|LN2|'
+        r'electrodesiccation|curettage|ED&C|'
+        r'destroyed?|destruction)\b'
+    ),
+    "excision": (
+        r'\b(excision|excised|wide local excision|WLE|'
+        r're-?excision|shave removal)\b'
+    ),
+    "repair": (
+        r'\b(simple repair|intermediate repair|complex repair|'
+        r'layered closure|primary closure|sutured?)\b'
+    ),
+    "flap_graft": (
+        r'\b(advancement flap|rotation flap|transposition flap|'
+        r'rhombic flap|bilobed flap|'
+        r'FTSG|STSG|full thickness skin graft|split thickness skin graft)\b'
+    ),
+    "mohs": r'\b(Mohs|micrographic surgery)\b',
+    "injection": r'\b(intralesional|IL injection|injected|triamcinolone|Kenalog|TAC)\b',
+    "other": (
+        r'\b(debridement|I&D|incision and drainage|'
+        r'chemical peel|phototherapy|UVB|PUVA|'
+        r'patch test|nail (?:removal|avulsion|debridement))\b'
+    ),
+}
+
+DIAGNOSIS_GROUPS = {
+    "inflammatory": (
+        r'\b(psoriasis|plaque psoriasis|guttate psoriasis|'
+        r'eczema|atopic dermatitis|contact dermatitis|'
+        r'seborrheic dermatitis|rosacea|acne|acne vulgaris)\b'
+    ),
+    "infection": (
+        r'\b(onychomycosis|tinea|cellulitis|folliculitis|'
+        r'herpes|warts?|verruca|molluscum)\b'
+    ),
+    "neoplasm": (
+        r'\b(melanoma|BCC|basal cell carcinoma|SCC|squamous cell carcinoma|'
+        r'actinic keratosis|AK|seborrheic keratosis|SK|'
+        r'dysplastic nev[ius]+|atypical nev[ius]+|'
+        r'lipoma|cyst|epidermal cyst|pilar cyst)\b'
+    ),
+    "other": (
+        r'\b(alopecia|vitiligo|hidradenitis|HS|pruritus|'
+        r'urticaria|lichen planus|morphea)\b'
+    ),
+}
+
+MEDICATION_GROUPS = {
+    "topical_steroid": (
+        r'\b(triamcinolone|clobetasol|betamethasone|hydrocortisone|'
+        r'fluocinonide|mometasone|desonide)\b'
+    ),
+    "topical": (
+        r'\b(tacrolimus|pimecrolimus|calcipotriene|'
+        r'tretinoin|adapalene|benzoyl peroxide|'
+        r'metronidazole|ivermectin|azelaic acid)\b'
+    ),
+    "oral": (
+        r'\b(doxycycline|minocycline|isotretinoin|accutane|'
+        r'methotrexate|acitretin|prednisone|'
+        r'hydroxychloroquine|mycophenolate)\b'
+    ),
+    "biologic": (
+        r'\b(Humira|adalimumab|Enbrel|etanercept|'
+        r'Stelara|ustekinumab|Cosentyx|secukinumab|'
+        r'Dupixent|dupilumab|Skyrizi|risankizumab)\b'
+    ),
+    "injectable": (
+        r'\b(Kenalog|triamcinolone acetonide|TAC|'
+        r'5-FU|fluorouracil|bleomycin)\b'
+    ),
+}
+
+ENTITY_GROUPS = {
+    "site": SITE_GROUPS,
+    "procedure": PROCEDURE_GROUPS,
+    "diagnosis": DIAGNOSIS_GROUPS,
+    "medication": MEDICATION_GROUPS,
+}
+
+# All families are scanned together in as few passes as possible. Families
+# whose matches can overlap go in a later pass so that no match hides
+# another: "hand" vs "dorsal hand"/"left hand", "nail" vs "nail removal",
+# and "triamcinolone"/"Kenalog"/"TAC" as both procedures and medications.
+_LATER_PASSES = [
+    {("site", "specific"), ("site", "directional"), ("procedure", "injection")},
+    {("medication", "injectable")},
+]
+
+
+def _build_entity_passes() -> list[re.Pattern]:
+    """Compile ENTITY_GROUPS into scan passes with groups named <type>_<family>."""
+    pass_index = {key: i + 1 for i, families in enumerate(_LATER_PASSES) for key in families}
+    passes: list[dict[str, str]] = [{} for _ in range(len(_LATER_PASSES) + 1)]
+    for entity_type, groups in ENTITY_GROUPS.items():
+        for family, body in groups.items():
+            passes[pass_index.get((entity_type, family), 0)][f"{entity_type}_{family}"] = body
+    return [_compile_groups(groups) for groups in passes]
+
+
+ENTITY_PATTERNS = _build_entity_passes()
+
+# Time documentation, in order of preference: total time beats time spent,
+# which beats counseling time, wherever each appears in the note
+TIME_PATTERNS = [
+    r'total (?:visit |encounter )?time[:\s]+(\d+)\s*(?:minutes?|mins?)',
+    r'(\d+)\s*(?:minutes?|mins?)\s*(?:spent|total)',
+    r'time spent[:\s]+(\d+)\s*(?:minutes?|mins?)',
+    r'counseling[:\s]+(\d+)\s*(?:minutes?|mins?)',
+]
+
+# All time patterns as zero-width lookaheads, so a single scan reports every
+# position where one starts without any match hiding another; group t<N>
+# holds the text matched by TIME_PATTERNS[N]
+TIME_PATTERN = re.compile(
+    "(?=" + "|".join(f"(?P<t{rank}>{body})" for rank, body in enumerate(TIME_PATTERNS)) + ")",
+    re.IGNORECASE,
+)
+
+
+# Characters of surrounding note text kept as a measurement's context
+MEASUREMENT_CONTEXT_CHARS = 20
+
+
+def _match_context(text: str, match: re.Match) -> str:
+    """Get the note text around a match, for measurement context."""
+    start, end = match.span()
+    return text[max(0, start - MEASUREMENT_CONTEXT_CHARS):end + MEASUREMENT_CONTEXT_CHARS]
 
 
 def parse_measurements_from_text(text: str) -> list[dict]:
@@ -53,113 +286,84 @@ def parse_measurements_from_text(text: str) -> list[dict]:
     """
     measurements = []
 
-    # Size patterns: X mm, X cm, X x Y mm, etc.
-    size_patterns = [
-        # X.X cm or X cm
-        (r'(\d+\.?\d*)\s*(cm|mm)\s*(?:lesion|mass|nodule|plaque|defect)?',
-         lambda m: {"type": "size", "value": float(m.group(1)), "unit": m.group(2)}),
-
-        # X x Y cm (dimensions)
-        (r'(\d+\.?\d*)\s*[xX×]\s*(\d+\.?\d*)\s*(cm|mm)',
-         lambda m: {"type": "dimensions", "value": f"{m.group(1)} x {m.group(2)}", "unit": m.group(3)}),
-
-        # X mm margins
-        (r'(\d+\.?\d*)\s*(mm|cm)\s*margin',
-         lambda m: {"type": "margin", "value": float(m.group(1)), "unit": m.group(2)}),
-
-        # sq cm (square centimeters)
-        (r'(\d+\.?\d*)\s*(sq\.?\s*cm|cm2|cm²)',
-         lambda m: {"type": "area", "value": float(m.group(1)), "unit": "sq cm"}),
-    ]
-
-    for pattern, extractor in size_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            try:
-                measurement = extractor(match)
-                measurement["context"] = text[max(0, match.start()-20):match.end()+20]
-                measurements.append(measurement)
-            except (ValueError, IndexError):
-                continue
-
-    # Count patterns: X lesions, X AKs, etc.
-    count_patterns = [
-        (r'(\d+)\s*(?:actinic keratoses|aks?|actinic lesions)',
-         lambda m: {"type": "ak_count", "value": int(m.group(1)), "unit": "lesions"}),
-
-        (r'(\d+)\s*(?:warts?|verruca)',
-         lambda m: {"type": "wart_count", "value": int(m.group(1)), "unit": "lesions"}),
-
-        (r'(\d+)\s*(?:lesions?|spots?|moles?|nevi)',
-         lambda m: {"type": "lesion_count", "value": int(m.group(1)), "unit": "lesions"}),
-
-        (r'(\d+)\s*(?:nails?)',
-         lambda m: {"type": "nail_count", "value": int(m.group(1)), "unit": "nails"}),
-
-        (r'(\d+)\s*(?:biops(?:y|ies))',
-         lambda m: {"type": "biopsy_count", "value": int(m.group(1)), "unit": "biopsies"}),
-
-        (r'(\d+)\s*(?:blocks?)',
-         lambda m: {"type": "block_count", "value": int(m.group(1)), "unit": "blocks"}),
-
-        (r'(\d+)\s*(?:stages?)',
-         lambda m: {"type": "stage_count", "value": int(m.group(1)), "unit": "stages"}),
-    ]
-
-    for pattern, extractor in count_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            try:
-                measurement = extractor(match)
-                measurement["context"] = text[max(0, match.start()-20):match.end()+20]
-                measurements.append(measurement)
-            except (ValueError, IndexError):
-                continue
+    for match in SIZE_PATTERN.finditer(text):
+        kind = match.lastgroup
+        # The family's own groups follow its named group
+        groups = match.groups()[SIZE_PATTERN.groupindex[kind]:]
+        try:
+            measurement = SIZE_EXTRACTORS[kind](groups)
+            measurement["context"] = _match_context(text, match)
+            measurements.append(measurement)
+        except (ValueError, IndexError):
+            continue
+
+    for pattern, count_type, unit in COUNT_PATTERNS:
+        for match in pattern.finditer(text):
+            measurements.append({
+                "type": count_type,
+                "value": int(match.group(1)),
+                "unit": unit,
+                "context": _match_context(text, match),
+            })
 
     return measurements
 
 
-def parse_anatomic_sites_from_text(text: str) -> list[str]:
+def _scan_entities(text: str) -> dict[str, list[str]]:
     """
-    Extract anatomic sites from text using pattern matching.
+    Find sites, procedures, diagnoses and medications in one set of scan passes.
+
+    Matches are ordered by pattern family, then by position in the text, and
+    deduplicated case-insensitively keeping the first spelling seen. Sites
+    are lowercased.
 
     Args:
         text: Clinical note text
 
     Returns:
-        List of anatomic sites found
+        Dict of entity type to unique matches
     """
-    sites = []
-
-    # Common dermatology anatomic sites
-    site_patterns = [
-        # Head/Face
-        r'\b(scalp|forehead|temple|face|cheek|chin|nose|nasal|ear|auricular|'
-        r'periorbital|eyelid|lip|perioral|neck)\b',
+    by_group: dict[str, list[str]] = {
+        f"{entity_type}_{family}": []
+        for entity_type, groups in ENTITY_GROUPS.items()
+        for family in groups
+    }
+    for pattern in ENTITY_PATTERNS:
+        for match in pattern.finditer(text):
+            by_group[match.lastgroup].append(match.group(0).strip())
+
+    found: dict[str, list[str]] = {}
+    for entity_type, groups in ENTITY_GROUPS.items():
+        items = [item for family in groups for item in by_group[f"{entity_type}_{family}"]]
+        if entity_type == "site":
+            items = [item.lower() for item in items]
+        found[entity_type] = _unique_lower(items)
+    return found
+
+
+def _unique_lower(items: list[str]) -> list[str]:
+    """Deduplicate strings case-insensitively, keeping the first spelling seen."""
+    seen = set()
+    result = []
+    for item in items:
+        key = item.lower()
+        if key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
 
-        # Trunk
-        r'\b(chest|back|trunk|abdomen|flank|shoulder|axilla|axillary|'
-        r'breast|umbilical|gluteal|buttock)\b',
-
-        # Extremities
-        r'\b(arm|forearm|upper arm|elbow|wrist|hand|palm|finger|'
-        r'leg|thigh|knee|shin|calf|ankle|foot|toe|heel|sole)\b',
 
-        # Specific
-        r'\b(dorsal hand|dorsal foot|plantar|palmar|interdigital|'
-        r'nail|subungual|periungual)\b',
-
-        # Directional
-        r'\b(left|right|bilateral|anterior|posterior|medial|lateral)\s+'
-        r'(scalp|forehead|temple|face|cheek|chin|nose|ear|neck|'
-        r'chest|back|trunk|arm|forearm|hand|leg|thigh|foot)\b',
-    ]
+def parse_anatomic_sites_from_text(text: str) -> list[str]:
+    """
+    Extract anatomic sites from text using pattern matching.
 
-    for pattern in site_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            site = match.group(0).strip().lower()
-            if site not in sites:
-                sites.append(site)
+    Args:
+        text: Clinical note text
 
-    return sites
+    Returns:
+        List of anatomic sites found
+    """
+    return _scan_entities(text)["site"]
 
 
 def parse_procedures_from_text(text: str) -> list[str]:
@@ -172,50 +376,7 @@ def parse_procedures_from_text(text: str) -> list[str]:
     Returns:
         List of procedures found
     """
-    procedures = []
-
-    procedure_patterns = [
-        # Biopsies
-        r'\b(shave biops[yies]+|punch biops[yies]+|incisional biops[yies]+|'
-        r'excisional biops[yies]+|skin biops[yies]+)\b',
-
-        # Destructions
-        r'\b(cryotherapy|cryosurgery|liquid nitrogen|LN2|'
-        r'electrodesiccation|curettage|ED&C|'
-        r'destroyed?|destruction)\b',
-
-        # Excisions
-        r'\b(excision|excised|wide local excision|WLE|'
-        r're-?excision|shave removal)\b',
-
-        # Repairs
-        r'\b(simple repair|intermediate repair|complex repair|'
-        r'layered closure|primary closure|sutured?)\b',
-
-        # Flaps/Grafts
-        r'\b(advancement flap|rotation flap|transposition flap|'
-        r'rhombic flap|bilobed flap|'
-        r'FTSG|STSG|full thickness skin graft|split thickness skin graft)\b',
-
-        # Mohs
-        r'\b(Mohs|micrographic surgery)\b',
-
-        # Injections
-        r'\b(intralesional|IL injection|injected|triamcinolone|Kenalog|TAC)\b',
-
-        # Other
-        r'\b(debridement|I&D|incision and drainage|'
-        r'chemical peel|phototherapy|UVB|PUVA|'
-        r'patch test|nail (?:removal|avulsion|debridement))\b',
-    ]
-
-    for pattern in procedure_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            proc = match.group(0).strip()
-            if proc.lower() not in [p.lower() for p in procedures]:
-                procedures.append(proc)
-
-    return procedures
+    return _scan_entities(text)["procedure"]
 
 
 def parse_diagnoses_from_text(text: str) -> list[str]:
@@ -228,36 +389,7 @@ def parse_diagnoses_from_text(text: str) -> list[str]:
     Returns:
         List of diagnoses found
     """
-    diagnoses = []
-
-    diagnosis_patterns = [
-        # Inflammatory conditions
-        r'\b(psoriasis|plaque psoriasis|guttate psoriasis|'
-        r'eczema|atopic dermatitis|contact dermatitis|'
-        r'seborrheic dermatitis|rosacea|acne|acne vulgaris)\b',
-
-        # Infections
-        r'\b(onychomycosis|tinea|cellulitis|folliculitis|'
-        r'herpes|warts?|verruca|molluscum)\b',
-
-        # Neoplasms
-        r'\b(melanoma|BCC|basal cell carcinoma|SCC|squamous cell carcinoma|'
-        r'actinic keratosis|AK|seborrheic keratosis|SK|'
-        r'dysplastic nev[ius]+|atypical nev[ius]+|'
-        r'lipoma|cyst|epidermal cyst|pilar cyst)\b',
-
-        # Other
-        r'\b(alopecia|vitiligo|hidradenitis|HS|pruritus|'
-        r'urticaria|lichen planus|morphea)\b',
-    ]
-
-    for pattern in diagnosis_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            dx = match.group(0).strip()
-            if dx.lower() not in [d.lower() for d in diagnoses]:
-                diagnoses.append(dx)
-
-    return diagnoses
+    return _scan_entities(text)["diagnosis"]
 
 
 def parse_medications_from_text(text: str) -> list[str]:
@@ -270,40 +402,7 @@ def parse_medications_from_text(text: str) -> list[str]:
     Returns:
         List of medications found
     """
-    medications = []
-
-    medication_patterns = [
-        # Topical steroids
-        r'\b(triamcinolone|clobetasol|betamethasone|hydrocortisone|'
-        r'fluocinonide|mometasone|desonide)\b',
-
-        # Topical non-steroids
-        r'\b(tacrolimus|pimecrolimus|calcipotriene|'
-        r'tretinoin|adapalene|benzoyl peroxide|'
-        r'metronidazole|ivermectin|azelaic acid)\b',
-
-        # Oral medications
-        r'\b(doxycycline|minocycline|isotretinoin|accutane|'
-        r'methotrexate|acitretin|prednisone|'
-        r'hydroxychloroquine|mycophenolate)\b',
-
-        # Biologics
-        r'\b(Humira|adalimumab|Enbrel|etanercept|'
-        r'Stelara|ustekinumab|Cosentyx|secukinumab|'
-        r'Dupixent|dupilumab|Skyrizi|risankizumab)\b',
-
-        # Injectables
-        r'\b(Kenalog|triamcinolone acetonide|TAC|'
-        r'5-FU|fluorouracil|bleomycin)\b',
-    ]
-
-    for pattern in medication_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            med = match.group(0).strip()
-            if med.lower() not in [m.lower() for m in medications]:
-                medications.append(med)
-
-    return medications
+    return _scan_entities(text)["medication"]
 
 
 def extract_time_documentation(text: str) -> Optional[str]:
@@ -316,37 +415,38 @@ def extract_time_documentation(text: str) -> Optional[str]:
     Returns:
         Time documentation string or None
     """
-    time_patterns = [
-        r'total (?:visit |encounter )?time[:\s]+(\d+)\s*(?:minutes?|mins?)',
-        r'(\d+)\s*(?:minutes?|mins?)\s*(?:spent|total)',
-        r'time spent[:\s]+(\d+)\s*(?:minutes?|mins?)',
-        r'counseling[:\s]+(\d+)\s*(?:minutes?|mins?)',
-    ]
+    best_rank = len(TIME_PATTERNS)
+    best = None
+    for match in TIME_PATTERN.finditer(text):
+        rank = int(match.lastgroup[1:])
+        if rank < best_rank:
+            best_rank, best = rank, match.group(match.lastgroup)
+            if rank == 0:
+                break
 
-    for pattern in time_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return match.group(0)
-
-    return None
+    return best
 
 
+@lru_cache(maxsize=32)
 def extract_entities_regex(note_text: str) -> ExtractedEntities:
     """
     Extract entities using regex patterns (fallback/supplement to LLM).
 
+    Results are cached per note text, so callers must not mutate them.
+
     Args:
         note_text: Clinical note text
 
     Returns:
         ExtractedEntities object
     """
+    found = _scan_entities(note_text)
     return ExtractedEntities(
-        diagnoses=parse_diagnoses_from_text(note_text),
-        procedures=parse_procedures_from_text(note_text),
-        anatomic_sites=parse_anatomic_sites_from_text(note_text),
+        diagnoses=found["diagnosis"],
+        procedures=found["procedure"],
+        anatomic_sites=found["site"],
         measurements=parse_measurements_from_text(note_text),
-        medications=parse_medications_from_text(note_text),
+        medications=found["medication"],
         time_documentation=extract_time_documentation(note_text),
         raw_entities=[],
     )
@@ -364,21 +464,12 @@ def merge_entities(llm_entities: ExtractedEntities, regex_entities: ExtractedEnt
         Merged ExtractedEntities object
     """
     # Combine and deduplicate
-    def unique_lower(items: list[str]) -> list[str]:
-        seen = set()
-        result = []
-        for item in items:
-            if item.lower() not in seen:
-                seen.add(item.lower())
-                result.append(item)
-        return result
-
     return ExtractedEntities(
-        diagnoses=unique_lower(llm_entities.diagnoses + regex_entities.diagnoses),
-        procedures=unique_lower(llm_entities.procedures + regex_entities.procedures),
-        anatomic_sites=unique_lower(llm_entities.anatomic_sites + regex_entities.anatomic_sites),
+        diagnoses=_unique_lower(llm_entities.diagnoses + regex_entities.diagnoses),
+        procedures=_unique_lower(llm_entities.procedures + regex_entities.procedures),
+        anatomic_sites=_unique_lower(llm_entities.anatomic_sites + regex_entities.anatomic_sites),
         measurements=llm_entities.measurements + regex_entities.measurements,  # Keep all measurements
-        medications=unique_lower(llm_entities.medications + regex_entities.medications),
+        medications=_unique_lower(llm_entities.medications + regex_entities.medications),
         time_documentation=llm_entities.time_documentation or regex_entities.time_documentation,
         raw_entities=llm_entities.raw_entities,
     )
@@ -394,4 +485,4 @@ def get_extraction_prompt(note_text: str) -> str:
     Returns:
         Formatted prompt string
     """
-    return ENTITY_EXTRACTION_PROMPT.format(note_text=note_text)
+    return ENTITY_EXTRACTION_PROMPT.substitute(note_text=note_text)
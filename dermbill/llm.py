@@ -9,12 +9,24 @@ Handles all interactions with the Anthropic Claude API for:
 """
 
 import os
+import re
 import json
+import time
 import asyncio
-from typing import Optional
+import hashlib
+import sqlite3
+import weakref
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from importlib.util import find_spec
+from typing import Any, AsyncIterator, Callable, Optional
 from pathlib import Path
+from string import Template
 
-from anthropic import Anthropic, AsyncAnthropic
+import orjson
+from pydantic import TypeAdapter
 
 from .models import (
     ExtractedEntities,
@@ -24,211 +36,62 @@ from .models import (
     DocumentationEnhancement,
     FutureOpportunities,
     FutureOpportunity,
-    PotentialCode,
 )
 from .entities import get_extraction_prompt, extract_entities_regex, merge_entities
 
 
-class LLMClient:
-    """Client for LLM-powered billing analysis."""
-
-    def __init__(
-        self,
-        api_key: Optional[str] = None,
-        model: Optional[str] = None,
-    ):
-        """
-        Initialize the LLM client.
-
-        Args:
-            api_key: Anthropic API key. If None, uses ANTHROPIC_API_KEY env var.
-            model: Model to use. If None, uses ANTHROPIC_MODEL env var or default.
-        """
-        self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            raise ValueError("ANTHROPIC_API_KEY not set")
-
-        self.model = model or os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
-        self.client = Anthropic(api_key=self.api_key, timeout=120.0)
-        self.async_client = AsyncAnthropic(api_key=self.api_key, timeout=120.0)
-
-    def _call_llm(
-        self,
-        prompt: str,
-        system: Optional[str] = None,
-        max_tokens: int = 4096,
-        temperature: float = 0.0,
-    ) -> str:
-        """
-        Make a call to the LLM.
-
-        Args:
-            prompt: User prompt
-            system: System prompt
-            max_tokens: Maximum tokens in response
-            temperature: Temperature for sampling
-
-        Returns:
-            LLM response text
-        """
-        messages = [{"role": "user", "content": prompt}]
-
-        kwargs = {
-            "model": self.model,
-            "max_tokens": max_tokens,
-            "messages": messages,
-            "temperature": temperature,
-        }
-
-        if system:
-            kwargs["system"] = system
-
-        response = self.client.messages.create(**kwargs)
-        return response.content[0].text
-
-    async def _call_llm_async(
-        self,
-        prompt: str,
-        system: Optional[str] = None,
-        max_tokens: int = 4096,
-        temperature: float = 0.0,
-    ) -> str:
-        """Async version of _call_llm."""
-        messages = [{"role": "user", "content": prompt}]
-
-        kwargs = {
-            "model": self.model,
-            "max_tokens": max_tokens,
-            "messages": messages,
-            "temperature": temperature,
-        }
-
-        if system:
-            kwargs["system"] = system
-
-        response = await self.async_client.messages.create(**kwargs)
-        return response.content[0].text
-
-    def _parse_json_response(self, response: str) -> dict:
-        """
-        Parse JSON from LLM response, handling markdown code blocks.
-
-        Args:
-            response: LLM response text
-
-        Returns:
-            Parsed JSON dict
-        """
-        original_response = response
+ENTITY_EXTRACTION_SYSTEM = """You are a medical billing expert specializing in dermatology.
+Your task is to extract all relevant billing entities from clinical notes.
+Always respond with valid JSON only, no markdown formatting or explanation."""
 
-        # Try to extract JSON from markdown code blocks
-        try:
-            if "```json" in response:
-                start = response.index("```json") + 7
-                end = response.index("```", start)
-                response = response[start:end].strip()
-            elif "```" in response:
-                start = response.index("```") + 3
-                end = response.index("```", start)
-                response = response[start:end].strip()
-        except ValueError:
-            # No closing ``` found, try to parse the whole response
-            pass
 
-        try:
-            return json.loads(response)
-        except json.JSONDecodeError as e:
-            # Try to find any JSON object in the response
-            import re
-            json_match = re.search(r'\{[\s\S]*\}', original_response)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except json.JSONDecodeError:
-                    pass
-            raise ValueError(f"Failed to parse JSON from LLM response: {e}. Response: {original_response[:500]}")
 
-    def extract_entities(self, note_text: str) -> ExtractedEntities:
-        """
-        Extract entities from a clinical note.
+def _entity_tool() -> dict:
+    """Tool whose input schema is ExtractedEntities, minus the regex-only raw_entities."""
+    schema = ExtractedEntities.model_json_schema()
+    schema.pop("$defs", None)
+    schema["properties"].pop("raw_entities")
+    return {
+        "name": "emit_entities",
+        "description": "Record the billing entities extracted from the clinical note.",
+        "input_schema": schema,
+    }
 
-        Args:
-            note_text: Clinical note text
 
-        Returns:
-            ExtractedEntities object
-        """
-        prompt = get_extraction_prompt(note_text)
+# Forcing this tool makes entity extraction return schema-shaped JSON
+ENTITY_TOOL = _entity_tool()
 
-        system = """You are a medical billing expert specializing in dermatology.
-Your task is to extract all relevant billing entities from clinical notes.
-Always respond with valid JSON only, no markdown formatting or explanation."""
+# Ceiling for the entity tool call, whose input is usually a few hundred tokens;
+# the adaptive output limit brings requests down toward MIN_ADAPTIVE_MAX_TOKENS
+ENTITY_MAX_TOKENS = 2048
 
-        try:
-            response = self._call_llm(prompt, system=system)
-            data = self._parse_json_response(response)
-
-            # Ensure measurements is a list of dicts
-            measurements = data.get("measurements", [])
-            if isinstance(measurements, dict):
-                measurements = [measurements]
-            elif not isinstance(measurements, list):
-                measurements = []
-            # Ensure each measurement is a dict
-            measurements = [m if isinstance(m, dict) else {} for m in measurements]
-
-            llm_entities = ExtractedEntities(
-                diagnoses=data.get("diagnoses", []) or [],
-                procedures=data.get("procedures", []) or [],
-                anatomic_sites=data.get("anatomic_sites", []) or [],
-                measurements=measurements,
-                medications=data.get("medications", []) or [],
-                time_documentation=data.get("time_documentation"),
-                raw_entities=[],
-            )
-        except Exception:
-            # Fallback to regex-only extraction
-            llm_entities = ExtractedEntities(
-                diagnoses=[],
-                procedures=[],
-                anatomic_sites=[],
-                measurements=[],
-                medications=[],
-                time_documentation=None,
-                raw_entities=[],
-            )
+# Deterministic (temperature 0) responses kept in memory per client, most recent last
+RESPONSE_CACHE_SIZE = 256
+# On-disk responses older than this are ignored and overwritten
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
 
-        # Supplement with regex extraction
-        regex_entities = extract_entities_regex(note_text)
-        return merge_entities(llm_entities, regex_entities)
+# Per-call-site output limits follow an exponential moving average of the
+# output tokens actually used, with headroom, between this floor and the ceiling
+OUTPUT_TOKENS_EMA_WEIGHT = 0.2
+OUTPUT_TOKENS_HEADROOM = 1.5
+MIN_ADAPTIVE_MAX_TOKENS = 1024
+# Stop once the model closes its JSON code block rather than adding commentary
+JSON_STOP_SEQUENCES = ["```\n\n"]
 
-    def analyze_current_billing(
-        self,
-        note_text: str,
-        entities: ExtractedEntities,
-        corpus_context: str,
-    ) -> CurrentBilling:
-        """
-        Analyze what can be billed from the note as written.
+CURRENT_BILLING_SYSTEM = """You are a dermatology medical billing expert.
+Analyze clinical notes to identify all legitimately billable codes.
+Be thorough but only include codes that are supportable by the documentation.
+Apply proper modifier logic and NCCI edit rules.
+Respond with valid JSON only."""
 
-        Args:
-            note_text: Original clinical note
-            entities: Extracted entities
-            corpus_context: Relevant corpus content (codes, rules)
 
-        Returns:
-            CurrentBilling object
-        """
-        prompt = f"""Analyze this dermatology clinical note and determine all billable codes.
+CURRENT_BILLING_PROMPT = Template("""Analyze this dermatology clinical note and determine all billable codes.
 
 CLINICAL NOTE:
-{note_text}
+$note
 
 EXTRACTED ENTITIES:
-{json.dumps(entities.model_dump(), indent=2)}
-
-REFERENCE INFORMATION:
-{corpus_context}
+$entities
 
 For each billable service, provide:
 1. CPT/HCPCS code
@@ -240,79 +103,59 @@ For each billable service, provide:
 Also identify any documentation gaps that prevent billing.
 
 Respond with JSON in this format:
-{{
+{
     "codes": [
-        {{"code": "99214", "modifier": "-25", "description": "...", "wRVU": 1.92, "units": 1, "status": "supported", "documentation_note": null}},
+        {"code": "99214", "modifier": "-25", "description": "...", "wRVU": 1.92, "units": 1, "status": "supported", "documentation_note": null},
         ...
     ],
     "total_wRVU": 3.45,
     "documentation_gaps": ["Gap 1", "Gap 2"]
-}}"""
+}""")
 
-        system = """You are a dermatology medical billing expert.
-Analyze clinical notes to identify all legitimately billable codes.
-Be thorough but only include codes that are supportable by the documentation.
-Apply proper modifier logic and NCCI edit rules.
-Respond with valid JSON only."""
+ENHANCEMENTS_SYSTEM = """Dermatology billing expert. Maximize billing AND medicolegal protection through DOCUMENTATION.
 
-        try:
-            response = self._call_llm(prompt, system=system)
-            data = self._parse_json_response(response)
-
-            codes = [
-                BillingCode(
-                    code=c["code"],
-                    modifier=c.get("modifier"),
-                    description=c.get("description", ""),
-                    wRVU=float(c.get("wRVU", 0)),
-                    units=int(c.get("units", 1)),
-                    status=c.get("status", "supported"),
-                    documentation_note=c.get("documentation_note"),
-                )
-                for c in data.get("codes", [])
-            ]
+ABSOLUTE RULES - VIOLATIONS ARE UNACCEPTABLE:
+1. NEVER INVENT NUMBERS - if original note has no count, do NOT add one. Use "multiple", "several", not "4"
+2. current_billing MUST use SIMPLE codes (56501, 54050, 46900) unless "extensive" is in original note
+3. EXTENSIVE_UPGRADE enhancement is a suggestion - does NOT change current_billing codes
 
-            return CurrentBilling(
-                codes=codes,
-                total_wRVU=float(data.get("total_wRVU", sum(c.wRVU * c.units for c in codes))),
-                documentation_gaps=data.get("documentation_gaps", []),
-            )
-        except Exception as e:
-            return CurrentBilling(
-                codes=[],
-                total_wRVU=0.0,
-                documentation_gaps=[f"Error analyzing billing: {str(e)}"],
-            )
+OTHER RULES:
+1. Only include enhancements for services that WERE PERFORMED
+2. COUNT EXTRACTION - PRINCIPLE-BASED:
+   - SCAN the procedure text for ANY numeric/countable info (digits, "bilateral", listed sites)
+   - If count info EXISTS → status: "supported" with extracted count
+   - ONLY use COUNT_CLARIFICATION when procedure text has NO count info whatsoever
+   - NEVER assume count from EXAM findings (exam = what exists, plan = what was treated)
+3. SITE-SPECIFIC CODES - CRITICAL:
+   - Genital warts/lesions → NEVER use 17110. Use 56501/56515 (female) or 54050/54055 (male)
+   - Anal/perianal lesions → NEVER use 17110. Use 46900/46910
+   - current_billing: ALWAYS 56501/54050/46900 unless "extensive" appears in original note
+   - When no "extensive" in note → priority: "extensive_upgrade" (but current_billing stays simple!)
+   - optimized_note uses extensive language (default toggle is "Yes")
+4. Medicolegal documentation gaps → priority: "medicolegal", enhanced_code: "LEGAL"
+5. G2211, E/M upgrades, unbundling → priority: "high"
+6. DIAGNOSIS ASSOCIATION REQUIRED: Every code MUST have an associated diagnosis field.
+   This is CRITICAL for G2211 eligibility - G2211 cannot be used if a procedure is
+   billed for the same diagnosis. Example: injection under "Inflamed Cyst" allows
+   G2211 for "Acne" management, but injection under "Acne" blocks G2211 for Acne.
 
-    def identify_enhancements(
-        self,
-        note_text: str,
-        entities: ExtractedEntities,
-        corpus_context: str,
-    ) -> tuple[CurrentBilling, DocumentationEnhancements]:
-        """
-        Analyze current billing AND identify documentation enhancements.
+DOCUMENTATION PHILOSOPHY: Minimal yet complete.
+- Document the minimum necessary to justify billing codes
+- Over-documentation creates malpractice liability
+- Safety-critical items → MEDICOLEGAL ENHANCEMENT CARDS
 
-        Args:
-            note_text: Original clinical note
-            entities: Extracted entities
-            corpus_context: Relevant corpus content
+Respond with valid JSON only."""
 
-        Returns:
-            Tuple of (CurrentBilling, DocumentationEnhancements)
-        """
-        prompt = f"""Analyze this dermatology note for billing optimization.
+ENHANCEMENTS_PROMPT = Template("""Analyze this dermatology note for billing optimization.
 
 NOTE:
-{note_text}
+$note
 
 ENTITIES:
-{json.dumps(entities.model_dump(), indent=2)}
+$entities""")
 
-REFERENCE:
-{corpus_context}
-
-TASK:
+# Static task instructions, sent as a cached block ahead of the note-specific prompt
+ENHANCEMENTS_INSTRUCTIONS = """TASK:
 1. Identify ALL billable codes from note AS WRITTEN
 2. Suggest DOCUMENTATION enhancements ONLY for work that WAS ACTUALLY PERFORMED
 3. Suggest MEDICOLEGAL enhancements for missing safety documentation
@@ -375,20 +218,20 @@ original note EXPLICITLY contains the word "extensive".
 The EXTENSIVE_UPGRADE enhancement is a SEPARATE suggestion - it does NOT affect current_billing.
 
 When genital/anal destruction is documented WITHOUT "extensive" language, create EXTENSIVE_UPGRADE:
-{{"issue": "Vulvar destruction - upgrade to extensive?", "current_code": "56501", "current_wRVU": 0.70,
+{"issue": "Vulvar destruction - upgrade to extensive?", "current_code": "56501", "current_wRVU": 0.70,
   "suggested_addition": "Was destruction extensive? If yes, add: 'Extensive destruction performed'",
   "enhanced_code": "56515", "enhanced_wRVU": 1.87, "delta_wRVU": 1.17, "priority": "extensive_upgrade",
-  "upgrade_family": "female_genital_destruction", "default_extensive": true}}
+  "upgrade_family": "female_genital_destruction", "default_extensive": true}
 
 EXAM vs PLAN: NEVER use exam counts for billing. If exam says "8 nails dystrophic"
 but Plan says "nail debridement performed" with no count → COUNT_CLARIFICATION
 (The exam count is what exists; the Plan count is what was treated)
 
 For COUNT_CLARIFICATION cards, use this format in enhancements:
-{{"issue": "Nail debridement count unspecified", "current_code": "11720", "current_wRVU": 0.31,
+{"issue": "Nail debridement count unspecified", "current_code": "11720", "current_wRVU": 0.31,
   "suggested_addition": "CLARIFY: How many nails were actually debrided? Enter count to determine correct billing code.",
   "enhanced_code": "COUNT_CLARIFY", "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "count_clarification",
-  "count_family": "nail_debridement", "default_count": 1}}
+  "count_family": "nail_debridement", "default_count": 1}
 
 VALID Step 3 Enhancements (things that WERE done):
 - G2211 add-on: Chronic condition relationship EXISTS → document it (+0.33 wRVU)
@@ -473,32 +316,32 @@ INVALID for Step 3 (move to Step 4):
 - Treating MORE lesions/nails than were actually treated (that's Step 4)
 
 JSON format:
-{{"current_billing": {{"codes": [{{"code": "X", "modifier": "X", "description": "X", "wRVU": 0, "units": 1, "status": "supported|count_unspecified", "diagnosis": "condition name"}}], "total_wRVU": 0, "documentation_gaps": []}},
-"enhancements": [{{"issue": "X", "current_code": "X", "current_wRVU": 0, "suggested_addition": "X", "enhanced_code": "X", "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "high|medicolegal|count_clarification", "count_family": "optional", "default_count": 1, "diagnosis": "condition name"}}],
-"suggested_addendum": "X", "optimized_note": "X", "enhanced_total_wRVU": 0, "improvement": 0}}
+{"current_billing": {"codes": [{"code": "X", "modifier": "X", "description": "X", "wRVU": 0, "units": 1, "status": "supported|count_unspecified", "diagnosis": "condition name"}], "total_wRVU": 0, "documentation_gaps": []},
+"enhancements": [{"issue": "X", "current_code": "X", "current_wRVU": 0, "suggested_addition": "X", "enhanced_code": "X", "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "high|medicolegal|count_clarification", "count_family": "optional", "default_count": 1, "diagnosis": "condition name"}],
+"suggested_addendum": "X", "optimized_note": "X", "enhanced_total_wRVU": 0, "improvement": 0}
 
 CRITICAL: The "diagnosis" field is REQUIRED for every code. This enables G2211 eligibility check.
 
 ENHANCEMENT TYPES - USE THE CORRECT FORMAT:
 
 1. COUNT_CLARIFICATION (count-based procedure done but count not specified):
-   {{"issue": "Nail debridement count unspecified", "current_code": "11720", "current_wRVU": 0.31,
+   {"issue": "Nail debridement count unspecified", "current_code": "11720", "current_wRVU": 0.31,
      "suggested_addition": "Enter actual count performed", "enhanced_code": "COUNT_CLARIFY",
      "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "count_clarification",
-     "count_family": "nail_debridement", "default_count": 1}}
+     "count_family": "nail_debridement", "default_count": 1}
 
    COUNT FAMILIES: nail_debridement, il_injection, ak_destruction, benign_destruction
 
 2. MEDICOLEGAL (safety documentation, no wRVU):
-   {{"issue": "Missing safety documentation", "current_code": null, "current_wRVU": 0,
+   {"issue": "Missing safety documentation", "current_code": null, "current_wRVU": 0,
      "suggested_addition": "Add: Patient counseled on...", "enhanced_code": "LEGAL",
-     "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "medicolegal"}}
+     "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "medicolegal"}
 
 3. BILLING ENHANCEMENT (code upgrade, unbundling, G2211):
-   {{"issue": "G2211 chronic care add-on for Acne", "current_code": "99214", "current_wRVU": 1.92,
+   {"issue": "G2211 chronic care add-on for Acne", "current_code": "99214", "current_wRVU": 1.92,
      "suggested_addition": "Add: Ongoing management of chronic Acne (G2211 eligible - no same-day procedure billed under Acne dx)",
      "enhanced_code": "99214 + G2211", "enhanced_wRVU": 2.25, "delta_wRVU": 0.33, "priority": "high",
-     "diagnosis": "Acne"}}
+     "diagnosis": "Acne"}
 
    CRITICAL FOR G2211: Only suggest G2211 for a diagnosis that has NO procedure billed against it.
    If injection is billed under "Acne", G2211 is BLOCKED for Acne. Bill injection under
@@ -508,10 +351,10 @@ ENHANCEMENT TYPES - USE THE CORRECT FORMAT:
    When genital or anal destruction is documented WITHOUT explicit "extensive" language,
    suggest upgrading to extensive with template documentation.
 
-   {{"issue": "Vulvar destruction - upgrade to extensive?", "current_code": "56501", "current_wRVU": 0.70,
+   {"issue": "Vulvar destruction - upgrade to extensive?", "current_code": "56501", "current_wRVU": 0.70,
      "suggested_addition": "Was destruction extensive? If yes, add: 'Extensive destruction performed - multiple lesions requiring extended treatment time and effort'",
      "enhanced_code": "56515", "enhanced_wRVU": 1.87, "delta_wRVU": 1.17, "priority": "extensive_upgrade",
-     "upgrade_family": "female_genital_destruction", "default_extensive": true}}
+     "upgrade_family": "female_genital_destruction", "default_extensive": true}
 
    UPGRADE FAMILIES and codes:
    • female_genital_destruction: 56501 (0.70) → 56515 (1.87) = +167%
@@ -540,483 +383,64 @@ ABSOLUTE PROHIBITION - NEVER INVENT NUMBERS:
 - Use qualitative language: "multiple", "several", "extensive" - NOT fabricated counts
 - Inventing numbers is MEDICAL FRAUD and ILLEGAL"""
 
-        system = """Dermatology billing expert. Maximize billing AND medicolegal protection through DOCUMENTATION.
+OPPORTUNITIES_SYSTEM = """You are an expert dermatology billing educator and optimizer. MAXIMIZE RVU.
 
-ABSOLUTE RULES - VIOLATIONS ARE UNACCEPTABLE:
-1. NEVER INVENT NUMBERS - if original note has no count, do NOT add one. Use "multiple", "several", not "4"
-2. current_billing MUST use SIMPLE codes (56501, 54050, 46900) unless "extensive" is in original note
-3. EXTENSIVE_UPGRADE enhancement is a suggestion - does NOT change current_billing codes
+═══════════════════════════════════════════════════════════════════════════════
+ABSOLUTE RULES - VIOLATIONS ARE UNACCEPTABLE
+═══════════════════════════════════════════════════════════════════════════════
+1. NEVER INVENT NUMBERS - if original note has no count, do NOT add one
+   - Use "multiple", "several", "extensive" - NEVER fabricate counts like "3" or "4"
+   - Inventing lesion counts is MEDICAL FRAUD
+2. GENITAL DESTRUCTION: Include extensive justification in optimized_note by default
+   - Always add: "extensive requiring extended treatment time", "multiple confluent lesions", etc.
 
-OTHER RULES:
-1. Only include enhancements for services that WERE PERFORMED
-2. COUNT EXTRACTION - PRINCIPLE-BASED:
-   - SCAN the procedure text for ANY numeric/countable info (digits, "bilateral", listed sites)
-   - If count info EXISTS → status: "supported" with extracted count
-   - ONLY use COUNT_CLARIFICATION when procedure text has NO count info whatsoever
-   - NEVER assume count from EXAM findings (exam = what exists, plan = what was treated)
-3. SITE-SPECIFIC CODES - CRITICAL:
-   - Genital warts/lesions → NEVER use 17110. Use 56501/56515 (female) or 54050/54055 (male)
-   - Anal/perianal lesions → NEVER use 17110. Use 46900/46910
-   - current_billing: ALWAYS 56501/54050/46900 unless "extensive" appears in original note
-   - When no "extensive" in note → priority: "extensive_upgrade" (but current_billing stays simple!)
-   - optimized_note uses extensive language (default toggle is "Yes")
-4. Medicolegal documentation gaps → priority: "medicolegal", enhanced_code: "LEGAL"
-5. G2211, E/M upgrades, unbundling → priority: "high"
-6. DIAGNOSIS ASSOCIATION REQUIRED: Every code MUST have an associated diagnosis field.
-   This is CRITICAL for G2211 eligibility - G2211 cannot be used if a procedure is
-   billed for the same diagnosis. Example: injection under "Inflamed Cyst" allows
-   G2211 for "Acne" management, but injection under "Acne" blocks G2211 for Acne.
+CRITICAL RULES - RVU MAXIMIZATION:
+1. CHECK EVERY count-based procedure in Plan for upgrade potential:
+   - Extract count using principle-based approach (digits, bilateral, listed sites)
+   - Compare to exam findings - more treatable sites = upgrade opportunity
+   - Ambiguous count (no count in procedure) = upgrade opportunity (baseline tier only billable)
+2. ONE card per code family - aggregate related findings
+3. Be SPECIFIC - reference actual findings, target counts, tier thresholds
+4. Include accurate wRVU values from reference
+5. HIGH-VALUE first (procedures > E/M)
+6. ONE medicolegal card if safety documentation missing
 
-DOCUMENTATION PHILOSOPHY: Minimal yet complete.
-- Document the minimum necessary to justify billing codes
-- Over-documentation creates malpractice liability
-- Safety-critical items → MEDICOLEGAL ENHANCEMENT CARDS
+UPGRADE DETECTION CHECKLIST:
+□ Nail debridement done? → Check: exam nail count vs treated count → suggest 6+ for 11721
+□ IL injection done? → Check: exam lesion count vs injected count → suggest 8+ for 11901
+□ AK destruction done? → Check: exam AK count vs treated count → suggest 15+ for 17004
+□ Benign destruction done? → Check: exam lesion count vs treated count → suggest 15+ for 17111
+□ Count ambiguous in any above? → This IS an upgrade opportunity (baseline only billable)
 
-Respond with valid JSON only."""
+E/M CRITICAL: Pick ONE specific code, not a range. No -25 in code field.
 
-        try:
-            response = self._call_llm(prompt, system=system, max_tokens=8192)
-            data = self._parse_json_response(response)
-
-            # Parse current billing
-            cb_data = data.get("current_billing", {})
-            codes = [
-                BillingCode(
-                    code=c["code"],
-                    modifier=c.get("modifier"),
-                    description=c.get("description", ""),
-                    wRVU=float(c.get("wRVU", 0)),
-                    units=int(c.get("units", 1)),
-                    status=c.get("status", "supported"),
-                    documentation_note=c.get("documentation_note"),
-                    diagnosis=c.get("diagnosis"),
-                )
-                for c in cb_data.get("codes", [])
-            ]
-            current_billing = CurrentBilling(
-                codes=codes,
-                total_wRVU=float(cb_data.get("total_wRVU", sum(c.wRVU * c.units for c in codes))),
-                documentation_gaps=cb_data.get("documentation_gaps", []),
-            )
+USE potential_code (single code) for:
+- E/M levels, count-based procedures, medicolegal items
 
-            # Parse enhancements
-            enhancements = [
-                DocumentationEnhancement(
-                    issue=e["issue"],
-                    current_code=e.get("current_code"),
-                    current_wRVU=float(e.get("current_wRVU", 0)),
-                    suggested_addition=e["suggested_addition"],
-                    enhanced_code=e.get("enhanced_code"),
-                    enhanced_wRVU=float(e.get("enhanced_wRVU", 0)),
-                    delta_wRVU=float(e.get("delta_wRVU", 0)),
-                    priority=e.get("priority", "medium"),
-                    count_family=e.get("count_family"),
-                    default_count=int(e["default_count"]) if e.get("default_count") else None,
-                    upgrade_family=e.get("upgrade_family"),
-                    default_extensive=e.get("default_extensive"),
-                    diagnosis=e.get("diagnosis"),
-                )
-                for e in data.get("enhancements", [])
-            ]
+USE code_options ONLY for:
+- Truly mutually exclusive tiers (genital: simple vs extensive)
 
-            doc_enhancements = DocumentationEnhancements(
-                enhancements=enhancements,
-                suggested_addendum=data.get("suggested_addendum"),
-                optimized_note=data.get("optimized_note"),
-                enhanced_total_wRVU=float(data.get("enhanced_total_wRVU", 0)),
-                improvement=float(data.get("improvement", 0)),
-            )
+OUTPUT: Valid JSON only."""
 
-            return current_billing, doc_enhancements
-        except Exception as e:
-            return (
-                CurrentBilling(codes=[], total_wRVU=0.0, documentation_gaps=[f"Error: {str(e)}"]),
-                DocumentationEnhancements(enhancements=[], enhanced_total_wRVU=0.0, improvement=0.0),
-            )
+OPPORTUNITIES_PROMPT = Template("""You are a dermatology billing optimization expert. Analyze this clinical note to identify MISSED billing opportunities - procedures/services that COULD have been performed but WERE NOT.
 
-    async def identify_enhancements_async(
-        self,
-        note_text: str,
-        entities: ExtractedEntities,
-        corpus_context: str,
-    ) -> tuple[CurrentBilling, DocumentationEnhancements]:
-        """Async version of identify_enhancements."""
-        prompt = f"""Analyze this dermatology note for billing optimization.
+CLINICAL NOTE:
+$note
 
-NOTE:
-{note_text}
+EXTRACTED ENTITIES:
+$entities""")
 
-ENTITIES:
-{json.dumps(entities.model_dump(), indent=2)}
+# Static task instructions, sent as a cached block ahead of the note-specific prompt
+OPPORTUNITIES_INSTRUCTIONS = """YOUR TASK: MAXIMIZE RVU by identifying ALL opportunities to increase billing through:
 
-REFERENCE:
-{corpus_context}
-
-TASK:
-1. Identify ALL billable codes from note AS WRITTEN
-2. Suggest DOCUMENTATION enhancements ONLY for work that WAS ACTUALLY PERFORMED
-3. Suggest MEDICOLEGAL enhancements for missing safety documentation
-4. Flag COUNT-BASED PROCEDURES where count is UNSPECIFIED (critical for billing accuracy)
-
-CRITICAL: If a procedure/exam/service WAS NOT DONE, it belongs in Step 4 (Opportunities), NOT here.
-
-═══════════════════════════════════════════════════════════════════════════════
-COUNT EXTRACTION: PRINCIPLE-BASED APPROACH
-═══════════════════════════════════════════════════════════════════════════════
-
-CORE PRINCIPLE: A count IS SPECIFIED if the PROCEDURE DESCRIPTION (Plan section)
-contains ANY numeric or countable information about what was treated.
-
-EXTRACTION RULES - Apply in order:
-1. EXPLICIT NUMBER: Any digit in the procedure text → use that number
-   • "injected into 4 thick plaques" → count = 4 ✓
-   • "debridement of 3 nails" → count = 3 ✓
-   • "treated 6 AKs" → count = 6 ✓
-
-2. ANATOMIC COUNTING: Bilateral/paired anatomy → calculate count
-   • "bilateral elbows" → count = 2 ✓
-   • "bilateral elbows and knees" → count = 4 (2+2) ✓
-   • "both hands" → count = 2 ✓
-
-3. LISTED SITES: Enumerated locations → count the list
-   • "injected scalp, left arm, right arm" → count = 3 ✓
-   • "treated forehead, nose, and cheeks" → count = 3 ✓
-
-4. ANATOMIC IMPLICATION: Specific anatomy implies count
-   • "all 10 toenails debrided" → count = 10 ✓
-   • "both great toenails" → count = 2 ✓
-
-CRITICAL: Only use COUNT_CLARIFICATION when the procedure text has NO countable info:
-- "Nail debridement performed" → no count anywhere → COUNT_CLARIFICATION
-- "IL injection given" → no count anywhere → COUNT_CLARIFICATION
-- "AKs treated" → no count anywhere → COUNT_CLARIFICATION
-
-WRONG - Do NOT flag as unspecified if count exists ANYWHERE in procedure text:
-- "IL triamcinolone 10mg/mL injected into 4 thick plaques" → count = 4 (NOT unspecified!)
-- "Nail debridement bilateral great toenails" → count = 2 (NOT unspecified!)
-
-Count-based procedure families:
-• Nail debridement (11720: 1-5, 11721: 6+)
-• IL injections (11900: 1-7, 11901: 8+)
-• AK destruction (17000: first, 17003: 2-14, 17004: 15+)
-• Benign destruction (17110: 1-14, 17111: 15+)
-
-CRITICAL - SITE-SPECIFIC DESTRUCTION CODES:
-For genital/anal lesions, NEVER use generic 17110/17111. Use site-specific codes:
-• Female genital (vulvar warts, etc): 56501 (simple) or 56515 (extensive)
-• Male genital (penile warts, etc): 54050 (simple) or 54055 (extensive)
-• Anal/perianal: 46900 (simple) or 46910 (extensive)
-
-CURRENT_BILLING FOR GENITAL/ANAL - ABSOLUTE RULE:
-In current_billing.codes, ALWAYS use the SIMPLE code (56501, 54050, 46900) unless the
-original note EXPLICITLY contains the word "extensive".
-- "Cryotherapy to vulvar warts" → current_billing uses 56501 (NOT 56515!)
-- "Extensive cryotherapy to vulvar warts" → current_billing uses 56515
-The EXTENSIVE_UPGRADE enhancement is a SEPARATE suggestion - it does NOT affect current_billing.
-
-When genital/anal destruction is documented WITHOUT "extensive" language, create EXTENSIVE_UPGRADE:
-{{"issue": "Vulvar destruction - upgrade to extensive?", "current_code": "56501", "current_wRVU": 0.70,
-  "suggested_addition": "Was destruction extensive? If yes, add: 'Extensive destruction performed'",
-  "enhanced_code": "56515", "enhanced_wRVU": 1.87, "delta_wRVU": 1.17, "priority": "extensive_upgrade",
-  "upgrade_family": "female_genital_destruction", "default_extensive": true}}
-
-EXAM vs PLAN: NEVER use exam counts for billing. If exam says "8 nails dystrophic"
-but Plan says "nail debridement performed" with no count → COUNT_CLARIFICATION
-(The exam count is what exists; the Plan count is what was treated)
-
-For COUNT_CLARIFICATION cards, use this format in enhancements:
-{{"issue": "Nail debridement count unspecified", "current_code": "11720", "current_wRVU": 0.31,
-  "suggested_addition": "CLARIFY: How many nails were actually debrided? Enter count to determine correct billing code.",
-  "enhanced_code": "COUNT_CLARIFY", "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "count_clarification",
-  "count_family": "nail_debridement", "default_count": 1}}
-
-VALID Step 3 Enhancements (things that WERE done):
-- G2211 add-on: Chronic condition relationship EXISTS → document it (+0.33 wRVU)
-- G2212 add-on: Prolonged visit (>40min established, >60min new) → document time (+0.61 wRVU)
-- E/M upgrade: MDM/counseling DID happen → document complexity to support higher level
-- Code upgrades: Repair WAS done → document technique for intermediate vs simple
-- Unbundling: Multiple procedures WERE done → separate under different diagnoses
-- COUNT_CLARIFICATION: Procedure WAS done but count is ambiguous → ask user to specify
-
-═══════════════════════════════════════════════════════════════════════════════
-G2211 CRITICAL RULE - DIAGNOSIS SEPARATION REQUIRED
-═══════════════════════════════════════════════════════════════════════════════
-G2211 (ongoing care add-on) CANNOT be used if a PROCEDURE is billed for the SAME DIAGNOSIS.
-
-EVERY CODE MUST HAVE AN ASSOCIATED DIAGNOSIS. This is critical for G2211 eligibility.
-
-Example scenario: Patient with Acne + PIH + Inflamed Cyst
-  - WRONG: Bill injection under "Acne" → G2211 BLOCKED for Acne management
-  - RIGHT: Bill injection under "Inflamed Cyst", chemical peel under "PIH"
-           → G2211 CAN be used for ongoing Acne management (no procedure on Acne dx)
-
-G2211 ELIGIBILITY CHECK:
-1. Identify all diagnoses in the note
-2. Identify which procedures are billed and their associated diagnoses
-3. G2211 can ONLY be used for a chronic condition that has NO same-day procedure
-4. In suggested_addition for G2211, specify which diagnosis it applies to
-
-OUTPUT REQUIREMENT: For EVERY code in current_billing.codes and enhancements,
-include a "diagnosis" field specifying which condition it's billed under.
-This enables proper G2211 eligibility determination and correct unbundling.
-
-DIAGNOSIS OPTIMIZATION FOR MAXIMUM BILLING:
-Your job is to OUTPUT THE OPTIMAL BILLING CONFIGURATION. Assume all clinically plausible
-diagnoses ARE present - the provider will deselect anything that doesn't apply.
-
-1. Assign each procedure to the diagnosis that MAXIMIZES billing:
-   - Pick a diagnosis that's NOT the primary E/M condition (preserves G2211)
-   - Example: Chemical peel in acne patient → bill under "PIH" (preserves G2211 for Acne)
-   - Example: Injection in acne patient → bill under "Inflamed cyst" (preserves G2211 for Acne)
-
-2. USE SIDECAR DIAGNOSES LIBERALLY: When a procedure would block G2211 if billed under the
-   main diagnosis, USE a clinically plausible sidecar diagnosis that commonly co-occurs:
-   - Acne + injection → use "Inflamed cyst" or "Inflammatory nodule"
-   - Acne + chemical peel → use "Post-inflammatory hyperpigmentation (PIH)"
-   - Acne + extraction → use "Comedones" or "Milia"
-   - Psoriasis + IL injection → use "Psoriatic plaque" (specific lesion)
-   - Eczema + injection → use "Eczematous nodule" or "Prurigo nodule"
-   These conditions almost always exist in these patients. Output them as the diagnosis.
-
-3. For procedures without a clear sidecar, use an appropriately vague diagnosis
-   (e.g., "Vulvar lesion", "Skin lesion", "Inflammatory lesion")
-
-ADD-ON CODES (bill WITH primary codes when applicable):
-• Biopsies: 11103/11105/11107 for each additional lesion biopsied
-• Skin tags: 11201 (+0.28 wRVU) for each additional 10 tags removed beyond first 15
-• Nail avulsion: 11732 (+0.37 wRVU) for each additional nail beyond first
-• Complex repairs: 13102/13122/13133/13153 for each additional 5cm repaired
-• Tissue transfer: 14302 (+3.64 wRVU) for each additional 30 sq cm
-• Full-thickness graft: 15261 (+2.17 wRVU) for each additional graft area
-
-MEDICOLEGAL ENHANCEMENTS (enhanced_code: "LEGAL", delta_wRVU: 0):
-CRITICAL PRINCIPLE: Avoid selective risk documentation. If documenting one risk in detail,
-document ALL relevant risks - or document none. Selective documentation creates liability:
-"You documented skin cancer risk but not infection - why the inconsistency?"
-
-USE SPARINGLY - Only suggest medicolegal enhancement when documentation is:
-1. MISSING a critical safety element that was clearly discussed (e.g., follow-up timing)
-2. INCOMPLETE for shared decision-making (e.g., "discussed biologics" without any risk mention)
-
-AVOID suggesting medicolegal additions when:
-- Risk discussion is ALREADY documented (even briefly) - don't expand selectively
-- The note says "risks/benefits discussed" - this is legally sufficient
-- Adding would create INCONSISTENT depth (one risk detailed, others brief)
-
-Example: If note says "discussed biologic therapy including risks and benefits" → SUFFICIENT
-Do NOT add separate "skin cancer surveillance" documentation unless ALL other risks are equally expanded
-
-INVALID for Step 3 (move to Step 4):
-- "Injection not documented" when NO injection was given
-- "Exam not performed" → that's a missed opportunity, not an enhancement
-- Any procedure that COULD have been done but WASN'T
-- Treating MORE lesions/nails than were actually treated (that's Step 4)
-
-JSON format:
-{{"current_billing": {{"codes": [{{"code": "X", "modifier": "X", "description": "X", "wRVU": 0, "units": 1, "status": "supported|count_unspecified", "diagnosis": "condition name"}}], "total_wRVU": 0, "documentation_gaps": []}},
-"enhancements": [{{"issue": "X", "current_code": "X", "current_wRVU": 0, "suggested_addition": "X", "enhanced_code": "X", "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "high|medicolegal|count_clarification", "count_family": "optional", "default_count": 1, "diagnosis": "condition name"}}],
-"suggested_addendum": "X", "optimized_note": "X", "enhanced_total_wRVU": 0, "improvement": 0}}
-
-CRITICAL: The "diagnosis" field is REQUIRED for every code. This enables G2211 eligibility check.
-
-ENHANCEMENT TYPES - USE THE CORRECT FORMAT:
-
-1. COUNT_CLARIFICATION (count-based procedure done but count not specified):
-   {{"issue": "Nail debridement count unspecified", "current_code": "11720", "current_wRVU": 0.31,
-     "suggested_addition": "Enter actual count performed", "enhanced_code": "COUNT_CLARIFY",
-     "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "count_clarification",
-     "count_family": "nail_debridement", "default_count": 1}}
-
-   COUNT FAMILIES: nail_debridement, il_injection, ak_destruction, benign_destruction
-
-2. MEDICOLEGAL (safety documentation, no wRVU):
-   {{"issue": "Missing safety documentation", "current_code": null, "current_wRVU": 0,
-     "suggested_addition": "Add: Patient counseled on...", "enhanced_code": "LEGAL",
-     "enhanced_wRVU": 0, "delta_wRVU": 0, "priority": "medicolegal"}}
-
-3. BILLING ENHANCEMENT (code upgrade, unbundling, G2211):
-   {{"issue": "G2211 chronic care add-on for Acne", "current_code": "99214", "current_wRVU": 1.92,
-     "suggested_addition": "Add: Ongoing management of chronic Acne (G2211 eligible - no same-day procedure billed under Acne dx)",
-     "enhanced_code": "99214 + G2211", "enhanced_wRVU": 2.25, "delta_wRVU": 0.33, "priority": "high",
-     "diagnosis": "Acne"}}
-
-   CRITICAL FOR G2211: Only suggest G2211 for a diagnosis that has NO procedure billed against it.
-   If injection is billed under "Acne", G2211 is BLOCKED for Acne. Bill injection under
-   "Inflamed Cyst" instead, then G2211 can be used for "Acne" chronic management.
-
-4. EXTENSIVE_UPGRADE (genital/anal destruction - simple vs extensive):
-   When genital or anal destruction is documented WITHOUT explicit "extensive" language,
-   suggest upgrading to extensive with template documentation.
-
-   {{"issue": "Vulvar destruction - upgrade to extensive?", "current_code": "56501", "current_wRVU": 0.70,
-     "suggested_addition": "Was destruction extensive? If yes, add: 'Extensive destruction performed - multiple lesions requiring extended treatment time and effort'",
-     "enhanced_code": "56515", "enhanced_wRVU": 1.87, "delta_wRVU": 1.17, "priority": "extensive_upgrade",
-     "upgrade_family": "female_genital_destruction", "default_extensive": true}}
-
-   UPGRADE FAMILIES and codes:
-   • female_genital_destruction: 56501 (0.70) → 56515 (1.87) = +167%
-   • male_genital_destruction: 54050 (0.61) → 54055 (1.50) = +146%
-   • anal_destruction: 46900 (0.91) → 46910 (1.51) = +66%
-
-   TEMPLATE LANGUAGE for extensive (use in optimized note):
-   "Extensive destruction performed - multiple lesions across broad treatment area requiring
-   extended provider time and careful technique to complete"
-
-   IMPORTANT: The optimized_note MUST include extensive template language for genital/anal
-   destruction BY DEFAULT (since "Yes - Extensive" is the default toggle selection).
-
-CRITICAL: If a procedure was done but count is unspecified, you MUST use priority: "count_clarification"
-with count_family and default_count. Do NOT suggest a specific count - let the user input it.
-
-OPTIMIZED NOTE RULES - DOCUMENTATION PRINCIPLES:
-- Output ONLY the clinical note text - no Time, Coding, or billing sections
-- Be CONCISE and FACTUAL: State what was done briefly
-- Include safety-critical items when clinically relevant
-- For genital/anal destruction: use extensive language in optimized_note (default selection)
-
-ABSOLUTE PROHIBITION - NEVER INVENT NUMBERS:
-- NEVER add specific counts that are not in the original note
-- If original says "vulvar warts" → do NOT write "4 vulvar warts" or any number
-- Use qualitative language: "multiple", "several", "extensive" - NOT fabricated counts
-- Inventing numbers is MEDICAL FRAUD and ILLEGAL"""
-
-        system = """Dermatology billing expert. Maximize billing AND medicolegal protection through DOCUMENTATION.
-
-ABSOLUTE RULES - VIOLATIONS ARE UNACCEPTABLE:
-1. NEVER INVENT NUMBERS - if original note has no count, do NOT add one. Use "multiple", "several", not "4"
-2. current_billing MUST use SIMPLE codes (56501, 54050, 46900) unless "extensive" is in original note
-3. EXTENSIVE_UPGRADE enhancement is a suggestion - does NOT change current_billing codes
-
-OTHER RULES:
-1. Only include enhancements for services that WERE PERFORMED
-2. COUNT EXTRACTION - PRINCIPLE-BASED:
-   - SCAN the procedure text for ANY numeric/countable info (digits, "bilateral", listed sites)
-   - If count info EXISTS → status: "supported" with extracted count
-   - ONLY use COUNT_CLARIFICATION when procedure text has NO count info whatsoever
-   - NEVER assume count from EXAM findings (exam = what exists, plan = what was treated)
-3. SITE-SPECIFIC CODES - CRITICAL:
-   - Genital warts/lesions → NEVER use 17110. Use 56501/56515 (female) or 54050/54055 (male)
-   - Anal/perianal lesions → NEVER use 17110. Use 46900/46910
-   - current_billing: ALWAYS 56501/54050/46900 unless "extensive" appears in original note
-   - When no "extensive" in note → priority: "extensive_upgrade" (but current_billing stays simple!)
-   - optimized_note uses extensive language (default toggle is "Yes")
-4. Medicolegal documentation gaps → priority: "medicolegal", enhanced_code: "LEGAL"
-5. G2211, E/M upgrades, unbundling → priority: "high"
-6. DIAGNOSIS ASSOCIATION REQUIRED: Every code MUST have an associated diagnosis field.
-   This is CRITICAL for G2211 eligibility - G2211 cannot be used if a procedure is
-   billed for the same diagnosis. Example: injection under "Inflamed Cyst" allows
-   G2211 for "Acne" management, but injection under "Acne" blocks G2211 for Acne.
-
-DOCUMENTATION PHILOSOPHY: Minimal yet complete.
-- Document the minimum necessary to justify billing codes
-- Over-documentation creates malpractice liability
-- Safety-critical items → MEDICOLEGAL ENHANCEMENT CARDS
-
-Respond with valid JSON only."""
-
-        try:
-            response = await self._call_llm_async(prompt, system=system, max_tokens=8192)
-            data = self._parse_json_response(response)
-
-            # Parse current billing
-            cb_data = data.get("current_billing", {})
-            codes = [
-                BillingCode(
-                    code=c["code"],
-                    modifier=c.get("modifier"),
-                    description=c.get("description", ""),
-                    wRVU=float(c.get("wRVU", 0)),
-                    units=int(c.get("units", 1)),
-                    status=c.get("status", "supported"),
-                    documentation_note=c.get("documentation_note"),
-                    diagnosis=c.get("diagnosis"),
-                )
-                for c in cb_data.get("codes", [])
-            ]
-            current_billing = CurrentBilling(
-                codes=codes,
-                total_wRVU=float(cb_data.get("total_wRVU", sum(c.wRVU * c.units for c in codes))),
-                documentation_gaps=cb_data.get("documentation_gaps", []),
-            )
-
-            # Parse enhancements
-            enhancements = [
-                DocumentationEnhancement(
-                    issue=e["issue"],
-                    current_code=e.get("current_code"),
-                    current_wRVU=float(e.get("current_wRVU", 0)),
-                    suggested_addition=e["suggested_addition"],
-                    enhanced_code=e.get("enhanced_code"),
-                    enhanced_wRVU=float(e.get("enhanced_wRVU", 0)),
-                    delta_wRVU=float(e.get("delta_wRVU", 0)),
-                    priority=e.get("priority", "medium"),
-                    count_family=e.get("count_family"),
-                    default_count=int(e["default_count"]) if e.get("default_count") else None,
-                    upgrade_family=e.get("upgrade_family"),
-                    default_extensive=e.get("default_extensive"),
-                    diagnosis=e.get("diagnosis"),
-                )
-                for e in data.get("enhancements", [])
-            ]
-
-            doc_enhancements = DocumentationEnhancements(
-                enhancements=enhancements,
-                suggested_addendum=data.get("suggested_addendum"),
-                optimized_note=data.get("optimized_note"),
-                enhanced_total_wRVU=float(data.get("enhanced_total_wRVU", 0)),
-                improvement=float(data.get("improvement", 0)),
-            )
-
-            return current_billing, doc_enhancements
-        except Exception as e:
-            return (
-                CurrentBilling(codes=[], total_wRVU=0.0, documentation_gaps=[f"Error: {str(e)}"]),
-                DocumentationEnhancements(enhancements=[], enhanced_total_wRVU=0.0, improvement=0.0),
-            )
-
-    def identify_opportunities(
-        self,
-        note_text: str,
-        entities: ExtractedEntities,
-        scenario_content: str,
-        corpus_context: str,
-    ) -> FutureOpportunities:
-        """
-        Identify future opportunities ("next time" recommendations).
-
-        Args:
-            note_text: Original clinical note
-            entities: Extracted entities
-            scenario_content: Matched scenario file content
-            corpus_context: Additional corpus context
-
-        Returns:
-            FutureOpportunities object
-        """
-        prompt = f"""You are a dermatology billing optimization expert. Analyze this clinical note to identify MISSED billing opportunities - procedures/services that COULD have been performed but WERE NOT.
-
-CLINICAL NOTE:
-{note_text}
-
-EXTRACTED ENTITIES:
-{json.dumps(entities.model_dump(), indent=2)}
-
-CLINICAL SCENARIO GUIDANCE:
-{scenario_content}
-
-BILLING REFERENCE:
-{corpus_context}
-
-YOUR TASK: MAXIMIZE RVU by identifying ALL opportunities to increase billing through:
-
-1. UPGRADES (check EVERY count-based procedure in Plan):
-   A. UNDERTREATMENT: Fewer sites treated than exam shows exist
-      → "4 plaques injected" but exam shows 8 → opportunity to treat all 8
-   B. AMBIGUOUS COUNT: No count documented → only baseline tier billable
-      → "nail debridement performed" (no count) but exam shows 8 dystrophic nails
-      → opportunity: document/treat all 8 to bill 11721 instead of 11720
-   C. SUBOPTIMAL TIER: Count specified but below tier threshold
-      → "5 AKs treated" → just 1 more gets 17003x5 instead of 17003x4
+1. UPGRADES (check EVERY count-based procedure in Plan):
+   A. UNDERTREATMENT: Fewer sites treated than exam shows exist
+      → "4 plaques injected" but exam shows 8 → opportunity to treat all 8
+   B. AMBIGUOUS COUNT: No count documented → only baseline tier billable
+      → "nail debridement performed" (no count) but exam shows 8 dystrophic nails
+      → opportunity: document/treat all 8 to bill 11721 instead of 11720
+   C. SUBOPTIMAL TIER: Count specified but below tier threshold
+      → "5 AKs treated" → just 1 more gets 17003x5 instead of 17003x4
 
 2. ADDITIONS: Procedures NOT done that clinical findings clearly support
    → Thick plaques noted but no injection given → opportunity for IL injection
@@ -1257,10 +681,10 @@ findings ARE present - the provider will deselect anything that doesn't apply.
 4. Be AGGRESSIVE. Output the maximum plausible billing. Provider deselects what doesn't apply.
 
 OUTPUT FORMAT for E/M:
-{{"category": "visit_level", "finding": "[What in this note supports higher E/M]",
+{"category": "visit_level", "finding": "[What in this note supports higher E/M]",
   "opportunity": "E/M upgrade to 99214", "action": "Document: [EXACTLY what to add]",
-  "potential_code": {{"code": "99214", "description": "Moderate MDM (add -25 mod if billing with procedure)", "wRVU": 1.92, "diagnosis": "Acne"}},
-  "teaching_point": "[Why this level is appropriate and defensible]"}}
+  "potential_code": {"code": "99214", "description": "Moderate MDM (add -25 mod if billing with procedure)", "wRVU": 1.92, "diagnosis": "Acne"},
+  "teaching_point": "[Why this level is appropriate and defensible]"}
 
 NOTE: Output just the E/M code (99213, 99214, 99215) without the modifier.
 The -25 modifier is added when billing E/M same-day with a procedure - mention this in description.
@@ -1308,7 +732,7 @@ DO NOT suggest when:
 
 For medicolegal opportunities, use:
 - category: "medicolegal"
-- potential_code: {{"code": "LEGAL", "description": "[What to document]", "wRVU": 0}}
+- potential_code: {"code": "LEGAL", "description": "[What to document]", "wRVU": 0}
 
 ═══════════════════════════════════════════════════════════════════════════════
 CATEGORY 11: DOCUMENTATION-DRIVEN UPGRADES (same work, higher billing)
@@ -1358,10 +782,10 @@ but documentation upgrades justify higher-paying codes. Look for these actively!
    • Multiple diagnoses → list each one addressed
 
 For documentation upgrades, use category: "documentation_upgrade"
-{{"category": "documentation_upgrade", "finding": "[What was done]",
+{"category": "documentation_upgrade", "finding": "[What was done]",
   "opportunity": "[Higher code available]", "action": "Document: [specific language]",
-  "potential_code": {{"code": "12031", "description": "Intermediate repair - document layered closure", "wRVU": 1.95}},
-  "teaching_point": "[Why this documentation justifies the upgrade]"}}
+  "potential_code": {"code": "12031", "description": "Intermediate repair - document layered closure", "wRVU": 1.95},
+  "teaching_point": "[Why this documentation justifies the upgrade]"}
 
 ═══════════════════════════════════════════════════════════════════════════════
 OUTPUT RULES
@@ -1378,15 +802,15 @@ OUTPUT RULES
 5. CLINICAL SPECIFICITY: Reference actual findings from the note
 
 RESPOND WITH JSON ONLY:
-{{"opportunities": [
-  {{"category": "procedure|visit_level|comorbidity|medicolegal|documentation_upgrade",
+{"opportunities": [
+  {"category": "procedure|visit_level|comorbidity|medicolegal|documentation_upgrade",
     "finding": "[Specific clinical finding from note]",
     "opportunity": "[What could be billed or documented]",
     "action": "[What provider should do]",
-    "potential_code": {{"code": "X", "description": "X", "wRVU": 0.00}},
-    "teaching_point": "[Billing tip or medicolegal rationale]"}}
+    "potential_code": {"code": "X", "description": "X", "wRVU": 0.00},
+    "teaching_point": "[Billing tip or medicolegal rationale]"}
 ], "optimized_note": "[Full rewritten note with all opportunities documented as performed]",
-"total_potential_additional_wRVU": 0.00}}
+"total_potential_additional_wRVU": 0.00}
 
 ═══════════════════════════════════════════════════════════════════════════════
 ABSOLUTE PROHIBITION - NEVER INVENT NUMBERS
@@ -1416,616 +840,1275 @@ OPTIMIZED NOTE RULES:
 - NEVER INVENT NUMBERS - use qualitative descriptors only unless number is in original
 - For genital destruction: INCLUDE extensive justification language by default"""
 
-        system = """You are an expert dermatology billing educator and optimizer. MAXIMIZE RVU.
+REGENERATE_NOTE_SYSTEM = """Medical documentation expert. Create minimal, defensible notes that support billing.
 
-═══════════════════════════════════════════════════════════════════════════════
-ABSOLUTE RULES - VIOLATIONS ARE UNACCEPTABLE
-═══════════════════════════════════════════════════════════════════════════════
-1. NEVER INVENT NUMBERS - if original note has no count, do NOT add one
-   - Use "multiple", "several", "extensive" - NEVER fabricate counts like "3" or "4"
-   - Inventing lesion counts is MEDICAL FRAUD
-2. GENITAL DESTRUCTION: Include extensive justification in optimized_note by default
-   - Always add: "extensive requiring extended treatment time", "multiple confluent lesions", etc.
+ABSOLUTE RULE - NEVER HALLUCINATE NUMBERS:
+- NEVER invent counts, measurements, or quantities not in the original note
+- If original has no count, keep description vague (e.g., "vulvar condylomata" not "8 vulvar condylomata")
+- For extensive procedures, use QUALITATIVE language: "extensive treatment", "multiple lesions", "broad area"
+- Fabricating specific numbers is MEDICAL FRAUD and creates massive liability
 
-CRITICAL RULES - RVU MAXIMIZATION:
-1. CHECK EVERY count-based procedure in Plan for upgrade potential:
-   - Extract count using principle-based approach (digits, bilateral, listed sites)
-   - Compare to exam findings - more treatable sites = upgrade opportunity
-   - Ambiguous count (no count in procedure) = upgrade opportunity (baseline tier only billable)
-2. ONE card per code family - aggregate related findings
-3. Be SPECIFIC - reference actual findings, target counts, tier thresholds
-4. Include accurate wRVU values from reference
-5. HIGH-VALUE first (procedures > E/M)
-6. ONE medicolegal card if safety documentation missing
+CRITICAL: Preserve the original note's format and structure:
+- If input has sections (HPI, Physical Exam, Assessment, Plan), keep those sections
+- If input is SOAP format, output SOAP format
+- If input is free-text paragraph, output paragraph
 
-UPGRADE DETECTION CHECKLIST:
-□ Nail debridement done? → Check: exam nail count vs treated count → suggest 6+ for 11721
-□ IL injection done? → Check: exam lesion count vs injected count → suggest 8+ for 11901
-□ AK destruction done? → Check: exam AK count vs treated count → suggest 15+ for 17004
-□ Benign destruction done? → Check: exam lesion count vs treated count → suggest 15+ for 17111
-□ Count ambiguous in any above? → This IS an upgrade opportunity (baseline only billable)
+Write the note AS IF all selected items were actually performed during the visit.
+- If an injection opportunity is selected, document that the injection WAS done
+- If an E/M upgrade is selected, document the MDM complexity that supports it
+- The note should be copy-paste ready to support billing all selected codes
 
-E/M CRITICAL: Pick ONE specific code, not a range. No -25 in code field.
+MEDICOLEGAL DOCUMENTATION PHILOSOPHY:
+- Document the MINIMUM NECESSARY to justify each billing code
+- Over-documentation creates malpractice liability - every detail can be cross-examined by attorneys
+- Concise, factual notes are legally safer than verbose, detailed ones
+- BUT: Always document safety-critical items (suspicious lesions, patient counseling, refusals, follow-up)
+- "If it wasn't documented, it wasn't done" - this applies to safety items especially
+- Use standard terminology, brief statements, objective findings
 
-USE potential_code (single code) for:
-- E/M levels, count-based procedures, medicolegal items
+NEVER include Time, Coding, or billing code sections. Output only pure clinical documentation.
+Output only the complete note text, no commentary."""
 
-USE code_options ONLY for:
-- Truly mutually exclusive tiers (genital: simple vs extensive)
 
-OUTPUT: Valid JSON only."""
+_JSON_DECODER = json.JSONDecoder()
+
 
+def _find_json_object(text: str) -> Optional[dict]:
+    """
+    Decode the first complete JSON object embedded in prose.
+
+    Each candidate "{" is decoded in place, so braces inside strings and text
+    after the object are handled. After a failed attempt the search resumes
+    past the point where decoding failed, which keeps the scan linear and
+    never falls back to an object nested inside a truncated one.
+    """
+    start = text.find("{")
+    while start >= 0:
         try:
-            response = self._call_llm(prompt, system=system, max_tokens=8192)
-            data = self._parse_json_response(response)
-
-            opportunities = []
-            for o in data.get("opportunities", []):
-                potential_code = None
-                if o.get("potential_code"):
-                    pc = o["potential_code"]
-                    potential_code = PotentialCode(
-                        code=pc["code"],
-                        description=pc.get("description", ""),
-                        wRVU=float(pc.get("wRVU", 0)),
-                        diagnosis=pc.get("diagnosis"),
-                    )
-
-                code_options = None
-                if o.get("code_options"):
-                    from .models import CodeOption
-                    code_options = [
-                        CodeOption(
-                            code=co["code"],
-                            description=co.get("description", ""),
-                            wRVU=float(co.get("wRVU", 0)),
-                            threshold=co.get("threshold", ""),
-                        )
-                        for co in o["code_options"]
-                    ]
-
-                opportunities.append(FutureOpportunity(
-                    category=o["category"],
-                    finding=o["finding"],
-                    opportunity=o["opportunity"],
-                    action=o["action"],
-                    potential_code=potential_code,
-                    code_options=code_options,
-                    teaching_point=o["teaching_point"],
-                ))
-
-            return FutureOpportunities(
-                opportunities=opportunities,
-                optimized_note=data.get("optimized_note"),
-                total_potential_additional_wRVU=float(data.get("total_potential_additional_wRVU", 0)),
-            )
-        except Exception as e:
-            return FutureOpportunities(
-                opportunities=[],
-                optimized_note=None,
-                total_potential_additional_wRVU=0.0,
-            )
+            return _JSON_DECODER.raw_decode(text, start)[0]
+        except json.JSONDecodeError as e:
+            start = text.find("{", max(e.pos, start + 1))
+    return None
+
+
+class _StreamingArrayParser:
+    """
+    Pull complete elements of a JSON array out of text that arrives in pieces.
+
+    The array is the value of the first occurrence of key in the stream; each
+    element is decoded as soon as its closing bracket has arrived, without
+    waiting for the rest of the document. Decoded text is dropped from the
+    buffer, so each chunk only re-scans the element still in progress.
+    """
+
+    _decoder = _JSON_DECODER
+    _separator = re.compile(r"[\s,]*")
+
+    def __init__(self, key: str):
+        self._key = f'"{key}"'
+        self._buffer = ""
+        self._pos: Optional[int] = None
+        self._done = False
+
+    def feed(self, text: str) -> list:
+        """Add streamed text and return the array elements it completed."""
+        items = []
+        if self._done:
+            return items
+        self._buffer += text
+
+        if self._pos is None:
+            key_pos = self._buffer.find(self._key)
+            if key_pos < 0:
+                return items
+            bracket = self._buffer.find("[", key_pos + len(self._key))
+            if bracket < 0:
+                return items
+            self._pos = bracket + 1
+
+        while True:
+            pos = self._separator.match(self._buffer, self._pos).end()
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == "]":
+                self._done = True
+                break
+            if self._buffer[pos] in "{[" and "}" not in text and "]" not in text:
+                break  # An object or array element can only close on a bracket
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break  # Element not complete yet
+            items.append(item)
+            self._pos = end
+
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        return items
+
+
+# Response lists are validated in a single pydantic-core call each
+_BILLING_CODES = TypeAdapter(list[BillingCode])
+_ENHANCEMENTS = TypeAdapter(list[DocumentationEnhancement])
+_OPPORTUNITIES = TypeAdapter(list[FutureOpportunity])
+
+
+def _billing_code_fields(c: dict) -> dict:
+    """Normalize one entry of an LLM "codes" array into BillingCode fields."""
+    return {
+        "code": c["code"],
+        "modifier": c.get("modifier"),
+        "description": c.get("description", ""),
+        "wRVU": float(c.get("wRVU", 0)),
+        "units": int(c.get("units", 1)),
+        "status": c.get("status", "supported"),
+        "documentation_note": c.get("documentation_note"),
+        "diagnosis": c.get("diagnosis"),
+    }
+
+
+def _billing_codes(items: list) -> list[BillingCode]:
+    """Build BillingCodes from an LLM "codes" array."""
+    return _BILLING_CODES.validate_python([_billing_code_fields(c) for c in items])
+
+
+def _enhancement_fields(e: dict) -> dict:
+    """Normalize one entry of an LLM "enhancements" array into DocumentationEnhancement fields."""
+    return {
+        "issue": e["issue"],
+        "current_code": e.get("current_code"),
+        "current_wRVU": float(e.get("current_wRVU", 0)),
+        "suggested_addition": e["suggested_addition"],
+        "enhanced_code": e.get("enhanced_code"),
+        "enhanced_wRVU": float(e.get("enhanced_wRVU", 0)),
+        "delta_wRVU": float(e.get("delta_wRVU", 0)),
+        "priority": e.get("priority", "medium"),
+        "count_family": e.get("count_family"),
+        "default_count": int(e["default_count"]) if e.get("default_count") else None,
+        "upgrade_family": e.get("upgrade_family"),
+        "default_extensive": e.get("default_extensive"),
+        "diagnosis": e.get("diagnosis"),
+    }
+
+
+def _opportunity_fields(o: dict) -> dict:
+    """Normalize one entry of an LLM "opportunities" array into FutureOpportunity fields."""
+    potential_code = None
+    if o.get("potential_code"):
+        pc = o["potential_code"]
+        potential_code = {
+            "code": pc["code"],
+            "description": pc.get("description", ""),
+            "wRVU": float(pc.get("wRVU", 0)),
+            "diagnosis": pc.get("diagnosis"),
+        }
 
-    async def identify_opportunities_async(
-        self,
-        note_text: str,
-        entities: ExtractedEntities,
-        scenario_content: str,
-        corpus_context: str,
-    ) -> FutureOpportunities:
-        """Async version of identify_opportunities."""
-        prompt = f"""You are a dermatology billing optimization expert. Analyze this clinical note to identify MISSED billing opportunities - procedures/services that COULD have been performed but WERE NOT.
+    code_options = None
+    if o.get("code_options"):
+        code_options = [
+            {
+                "code": co["code"],
+                "description": co.get("description", ""),
+                "wRVU": float(co.get("wRVU", 0)),
+                "threshold": co.get("threshold", ""),
+            }
+            for co in o["code_options"]
+        ]
 
-CLINICAL NOTE:
-{note_text}
+    return {
+        "category": o["category"],
+        "finding": o["finding"],
+        "opportunity": o["opportunity"],
+        "action": o["action"],
+        "potential_code": potential_code,
+        "code_options": code_options,
+        "teaching_point": o["teaching_point"],
+    }
 
-EXTRACTED ENTITIES:
-{json.dumps(entities.model_dump(), indent=2)}
 
-CLINICAL SCENARIO GUIDANCE:
-{scenario_content}
+def _total_wRVU(data: dict, codes: list[BillingCode]) -> float:
+    """The response's total_wRVU, or the sum over its codes when it is missing."""
+    if "total_wRVU" in data:
+        return float(data["total_wRVU"])
+    return float(sum(c.wRVU * c.units for c in codes))
 
-BILLING REFERENCE:
-{corpus_context}
 
-YOUR TASK: MAXIMIZE RVU by identifying ALL opportunities to increase billing through:
+def _entities_json(entities: ExtractedEntities) -> str:
+    """Serialize extracted entities as indented JSON for a prompt."""
+    return entities.model_dump_json(indent=2)
 
-1. UPGRADES (check EVERY count-based procedure in Plan):
-   A. UNDERTREATMENT: Fewer sites treated than exam shows exist
-      → "4 plaques injected" but exam shows 8 → opportunity to treat all 8
-   B. AMBIGUOUS COUNT: No count documented → only baseline tier billable
-      → "nail debridement performed" (no count) but exam shows 8 dystrophic nails
-      → opportunity: document/treat all 8 to bill 11721 instead of 11720
-   C. SUBOPTIMAL TIER: Count specified but below tier threshold
-      → "5 AKs treated" → just 1 more gets 17003x5 instead of 17003x4
 
-2. ADDITIONS: Procedures NOT done that clinical findings clearly support
-   → Thick plaques noted but no injection given → opportunity for IL injection
+def _enhancements_error(error: Exception) -> tuple[CurrentBilling, DocumentationEnhancements]:
+    """Empty enhancement analysis recording why it failed."""
+    return (
+        CurrentBilling(codes=[], total_wRVU=0.0, documentation_gaps=[f"Error: {str(error)}"]),
+        DocumentationEnhancements(enhancements=[], enhanced_total_wRVU=0.0, improvement=0.0),
+    )
 
-═══════════════════════════════════════════════════════════════════════════════
-CORE PRINCIPLES - RVU MAXIMIZATION
-═══════════════════════════════════════════════════════════════════════════════
-1. UPGRADE PRINCIPLE: For EVERY count-based procedure in Plan:
-   - Extract count from procedure text (use principle-based extraction)
-   - Compare to exam findings - are there more treatable sites?
-   - Check tier thresholds - could treating more bump to next tier?
-   - If upgrade possible → create opportunity card with SPECIFIC target count
 
-2. COUNT EXTRACTION: Use same principles as enhancements:
-   - Explicit numbers, bilateral (=2), listed sites, anatomic implications
-   - If count IS specified: check for upgrade potential against exam
-   - If count NOT specified: this IS an upgrade opportunity (ambiguous → baseline only)
+def _opportunities_error() -> FutureOpportunities:
+    """Empty opportunity analysis, used when the LLM call or parsing fails."""
+    return FutureOpportunities(
+        opportunities=[],
+        optimized_note=None,
+        total_potential_additional_wRVU=0.0,
+    )
 
-3. TIER THRESHOLD AWARENESS:
-   - Nail: 1-5 (11720) → 6+ (11721) [threshold: 6]
-   - IL injection: 1-7 (11900) → 8+ (11901) [threshold: 8]
-   - Benign: 1-14 (17110) → 15+ (17111) [threshold: 15]
-   - AK: first (17000) + 2-14 (17003) → 15+ (17004) [threshold: 15]
 
-4. CLINICAL APPROPRIATENESS: Only suggest what's medically reasonable.
+def _billing_error(error: Exception) -> CurrentBilling:
+    """Empty CurrentBilling recording why the analysis failed."""
+    return CurrentBilling(
+        codes=[],
+        total_wRVU=0.0,
+        documentation_gaps=[f"Error analyzing billing: {str(error)}"],
+    )
 
-5. ONE CARD PER CODE FAMILY: Aggregate related opportunities.
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 1: THERAPEUTIC INJECTIONS
-═══════════════════════════════════════════════════════════════════════════════
-CLINICAL TRIGGERS:
-• Thick psoriasis plaques (especially if topicals failing)
-• Recalcitrant eczema patches
-• Keloids or hypertrophic scars
-• Alopecia areata patches
-• Lichen simplex chronicus
-• Granuloma annulare
-• Cystic acne
+# Attempts after the first for rate limits (429), overload/server errors (5xx),
+# timeouts and dropped connections; the SDK backs off exponentially with jitter
+LLM_MAX_RETRIES = 4
 
-BILLING CODES (use potential_code with count):
-• 11900: IL injection 1-7 lesions (0.52 wRVU)
-• 11901: IL injection 8+ lesions (0.82 wRVU)
+# Malformed LLM output (bad JSON, failed validation, missing keys, wrong types).
+# These fall back to empty results; API errors that survive retries propagate
+RESPONSE_ERRORS = (ValueError, KeyError, TypeError, AttributeError)
 
-CRITICAL: Multiple injection sites for DIFFERENT conditions (e.g., psoriasis plaques + keloid)
-are SEPARATE opportunities. Each becomes a count input that aggregates in the UI.
+# HTTP/2 multiplexes concurrent requests over one connection; needs the h2 package
+HTTP2_ENABLED = find_spec("h2") is not None
 
-Example finding: "Thick psoriasis plaques on elbows not responding to topicals"
-Example action: "IL triamcinolone 10mg/mL injection to thick plaques"
+# Batch status checks back off from the caller's poll interval up to this many seconds
+BATCH_POLL_MAX_INTERVAL = 60.0
+# Batches may take up to 24 hours; give up (and cancel) after this many seconds
+BATCH_MAX_WAIT = 3600.0
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 2: DESTRUCTION - PREMALIGNANT (AKs)
-═══════════════════════════════════════════════════════════════════════════════
-CLINICAL TRIGGERS:
-• Sun-damaged skin in sun-exposed areas
-• History of skin cancer
-• Actinic keratoses noted on exam
-• Rough/scaly patches on face, scalp, arms, hands
+# Runs the regex entity pass alongside blocking LLM calls (threads start lazily)
+_REGEX_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dermbill-regex")
 
-BILLING CODES (use potential_code - count-based):
-• 17000: First AK destruction (0.61 wRVU)
-• 17003: Each additional AK 2-14 (+0.09 wRVU each)
-• 17004: 15+ AKs flat rate (2.19 wRVU)
 
-Example: 10 AKs = 17000 + 17003x9 = 0.61 + 0.81 = 1.42 wRVU
+@lru_cache(maxsize=None)
+def _shared_http_client():
+    """Process-wide pooled HTTP client for synchronous API calls."""
+    from anthropic import DefaultHttpxClient
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 3: DESTRUCTION - BENIGN LESIONS
-═══════════════════════════════════════════════════════════════════════════════
-CLINICAL TRIGGERS:
-• Seborrheic keratoses (symptomatic - itching, irritation, catching on clothes)
-• Skin tags in friction areas
-• Verrucae (warts)
-• Molluscum contagiosum
-• Cherry angiomas (if symptomatic)
+    return DefaultHttpxClient(http2=HTTP2_ENABLED)
 
-BILLING CODES (use potential_code with count):
-• 17110: Benign destruction 1-14 lesions (0.70 wRVU)
-• 17111: Benign destruction 15+ lesions (1.23 wRVU)
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 4: DESTRUCTION - SPECIAL SITES (Genital, Anal, Perianal)
-═══════════════════════════════════════════════════════════════════════════════
-CRITICAL: Special anatomic sites have SITE-SPECIFIC codes that pay MORE than generic
-benign destruction codes (17110/17111). ALWAYS use site-specific codes when applicable.
+# Async connections belong to the event loop that opened them, so each loop
+# (the API server's, or one per asyncio.run in the sync wrappers) gets its own
+# pool; an entry goes away with its loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = (
+    weakref.WeakKeyDictionary()
+)
 
-CLINICAL TRIGGERS:
-• Condylomata acuminata (genital/anal warts)
-• Genital/anal molluscum
-• Perianal skin tags
-• Any benign lesion in genital, anal, or perianal region
 
-SIMPLE vs EXTENSIVE DISTINCTION (judgment call - document to justify):
-• SIMPLE: Straightforward destruction, minimal complexity
-• EXTENSIVE: Choose when ANY of the following apply and DOCUMENT why:
-  - Multiple lesions requiring additional time/effort
-  - Large or confluent lesions
-  - Difficult anatomic location requiring careful technique
-  - Multiple treatment modalities needed
-  - Significant patient discomfort management
-  - Extensive surface area involvement
+def _shared_async_http_client():
+    """Pooled HTTP client for async API calls on the running event loop."""
+    loop = asyncio.get_running_loop()
+    http_client = _async_http_clients.get(loop)
+    if http_client is None:
+        from anthropic import DefaultAsyncHttpxClient
+
+        http_client = _async_http_clients[loop] = DefaultAsyncHttpxClient(http2=HTTP2_ENABLED)
+    return http_client
+
+
+class LLMClient:
+    """Client for LLM-powered billing analysis."""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        cache_dir: Optional[Path] = None,
+        use_batch_api: Optional[bool] = None,
+        entity_model: Optional[str] = None,
+    ):
+        """
+        Initialize the LLM client.
+
+        Args:
+            api_key: Anthropic API key. If None, uses ANTHROPIC_API_KEY env var.
+            model: Model to use. If None, uses ANTHROPIC_MODEL env var or default.
+            cache_dir: Directory for the on-disk response cache. If None, uses
+                DERMBILL_LLM_CACHE_DIR env var; responses are only kept in memory
+                when neither is set.
+            use_batch_api: Send multi-note analyses through the Message Batches
+                API. If None, uses DERMBILL_USE_BATCH_API env var (default off).
+            entity_model: Smaller model for entity extraction, which only fills in
+                a fixed schema. If None, uses ANTHROPIC_ENTITY_MODEL env var or default.
+        """
+        self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY not set")
+
+        self.model = model or os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
+        self.entity_model = entity_model or os.getenv("ANTHROPIC_ENTITY_MODEL", "claude-haiku-4-5")
+        # Imported here so code paths that never call the LLM skip loading the SDK
+        from anthropic import BadRequestError
+
+        # A request the API rejects outright won't succeed on retry either
+        self._fallback_errors = (BadRequestError, *RESPONSE_ERRORS)
+
+        cache_dir = cache_dir or os.getenv("DERMBILL_LLM_CACHE_DIR")
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else None
+        self._response_cache: OrderedDict[str, str] = OrderedDict()
+        self._disk_lock = threading.Lock()
+        self._output_tokens_ema: dict[str, float] = {}
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+        if use_batch_api is None:
+            use_batch_api = os.getenv("DERMBILL_USE_BATCH_API", "").lower() in ("1", "true", "yes")
+        self.use_batch_api = use_batch_api
+
+    # The SDK clients are created on first use, so a caller that only makes
+    # async calls (like the analyzer) or only sync ones never builds an HTTP
+    # pool and TLS context it doesn't use. Sync clients share one process-wide
+    # connection pool and async clients one pool per event loop, so new clients
+    # reuse open TLS connections without carrying them across loops.
+
+    @cached_property
+    def client(self):
+        """Synchronous API client."""
+        from anthropic import Anthropic
+
+        return Anthropic(
+            api_key=self.api_key,
+            timeout=120.0,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=_shared_http_client(),
+        )
+
+    @property
+    def async_client(self):
+        """Async API client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from anthropic import AsyncAnthropic
+
+            client = self._async_clients[loop] = AsyncAnthropic(
+                api_key=self.api_key,
+                timeout=120.0,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=_shared_async_http_client(),
+            )
+        return client
+
+    def _cache_key(self, kwargs: dict) -> str:
+        """Hash the full request (model, system, messages, limits) into a cache key."""
+        return hashlib.sha256(orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def _cached_response(self, key: str) -> Optional[str]:
+        """Look up a response in memory, then on disk."""
+        response = self._response_cache.get(key)
+        if response is not None:
+            self._response_cache.move_to_end(key)
+            return response
+
+        row = self._disk_execute(
+            "SELECT response FROM responses WHERE key = ? AND created_at > ?",
+            (key, int(time.time()) - RESPONSE_CACHE_TTL),
+        )
+        if row is None:
+            return None
+        response = row[0]
+        self._remember_response(key, response)
+        return response
+
+    def _remember_response(self, key: str, response: str) -> None:
+        """Keep a response in the in-memory cache, evicting the least recently used."""
+        self._response_cache[key] = response
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+
+    def _store_response(self, key: str, response: str) -> None:
+        """Cache a response in memory and, if configured, on disk."""
+        self._remember_response(key, response)
+        self._disk_execute(
+            "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+            (key, response, int(time.time())),
+        )
+
+    def _forget_response(self, key: str) -> None:
+        """Drop a response that failed to parse from both caches, so the call is made again."""
+        self._response_cache.pop(key, None)
+        self._disk_execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    @cached_property
+    def _disk_cache(self) -> Optional[sqlite3.Connection]:
+        """
+        Open the on-disk response cache once per client, creating it on first use.
+
+        The connection is shared between threads under _disk_lock; SQLite's own
+        locking keeps it safe to share the file between worker processes.
+        None if no cache directory is configured or it cannot be opened.
+        """
+        if self.cache_dir is None:
+            return None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(
+                self.cache_dir / "responses.sqlite3",
+                timeout=5.0,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at INTEGER NOT NULL)"
+            )
+        except (OSError, sqlite3.Error):
+            return None
+        return db
+
+    def _disk_execute(self, sql: str, params: tuple) -> Optional[tuple]:
+        """Run one statement against the disk cache, returning its first row; best-effort."""
+        db = self._disk_cache
+        if db is None:
+            return None
+        try:
+            with self._disk_lock:
+                return db.execute(sql, params).fetchone()
+        except sqlite3.Error:
+            return None
+
+    def close_disk_cache(self) -> None:
+        """Close the on-disk response cache; the next lookup reopens it."""
+        db = self.__dict__.pop("_disk_cache", None)
+        if db is not None:
+            with self._disk_lock:
+                db.close()
+
+    def _message_kwargs(
+        self,
+        prompt: str,
+        system: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        context_blocks: Optional[list[str]],
+        tool: Optional[dict] = None,
+        model: Optional[str] = None,
+    ) -> dict:
+        """
+        Build messages.create arguments, marking the reusable prefix for prompt caching.
+
+        The system prompt and each context block are tagged with an ephemeral
+        cache_control breakpoint, so repeated calls with the same system prompt
+        and reference material are served from Anthropic's prompt cache. Context
+        blocks come before the prompt, whose note-specific text is never cached.
+        When a tool is given, the model is forced to answer by calling it.
+        The call uses the analysis model unless another model is given.
+        """
+        if context_blocks:
+            content = [
+                {"type": "text", "text": block, "cache_control": {"type": "ephemeral"}}
+                for block in context_blocks
+            ]
+            content.append({"type": "text", "text": prompt})
+        else:
+            content = prompt
+
+        kwargs = {
+            "model": model or self.model,
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": content}],
+            "temperature": temperature,
+        }
+
+        if system:
+            kwargs["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+        if tool:
+            kwargs["tools"] = [tool]
+            kwargs["tool_choice"] = {"type": "tool", "name": tool["name"]}
+
+        return kwargs
+
+    @staticmethod
+    def _response_text(response, tool: Optional[dict]) -> str:
+        """
+        Response text, or the forced tool call's input serialized as JSON.
+
+        All text blocks are joined, so a response split across several blocks
+        is kept whole and an empty one yields "" for the JSON parser to reject.
+        """
+        if tool:
+            for block in response.content:
+                if block.type == "tool_use":
+                    return orjson.dumps(block.input).decode()
+        return "".join(getattr(block, "text", "") for block in response.content)
+
+    def _prepare_call(
+        self,
+        prompt: str,
+        system: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        context_blocks: Optional[list[str]],
+        tool: Optional[dict],
+        output_budget: Optional[str],
+        model: Optional[str] = None,
+    ) -> tuple[dict, Optional[str]]:
+        """
+        Build messages.create arguments and the response cache key for a call.
+
+        With an output_budget, a text call stops after the closing JSON fence and
+        max_tokens is lowered to the adaptive limit for that call site. The
+        cache key is taken at the full max_tokens, so it does not drift with
+        the adaptive limit.
+        """
+        kwargs = self._message_kwargs(
+            prompt, system, max_tokens, temperature, context_blocks, tool, model
+        )
+        if output_budget and not tool:
+            kwargs["stop_sequences"] = JSON_STOP_SEQUENCES
+        key = self._cache_key(kwargs) if temperature == 0.0 else None
+        if output_budget:
+            kwargs["max_tokens"] = self._adaptive_max_tokens(output_budget, max_tokens)
+        return kwargs, key
+
+    def _adaptive_max_tokens(self, output_budget: str, ceiling: int) -> int:
+        """Output limit for a call site: recent usage plus headroom, or the ceiling without history."""
+        ema = self._output_tokens_ema.get(output_budget)
+        if ema is None:
+            return ceiling
+        return max(MIN_ADAPTIVE_MAX_TOKENS, min(ceiling, int(ema * OUTPUT_TOKENS_HEADROOM)))
+
+    def _record_output_tokens(self, output_budget: str, response) -> None:
+        """Fold a response's output token count into its call site's moving average."""
+        used = response.usage.output_tokens
+        ema = self._output_tokens_ema.get(output_budget)
+        self._output_tokens_ema[output_budget] = (
+            used if ema is None else ema + OUTPUT_TOKENS_EMA_WEIGHT * (used - ema)
+        )
+
+    def _call_llm(
+        self,
+        prompt: str,
+        system: Optional[str] = None,
+        max_tokens: int = 4096,
+        temperature: float = 0.0,
+        context_blocks: Optional[list[str]] = None,
+        bypass_cache: bool = False,
+        cache: bool = True,
+        tool: Optional[dict] = None,
+        output_budget: Optional[str] = None,
+        model: Optional[str] = None,
+        parse: Optional[Callable[[str], Any]] = None,
+    ) -> Any:
+        """
+        Make a call to the LLM.
+
+        Deterministic calls (temperature 0) are memoized on the full request, so
+        re-analyzing the same note returns the earlier response without an API call.
 
-DOCUMENTATION TIP: To justify extensive, note factors like "multiple confluent lesions",
-"required extended treatment time due to [reason]", "difficult anatomic access", etc.
+        Args:
+            prompt: User prompt
+            system: System prompt
+            max_tokens: Maximum tokens in response
+            temperature: Temperature for sampling
+            context_blocks: Reference material sent ahead of the prompt and cached
+            bypass_cache: Always call the API, still caching the new response
+            cache: Neither read nor write the response cache when False, for
+                calls that should produce a fresh response every time
+            tool: Tool the model must call; its input is returned as JSON text
+            output_budget: Call site name for a JSON response; enables the
+                adaptive output limit (max_tokens becomes the ceiling) and stops
+                generation after the JSON code block
+            model: Model for this call; defaults to the analysis model
+            parse: Builds the result from the response text. A response it
+                rejects is not cached, and a cached one it rejects is dropped
+                and requested again
 
-BILLING CODES BY SITE (use code_options - simple vs extensive):
+        Returns:
+            LLM response text, or parse's result for it
+        """
+        kwargs, key = self._prepare_call(
+            prompt, system, max_tokens, temperature, context_blocks, tool, output_budget, model
+        )
+        if not cache:
+            key = None
+        if key is not None and not bypass_cache:
+            cached = self._cached_response(key)
+            if cached is not None:
+                try:
+                    return parse(cached) if parse else cached
+                except RESPONSE_ERRORS:
+                    self._forget_response(key)
 
-MALE GENITAL:
-• 54050: Simple destruction (0.61 wRVU) - 1-2 small lesions
-• 54055: Extensive destruction (1.50 wRVU) - multiple/large lesions
-• 54056: Cryosurgery penile lesions (1.26 wRVU) - cryo specifically
-• 54057: Laser destruction penile lesions (1.50 wRVU) - laser specifically
+        response = self.client.messages.create(**kwargs)
+        if response.stop_reason == "max_tokens" and kwargs["max_tokens"] < max_tokens:
+            # The adaptive limit was too tight; retry once with the full ceiling
+            kwargs["max_tokens"] = max_tokens
+            response = self.client.messages.create(**kwargs)
+        if output_budget:
+            self._record_output_tokens(output_budget, response)
+
+        text = self._response_text(response, tool)
+        # Parse before caching so a malformed response is never served again
+        result = parse(text) if parse else text
+        # A response cut off at the ceiling is incomplete; don't serve it again
+        if key is not None and response.stop_reason != "max_tokens":
+            self._store_response(key, text)
+        return result
 
-FEMALE GENITAL (simple vs extensive is JUDGMENT CALL - NOT count-based):
-• 56501: Simple vulvar destruction (0.70 wRVU) - DEFAULT when note lacks extensive documentation
-• 56515: Extensive vulvar destruction (1.87 wRVU) - requires documentation of extensive effort/time/technique
-NOTE: Always bill 56501 in current billing. Create EXTENSIVE_UPGRADE enhancement to let user toggle to 56515.
+    async def _call_llm_async(
+        self,
+        prompt: str,
+        system: Optional[str] = None,
+        max_tokens: int = 4096,
+        temperature: float = 0.0,
+        context_blocks: Optional[list[str]] = None,
+        bypass_cache: bool = False,
+        cache: bool = True,
+        tool: Optional[dict] = None,
+        output_budget: Optional[str] = None,
+        model: Optional[str] = None,
+        parse: Optional[Callable[[str], Any]] = None,
+    ) -> Any:
+        """Async version of _call_llm."""
+        kwargs, key = self._prepare_call(
+            prompt, system, max_tokens, temperature, context_blocks, tool, output_budget, model
+        )
+        if not cache:
+            key = None
+        if key is not None and not bypass_cache:
+            cached = self._cached_response(key)
+            if cached is not None:
+                try:
+                    return parse(cached) if parse else cached
+                except RESPONSE_ERRORS:
+                    self._forget_response(key)
 
-ANAL/PERIANAL (simple vs extensive is JUDGMENT CALL - NOT count-based):
-• 46900: Simple anal destruction (0.91 wRVU) - DEFAULT when note lacks extensive documentation
-• 46910: Extensive anal destruction (1.51 wRVU) - requires documentation of extensive effort/time/technique
-NOTE: Always bill simple code in current billing. Create EXTENSIVE_UPGRADE enhancement to let user toggle.
-• 46916: Cryosurgery anal lesions (1.86 wRVU) - cryo specifically
-• 46917: Laser destruction anal lesions (1.95 wRVU) - laser specifically
+        response = await self.async_client.messages.create(**kwargs)
+        if response.stop_reason == "max_tokens" and kwargs["max_tokens"] < max_tokens:
+            # The adaptive limit was too tight; retry once with the full ceiling
+            kwargs["max_tokens"] = max_tokens
+            response = await self.async_client.messages.create(**kwargs)
+        if output_budget:
+            self._record_output_tokens(output_budget, response)
+
+        text = self._response_text(response, tool)
+        # Parse before caching so a malformed response is never served again
+        result = parse(text) if parse else text
+        # A response cut off at the ceiling is incomplete; don't serve it again
+        if key is not None and response.stop_reason != "max_tokens":
+            self._store_response(key, text)
+        return result
+
+    async def _stream_array(self, request: dict, array_key: str) -> AsyncIterator[dict]:
+        """
+        Stream a call and yield the elements of one JSON array in its response as they complete.
 
-TIP: If using cryotherapy on anal or penile lesions, use the cryo-specific codes
-(46916, 54056) which often pay more than generic simple/extensive codes.
+        The call shares the response cache with _call_llm: a cached response is
+        replayed at once, and a new one is cached when it finished below the
+        token limit and parses as JSON. Its output tokens feed the call site's
+        adaptive limit, although the stream itself always runs at the full
+        max_tokens (a truncated stream can't be retried without repeating items).
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 5: NAIL PROCEDURES
-═══════════════════════════════════════════════════════════════════════════════
-CLINICAL TRIGGERS:
-• Dystrophic nails (thickened, discolored)
-• Onychomycosis
-• Subungual debris
-• Nail psoriasis with dystrophy
+        Args:
+            request: Call site arguments, as built by the _*_request methods
+            array_key: Top-level key of the array to stream
 
-BILLING CODES (use potential_code with count):
-• 11720: Nail debridement 1-5 nails (0.34 wRVU)
-• 11721: Nail debridement 6+ nails (0.53 wRVU)
+        Yields:
+            Array elements as parsed JSON values
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 6: BIOPSY OPPORTUNITIES
-═══════════════════════════════════════════════════════════════════════════════
-CLINICAL TRIGGERS:
-• Any lesion with ABCDE criteria (asymmetry, border, color, diameter, evolution)
-• New or changing pigmented lesions
-• Non-healing lesions
-• Uncertain diagnosis requiring histopathology
-• Inflammatory conditions unresponsive to treatment
+        Raises:
+            ValueError: The complete response is not valid JSON
+        """
+        kwargs = self._request_params(**request)
+        key = self._cache_key(kwargs)
+        parser = _StreamingArrayParser(array_key)
+
+        cached = self._cached_response(key)
+        if cached is not None:
+            for item in parser.feed(cached):
+                yield item
+            return
+
+        async with self.async_client.messages.stream(**kwargs) as stream:
+            async for text in stream.text_stream:
+                for item in parser.feed(text):
+                    yield item
+            message = await stream.get_final_message()
+
+        if request.get("output_budget"):
+            self._record_output_tokens(request["output_budget"], message)
+        text = self._response_text(message, None)
+        self._parse_json_response(text)
+        if message.stop_reason != "max_tokens":
+            self._store_response(key, text)
 
-BILLING CODES (use potential_code):
-• 11102: Tangential biopsy - first lesion (0.56 wRVU) - superficial lesions
-• 11103: Tangential biopsy - each additional (+0.17 wRVU)
-• 11104: Punch biopsy - first lesion (0.69 wRVU) - deeper sampling needed
-• 11105: Punch biopsy - each additional (+0.24 wRVU)
-• 11106: Incisional biopsy - first lesion (1.01 wRVU) - large/deep lesions
-• 11107: Incisional biopsy - each additional (+0.48 wRVU)
+    def _parse_json_response(self, response: str) -> dict:
+        """
+        Parse JSON from LLM response, handling markdown code blocks.
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 7: E/M LEVEL OPTIMIZATION
-═══════════════════════════════════════════════════════════════════════════════
-CRITICAL: DO NOT use code_options for E/M. Determine the SINGLE MAXIMUM REASONABLE
-achievable code and use potential_code. Then specify EXACTLY what to document.
+        Args:
+            response: LLM response text
 
-E/M LEVELS (Established):
-• 99213 (1.30 wRVU): Straightforward MDM - single self-limited condition
-• 99214 (1.92 wRVU): Moderate MDM - multiple conditions, Rx management, or chronic illness
-• 99215 (2.80 wRVU): High MDM - severe/life-threatening, multiple Rx, or extensive counseling
+        Returns:
+            Parsed JSON dict
+        """
+        original_response = response
 
-WHAT SUPPORTS EACH LEVEL:
-99214 requires ONE of:
-- 2+ chronic conditions requiring management decisions
-- Prescription drug requiring monitoring (labs, side effects)
-- Condition with mild exacerbation or uncertain diagnosis
+        # Try to extract JSON from markdown code blocks, preferring a ```json fence.
+        # The first fence is usually the JSON one, so one scan finds it. Bare JSON
+        # (tool input, or a response without a fence) skips the search, since
+        # string values in it may contain ``` themselves
+        start = -1 if response.startswith("{") else response.find("```")
+        if start >= 0:
+            if response.startswith("json", start + 3):
+                start += 7
+            else:
+                json_fence = response.find("```json", start + 3)
+                start = json_fence + 7 if json_fence >= 0 else start + 3
+            # No closing ``` (e.g. generation stopped at the fence): take the rest.
+            # orjson skips the surrounding whitespace, so the body isn't stripped
+            end = response.find("```", start)
+            response = response[start:end if end >= 0 else len(response)]
 
-99215 requires ONE of:
-- Condition with severe exacerbation or significant risk
-- Drug requiring intensive monitoring (biologics, immunosuppressants)
-- Decision about hospitalization or referral for emergency
+        try:
+            return orjson.loads(response)
+        except orjson.JSONDecodeError as e:
+            # Try to find a JSON object embedded in the response
+            data = _find_json_object(original_response)
+            if data is not None:
+                return data
+            raise ValueError(f"Failed to parse JSON from LLM response: {e}. Response: {original_response[:500]}")
 
-USE CLINICAL JUDGMENT - PICK ONE CODE, NEVER A RANGE:
-- Simple acne follow-up → 99213 (single condition, stable)
-- Acne with multiple components (inflammatory + PIH + cystic) → 99214 (multiple treatment decisions)
-- Psoriasis on biologic → 99214 (drug monitoring qualifies as moderate)
-- Psoriasis flare requiring biologic switch → 99215 (high-risk drug decision)
-- Eczema with secondary infection → 99214 (acute on chronic)
-- Melanoma follow-up with new suspicious lesion → 99215 (high risk)
+    def _parse_entities(self, response: str) -> ExtractedEntities:
+        """
+        Build ExtractedEntities from an LLM response.
 
-NEVER output "99214-99215" or any range. Pick the SINGLE highest defensible code.
+        Args:
+            response: LLM response text
 
-ADD-ONS:
-• G2211 (+0.33 wRVU): Established ongoing care relationship (chronic condition management)
-• G2212 (+0.61 wRVU): Prolonged visit - document total face-to-face time >40min est/60min new
+        Returns:
+            ExtractedEntities object
+        """
+        # The emit_entities tool input already follows the ExtractedEntities schema
+        data = self._parse_json_response(response)
+        data.pop("raw_entities", None)
+        return ExtractedEntities.model_validate(data)
+
+    def _entities_request(self, prompt: str) -> dict:
+        """Build the _call_llm arguments for entity extraction."""
+        return {
+            "prompt": prompt,
+            "system": ENTITY_EXTRACTION_SYSTEM,
+            "max_tokens": ENTITY_MAX_TOKENS,
+            "tool": ENTITY_TOOL,
+            "output_budget": "entities",
+            "model": self.entity_model,
+        }
 
-═══════════════════════════════════════════════════════════════════════════════
-G2211 CRITICAL RULE - DIAGNOSIS SEPARATION REQUIRED
-═══════════════════════════════════════════════════════════════════════════════
-G2211 (ongoing care add-on) CANNOT be used if a PROCEDURE is billed for the SAME DIAGNOSIS.
+    def extract_entities(self, note_text: str) -> ExtractedEntities:
+        """
+        Extract entities from a clinical note.
 
-EVERY CODE MUST HAVE AN ASSOCIATED DIAGNOSIS. This is critical for G2211 eligibility.
+        Args:
+            note_text: Clinical note text
 
-Example scenario: Patient with Acne + PIH + Inflamed Cyst
-  - WRONG: Bill injection under "Acne" → G2211 BLOCKED for Acne management
-  - RIGHT: Bill injection under "Inflamed Cyst", chemical peel under "PIH"
-           → G2211 CAN be used for ongoing Acne management (no procedure on Acne dx)
+        Returns:
+            ExtractedEntities object
+        """
+        prompt = get_extraction_prompt(note_text)
+        regex_future = _REGEX_EXECUTOR.submit(extract_entities_regex, note_text)
 
-G2211 ELIGIBILITY CHECK:
-1. Identify all diagnoses in the note
-2. Identify which procedures could be billed and their associated diagnoses
-3. G2211 can ONLY be used for a chronic condition that has NO same-day procedure
-4. In action field, specify which diagnosis G2211 applies to
+        try:
+            llm_entities = self._call_llm(**self._entities_request(prompt), parse=self._parse_entities)
+        except self._fallback_errors:
+            # Fallback to regex-only extraction
+            llm_entities = ExtractedEntities()
 
-OUTPUT REQUIREMENT: For EVERY potential_code, specify the associated diagnosis.
-This enables proper G2211 eligibility determination and correct unbundling.
+        return merge_entities(llm_entities, regex_future.result())
 
-DIAGNOSIS STRATEGY FOR OPPORTUNITIES:
-Your job is to OUTPUT THE OPTIMAL BILLING OPPORTUNITIES. Assume all clinically plausible
-findings ARE present - the provider will deselect anything that doesn't apply.
+    async def extract_entities_async(self, note_text: str) -> ExtractedEntities:
+        """Async version of extract_entities."""
+        prompt = get_extraction_prompt(note_text)
+        # Regex extraction takes milliseconds on long notes; run it in a thread
+        # while the LLM call is in flight instead of on the event loop afterwards
+        regex_task = asyncio.ensure_future(asyncio.to_thread(extract_entities_regex, note_text))
 
-1. Assign diagnoses that MAXIMIZE billing and preserve G2211:
-   - Chemical peel → bill under "PIH" (preserves G2211 for Acne management)
-   - Injection → bill under "Inflamed cyst" (preserves G2211 for Acne)
+        try:
+            llm_entities = await self._call_llm_async(
+                **self._entities_request(prompt), parse=self._parse_entities
+            )
+        except self._fallback_errors:
+            # Fallback to regex-only extraction
+            llm_entities = ExtractedEntities()
 
-2. ASSUME COMMON CO-OCCURRING CONDITIONS ARE PRESENT and output opportunities for them:
-   - Acne patient → ASSUME PIH present, inflamed cysts present, comedones present
-   - TBSE → ASSUME seborrheic dermatitis on scalp, tinea pedis, actinic damage present
-   - Nail dystrophy → ASSUME onychomycosis present (nail clipping/KOH billable)
-   - Psoriasis → ASSUME nail pitting/dystrophy present (separate billable)
-   - Elderly patient → ASSUME xerosis, seborrheic keratoses, actinic keratoses present
-   - Any visit → ASSUME patient needs sun protection counseling (OTC management)
+        return merge_entities(llm_entities, await regex_task)
 
-3. For E/M upgrades, OUTPUT opportunities based on common findings:
-   - TBSE → output upgrade opportunity for treating seb derm or tinea (moderate complexity)
-   - Low-level E/M → output upgrade for OTC counseling (sunscreen = prescription-strength management)
-   - Chronic condition → output G2211 add-on opportunity
+    def _current_billing_request(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> dict:
+        """Build the _call_llm arguments for a current-billing analysis."""
+        return {
+            "prompt": CURRENT_BILLING_PROMPT.substitute(
+                note=note_text,
+                entities=entities_json or _entities_json(entities),
+            ),
+            "system": CURRENT_BILLING_SYSTEM,
+            "max_tokens": 4096,
+            "context_blocks": [f"REFERENCE INFORMATION:\n{corpus_context}"],
+            "output_budget": "current_billing",
+        }
 
-4. Be AGGRESSIVE. Output the maximum plausible billing. Provider deselects what doesn't apply.
+    def _parse_current_billing(self, response: str) -> CurrentBilling:
+        """
+        Build CurrentBilling from an LLM response.
 
-OUTPUT FORMAT for E/M:
-{{"category": "visit_level", "finding": "[What in this note supports higher E/M]",
-  "opportunity": "E/M upgrade to 99214", "action": "Document: [EXACTLY what to add]",
-  "potential_code": {{"code": "99214", "description": "Moderate MDM (add -25 mod if billing with procedure)", "wRVU": 1.92, "diagnosis": "Acne"}},
-  "teaching_point": "[Why this level is appropriate and defensible]"}}
+        Args:
+            response: LLM response text
 
-NOTE: Output just the E/M code (99213, 99214, 99215) without the modifier.
-The -25 modifier is added when billing E/M same-day with a procedure - mention this in description.
+        Returns:
+            CurrentBilling object
+        """
+        data = self._parse_json_response(response)
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 8: PROCEDURE UPGRADES
-═══════════════════════════════════════════════════════════════════════════════
-PRINCIPLE: When a procedure was performed but more treatable sites exist, suggest
-treating all to reach higher billing tiers.
+        codes = _billing_codes(data.get("codes") or [])
 
-TIER THRESHOLDS:
-• Nail debridement: 6+ nails → 11721 (vs 11720 for 1-5)
-• IL injections: 8+ lesions → 11901 (vs 11900 for 1-7)
-• AK destruction: 15+ → 17004 flat rate (vs 17000+17003)
-• Benign destruction: 15+ → 17111 (vs 17110 for 1-14)
+        return CurrentBilling(
+            codes=codes,
+            total_wRVU=_total_wRVU(data, codes),
+            documentation_gaps=data.get("documentation_gaps") or [],
+        )
 
-EXAMPLES:
-• Psoriasis with nail dystrophy: If nails debrided but 8+ show dystrophy → upgrade opportunity
-• Thick plaques injected: If 4 plaques injected but 6 total present → upgrade to 8+ tier
-• Multiple AKs: If 10 treated but 20 visible → suggest treating all for 17004
+    def analyze_current_billing(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> CurrentBilling:
+        """
+        Analyze what can be billed from the note as written.
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 9: COMORBIDITY CAPTURE
-═══════════════════════════════════════════════════════════════════════════════
-Look for unaddressed conditions that could warrant separate work:
-• Psoriatic arthritis screening in psoriasis patients
-• Depression/anxiety screening in chronic skin conditions
-• Nail involvement in psoriasis (separate from skin)
-• Eye involvement in rosacea
+        Args:
+            note_text: Original clinical note
+            entities: Extracted entities
+            corpus_context: Relevant corpus content (codes, rules)
+            entities_json: Entities already serialized for the prompt, if available
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 10: MEDICOLEGAL DOCUMENTATION (no wRVU but critical for liability)
-═══════════════════════════════════════════════════════════════════════════════
-CRITICAL PRINCIPLE: Avoid selective risk documentation. Either document ALL relevant
-risks or none - inconsistent depth creates liability ("Why skin cancer but not infection?")
+        Returns:
+            CurrentBilling object
+        """
+        try:
+            return self._call_llm(
+                **self._current_billing_request(note_text, entities, corpus_context, entities_json),
+                parse=self._parse_current_billing,
+            )
+        except self._fallback_errors as e:
+            return _billing_error(e)
 
-Only suggest medicolegal additions when:
-• Follow-up timing is COMPLETELY missing (not just brief)
-• Risk discussion is ABSENT when high-risk treatment discussed
-• Clinical reasoning needed for atypical lesion NOT biopsied
+    def identify_batch(
+        self,
+        notes: list[tuple[str, ExtractedEntities, str, str]],
+        poll_interval: float = 10.0,
+        max_wait: float = BATCH_MAX_WAIT,
+    ) -> list[tuple[CurrentBilling, DocumentationEnhancements, FutureOpportunities]]:
+        """
+        Run the enhancements and opportunities calls for many notes as one Message Batches job.
 
-DO NOT suggest when:
-• "Risks and benefits discussed" already present - legally sufficient
-• Expanding one risk would create inconsistent documentation depth
+        This is the batched counterpart of calling identify_enhancements and
+        identify_opportunities per note, for non-interactive bulk runs where
+        half-price tokens matter more than latency. A single note is analyzed
+        with direct calls, since a batch only adds polling latency.
 
-For medicolegal opportunities, use:
-- category: "medicolegal"
-- potential_code: {{"code": "LEGAL", "description": "[What to document]", "wRVU": 0}}
+        Args:
+            notes: (note_text, entities, scenario_content, corpus_context) for each note
+            poll_interval: Seconds to wait before the first batch status check
+            max_wait: Seconds to wait for the batch before cancelling it
 
-═══════════════════════════════════════════════════════════════════════════════
-CATEGORY 11: DOCUMENTATION-DRIVEN UPGRADES (same work, higher billing)
-═══════════════════════════════════════════════════════════════════════════════
-These are HIGH-VALUE opportunities where the clinical work was already done,
-but documentation upgrades justify higher-paying codes. Look for these actively!
+        Returns:
+            (CurrentBilling, DocumentationEnhancements, FutureOpportunities) in the
+            same order as notes
+
+        Raises:
+            TimeoutError: The batch did not finish within max_wait
+        """
+        if len(notes) <= 1:
+            return [
+                (
+                    *self.identify_enhancements(note_text, entities, corpus_context),
+                    self.identify_opportunities(note_text, entities, scenario_content, corpus_context),
+                )
+                for note_text, entities, scenario_content, corpus_context in notes
+            ]
 
-1. REPAIR TYPE UPGRADES (Simple → Intermediate → Complex):
-   • Simple (12001-12021): Single layer closure
-   • Intermediate (12031-12057): Document "layered closure" or "extensive undermining"
-   • Complex (13100-13160): Document debridement, scar revision, stents, retention sutures
+        requests = {}
+        for i, (note_text, entities, scenario_content, corpus_context) in enumerate(notes):
+            entities_json = _entities_json(entities)
+            requests[f"note-{i}-enh"] = self._request_params(
+                **self._enhancements_request(note_text, entities, corpus_context, entities_json)
+            )
+            requests[f"note-{i}-opp"] = self._request_params(
+                **self._opportunities_request(
+                    note_text, entities, scenario_content, corpus_context, entities_json
+                )
+            )
+        responses = self._run_batch(requests, poll_interval, max_wait)
+
+        def parsed(custom_id: str, parse: Callable[[str], Any]) -> Any:
+            response = responses.get(custom_id, ValueError("No batch result returned"))
+            if isinstance(response, Exception):
+                raise response
+            try:
+                return parse(response)
+            except RESPONSE_ERRORS:
+                # Don't serve a malformed response from the cache again
+                self._forget_response(self._cache_key(requests[custom_id]))
+                raise
+
+        results = []
+        for i in range(len(notes)):
+            try:
+                current_billing, doc_enhancements = parsed(f"note-{i}-enh", self._parse_enhancements)
+            except RESPONSE_ERRORS as e:
+                current_billing, doc_enhancements = _enhancements_error(e)
+            try:
+                future_opps = parsed(f"note-{i}-opp", self._parse_opportunities)
+            except RESPONSE_ERRORS:
+                future_opps = _opportunities_error()
+            results.append((current_billing, doc_enhancements, future_opps))
+        return results
+
+    def _request_params(
+        self,
+        prompt: str,
+        system: str,
+        max_tokens: int,
+        context_blocks: list[str],
+        output_budget: Optional[str] = None,
+    ) -> dict:
+        """
+        Build messages.create arguments for a call made outside _call_llm (batch or stream).
 
-   DOCUMENTATION TIP: If you closed in layers, document it! "Layered closure performed"
-   upgrades simple to intermediate. "Extensive undermining required" also qualifies.
-   wRVU difference: Simple 2.5cm trunk (12001) = 1.11 vs Intermediate (12031) = 1.95
+        These match what _call_llm sends for the same call site at its full
+        max_tokens, so batch results and interactive calls share cache entries.
+        """
+        params = self._message_kwargs(prompt, system, max_tokens, 0.0, context_blocks)
+        if output_budget:
+            params["stop_sequences"] = JSON_STOP_SEQUENCES
+        return params
 
-2. EXCISION SIZE DOCUMENTATION:
-   • Excision codes are tiered by size: lesion diameter + 2x narrowest margin
-   • Document the TOTAL size including margins, not just lesion size
-   • Example: 0.8cm lesion with 0.3cm margins = 1.4cm total → higher tier code
+    def _run_batch(
+        self,
+        requests: dict[str, dict],
+        poll_interval: float,
+        max_wait: float = BATCH_MAX_WAIT,
+    ) -> dict[str, str | Exception]:
+        """
+        Submit requests as one Message Batches job and wait for the results.
 
-   DOCUMENTATION TIP: "Excision performed, specimen measured 1.4 cm including margins"
+        Requests whose response is already cached are answered from the cache
+        without being submitted, identical requests are submitted once, and new
+        responses are cached as they arrive.
+        Status checks start after poll_interval seconds and back off up to
+        BATCH_POLL_MAX_INTERVAL.
 
-3. BIOPSY TYPE SELECTION (all clinically equivalent for many lesions):
-   • 11102 Tangential (0.56 wRVU): superficial sampling
-   • 11104 Punch (0.69 wRVU): full-thickness sampling
-   • 11106 Incisional (1.01 wRVU): large/deep lesions, partial removal
+        Args:
+            requests: messages.create arguments keyed by custom_id
+            poll_interval: Seconds to wait before the first status check
+            max_wait: Seconds to wait for the batch to end
 
-   DOCUMENTATION TIP: If punch was used, document "punch biopsy". If you excised
-   a portion of a larger lesion, that's incisional (1.01 vs 0.56 wRVU).
+        Returns:
+            Response text, or the error for a failed request, keyed by custom_id
 
-4. DESTRUCTION MODALITY DOCUMENTATION:
-   • Cryo-specific codes (46916, 54056) often pay more than generic codes
-   • Document the specific modality: "cryotherapy", "electrodesiccation", "laser"
+        Raises:
+            TimeoutError: The batch did not end within max_wait; it is cancelled
+        """
+        results: dict[str, str | Exception] = {}
+        # custom_ids waiting on each uncached request, keyed by its cache key;
+        # the first custom_id is the one submitted
+        pending: dict[str, list[str]] = {}
+        for custom_id, params in requests.items():
+            key = self._cache_key(params)
+            cached = self._cached_response(key)
+            if cached is not None:
+                results[custom_id] = cached
+            else:
+                pending.setdefault(key, []).append(custom_id)
+        if not pending:
+            return results
+
+        submitted = {custom_ids[0]: key for key, custom_ids in pending.items()}
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": custom_id, "params": requests[custom_id]} for custom_id in submitted]
+        )
+
+        delay = poll_interval
+        deadline = time.monotonic() + max_wait
+        while batch.processing_status != "ended":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.client.messages.batches.cancel(batch.id)
+                raise TimeoutError(f"Message batch {batch.id} did not finish within {max_wait:.0f}s")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, BATCH_POLL_MAX_INTERVAL)
+            batch = self.client.messages.batches.retrieve(batch.id)
+
+        for entry in self.client.messages.batches.results(batch.id):
+            key = submitted[entry.custom_id]
+            if entry.result.type == "succeeded":
+                response = self._response_text(entry.result.message, None)
+                if entry.result.message.stop_reason != "max_tokens":
+                    self._store_response(key, response)
+            else:
+                response = ValueError(f"Batch request {entry.result.type}")
+            for custom_id in pending[key]:
+                results[custom_id] = response
+        return results
 
-5. WOUND COMPLEXITY FACTORS (justify intermediate/complex):
-   • Contaminated wound requiring debridement
-   • Wound edges requiring trimming/revision
-   • Undermining performed for tension-free closure
-   • Bleeding requiring more than simple pressure
-   • Location requiring meticulous technique (eyelid, lip vermillion)
+    def _enhancements_request(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> dict:
+        """Build the _call_llm arguments for billing plus documentation enhancements."""
+        return {
+            "prompt": ENHANCEMENTS_PROMPT.substitute(
+                note=note_text,
+                entities=entities_json or _entities_json(entities),
+            ),
+            "system": ENHANCEMENTS_SYSTEM,
+            "max_tokens": 8192,
+            "context_blocks": [ENHANCEMENTS_INSTRUCTIONS, f"REFERENCE:\n{corpus_context}"],
+            "output_budget": "enhancements",
+        }
 
-6. E/M COMPLEXITY DOCUMENTATION:
-   • Reviewing outside records → document "reviewed external records from [source]"
-   • Discussing with other providers → document the consultation
-   • Extended counseling → document time and topics discussed
-   • Multiple diagnoses → list each one addressed
+    def _parse_enhancements(self, response: str) -> tuple[CurrentBilling, DocumentationEnhancements]:
+        """
+        Build current billing and documentation enhancements from an LLM response.
 
-For documentation upgrades, use category: "documentation_upgrade"
-{{"category": "documentation_upgrade", "finding": "[What was done]",
-  "opportunity": "[Higher code available]", "action": "Document: [specific language]",
-  "potential_code": {{"code": "12031", "description": "Intermediate repair - document layered closure", "wRVU": 1.95}},
-  "teaching_point": "[Why this documentation justifies the upgrade]"}}
+        Args:
+            response: LLM response text
 
-═══════════════════════════════════════════════════════════════════════════════
-OUTPUT RULES
-═══════════════════════════════════════════════════════════════════════════════
-1. ONE CARD PER CODE FAMILY: Don't mix IL injections with AK destruction, etc.
+        Returns:
+            Tuple of (CurrentBilling, DocumentationEnhancements)
+        """
+        data = self._parse_json_response(response)
+
+        # Parse current billing
+        cb_data = data.get("current_billing") or {}
+        codes = _billing_codes(cb_data.get("codes") or [])
+        current_billing = CurrentBilling(
+            codes=codes,
+            total_wRVU=_total_wRVU(cb_data, codes),
+            documentation_gaps=cb_data.get("documentation_gaps") or [],
+        )
+
+        # Parse enhancements
+        enhancements = _ENHANCEMENTS.validate_python(
+            [_enhancement_fields(e) for e in data.get("enhancements") or []]
+        )
+
+        doc_enhancements = DocumentationEnhancements(
+            enhancements=enhancements,
+            suggested_addendum=data.get("suggested_addendum"),
+            optimized_note=data.get("optimized_note"),
+            enhanced_total_wRVU=float(data.get("enhanced_total_wRVU", 0)),
+            improvement=float(data.get("improvement", 0)),
+        )
+
+        return current_billing, doc_enhancements
 
-2. COUNT-BASED CODES: Include specific count extracted from note anatomy in description
-   (e.g., "IL injection ~4 lesions", "Nail debridement 8 nails")
+    def identify_enhancements(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> tuple[CurrentBilling, DocumentationEnhancements]:
+        """
+        Analyze current billing AND identify documentation enhancements.
 
-3. TIER-BASED CODES: Use code_options array for codes with discrete tiers
+        Args:
+            note_text: Original clinical note
+            entities: Extracted entities
+            corpus_context: Relevant corpus content
+            entities_json: Entities already serialized for the prompt, if available
 
-4. TEACHING POINT: Brief billing tip explaining why this opportunity exists
+        Returns:
+            Tuple of (CurrentBilling, DocumentationEnhancements)
+        """
+        try:
+            return self._call_llm(
+                **self._enhancements_request(note_text, entities, corpus_context, entities_json),
+                parse=self._parse_enhancements,
+            )
+        except self._fallback_errors as e:
+            return _enhancements_error(e)
 
-5. CLINICAL SPECIFICITY: Reference actual findings from the note
+    async def identify_enhancements_async(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> tuple[CurrentBilling, DocumentationEnhancements]:
+        """Async version of identify_enhancements."""
+        try:
+            return await self._call_llm_async(
+                **self._enhancements_request(note_text, entities, corpus_context, entities_json),
+                parse=self._parse_enhancements,
+            )
+        except self._fallback_errors as e:
+            return _enhancements_error(e)
 
-RESPOND WITH JSON ONLY:
-{{"opportunities": [
-  {{"category": "procedure|visit_level|comorbidity|medicolegal|documentation_upgrade",
-    "finding": "[Specific clinical finding from note]",
-    "opportunity": "[What could be billed or documented]",
-    "action": "[What provider should do]",
-    "potential_code": {{"code": "X", "description": "X", "wRVU": 0.00}},
-    "teaching_point": "[Billing tip or medicolegal rationale]"}}
-], "optimized_note": "[Full rewritten note with all opportunities documented as performed]",
-"total_potential_additional_wRVU": 0.00}}
+    async def iter_enhancements(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        corpus_context: str,
+    ) -> AsyncIterator[DocumentationEnhancement]:
+        """
+        Stream the enhancements analysis, yielding each enhancement as soon as it is parsed.
 
-═══════════════════════════════════════════════════════════════════════════════
-ABSOLUTE PROHIBITION - NEVER INVENT NUMBERS
-═══════════════════════════════════════════════════════════════════════════════
-- NEVER add specific lesion counts that are NOT in the original note
-- If original says "vulvar warts" do NOT write "3 vulvar warts" or any number
-- Use ONLY qualitative descriptors: "multiple", "several", "extensive"
-- Fabricating numbers is MEDICAL FRAUD - completely unacceptable
-- The ONLY numbers allowed in optimized_note are:
-  1. Numbers that appear VERBATIM in the original note
-  2. Counts that are implied by bilateral anatomy (e.g., "bilateral" = 2)
+        Uses the same request as identify_enhancements, but reads the response
+        as a stream so a UI can show the first enhancements while the rest
+        (and the optimized note that follows them) is still being generated.
 
-═══════════════════════════════════════════════════════════════════════════════
-GENITAL/ANAL DESTRUCTION - EXTENSIVE DOCUMENTATION IN OPTIMIZED_NOTE
-═══════════════════════════════════════════════════════════════════════════════
-When the original note contains genital/anal destruction (vulvar, penile, anal warts),
-the optimized_note MUST include extensive destruction justification language:
-- "Extensive cryotherapy performed to vulvar condylomata requiring extended treatment time"
-- "Multiple confluent lesions requiring meticulous technique"
-- Document: extended time, multiple lesions, difficulty, surface area, etc.
-This allows billing the extensive code (56515, 54055, 46910) instead of simple.
+        Args:
+            note_text: Original clinical note
+            entities: Extracted entities
+            corpus_context: Relevant corpus content
 
-OPTIMIZED NOTE RULES:
-- Output ONLY the clinical note text - no Time, Coding, or billing sections
-- Be CONCISE and FACTUAL
-- Include safety documentation when clinically relevant
-- NEVER INVENT NUMBERS - use qualitative descriptors only unless number is in original
-- For genital destruction: INCLUDE extensive justification language by default"""
+        Yields:
+            DocumentationEnhancement objects in response order
+        """
+        request = self._enhancements_request(note_text, entities, corpus_context)
+        async for e in self._stream_array(request, "enhancements"):
+            yield DocumentationEnhancement(**_enhancement_fields(e))
 
-        system = """You are an expert dermatology billing educator and optimizer. MAXIMIZE RVU.
+    def _opportunities_request(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        scenario_content: str,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> dict:
+        """Build the _call_llm arguments for future opportunities."""
+        return {
+            "prompt": OPPORTUNITIES_PROMPT.substitute(
+                note=note_text,
+                entities=entities_json or _entities_json(entities),
+            ),
+            "system": OPPORTUNITIES_SYSTEM,
+            "max_tokens": 8192,
+            "context_blocks": [
+                OPPORTUNITIES_INSTRUCTIONS,
+                f"CLINICAL SCENARIO GUIDANCE:\n{scenario_content}",
+                f"BILLING REFERENCE:\n{corpus_context}",
+            ],
+            "output_budget": "opportunities",
+        }
 
-═══════════════════════════════════════════════════════════════════════════════
-ABSOLUTE RULES - VIOLATIONS ARE UNACCEPTABLE
-═══════════════════════════════════════════════════════════════════════════════
-1. NEVER INVENT NUMBERS - if original note has no count, do NOT add one
-   - Use "multiple", "several", "extensive" - NEVER fabricate counts like "3" or "4"
-   - Inventing lesion counts is MEDICAL FRAUD
-2. GENITAL DESTRUCTION: Include extensive justification in optimized_note by default
-   - Always add: "extensive requiring extended treatment time", "multiple confluent lesions", etc.
+    def _parse_opportunities(self, response: str) -> FutureOpportunities:
+        """
+        Build future opportunities from an LLM response.
 
-CRITICAL RULES - RVU MAXIMIZATION:
-1. CHECK EVERY count-based procedure in Plan for upgrade potential:
-   - Extract count using principle-based approach (digits, bilateral, listed sites)
-   - Compare to exam findings - more treatable sites = upgrade opportunity
-   - Ambiguous count (no count in procedure) = upgrade opportunity (baseline tier only billable)
-2. ONE card per code family - aggregate related findings
-3. Be SPECIFIC - reference actual findings, target counts, tier thresholds
-4. Include accurate wRVU values from reference
-5. HIGH-VALUE first (procedures > E/M)
-6. ONE medicolegal card if safety documentation missing
+        Args:
+            response: LLM response text
 
-UPGRADE DETECTION CHECKLIST:
-□ Nail debridement done? → Check: exam nail count vs treated count → suggest 6+ for 11721
-□ IL injection done? → Check: exam lesion count vs injected count → suggest 8+ for 11901
-□ AK destruction done? → Check: exam AK count vs treated count → suggest 15+ for 17004
-□ Benign destruction done? → Check: exam lesion count vs treated count → suggest 15+ for 17111
-□ Count ambiguous in any above? → This IS an upgrade opportunity (baseline only billable)
+        Returns:
+            FutureOpportunities object
+        """
+        data = self._parse_json_response(response)
 
-E/M CRITICAL: Pick ONE specific code, not a range. No -25 in code field.
+        opportunities = _OPPORTUNITIES.validate_python(
+            [_opportunity_fields(o) for o in data.get("opportunities") or []]
+        )
 
-USE potential_code (single code) for:
-- E/M levels, count-based procedures, medicolegal items
+        return FutureOpportunities(
+            opportunities=opportunities,
+            optimized_note=data.get("optimized_note"),
+            total_potential_additional_wRVU=float(data.get("total_potential_additional_wRVU", 0)),
+        )
 
-USE code_options ONLY for:
-- Truly mutually exclusive tiers (genital: simple vs extensive)
+    def identify_opportunities(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        scenario_content: str,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> FutureOpportunities:
+        """
+        Identify future opportunities ("next time" recommendations).
 
-OUTPUT: Valid JSON only."""
+        Args:
+            note_text: Original clinical note
+            entities: Extracted entities
+            scenario_content: Matched scenario file content
+            corpus_context: Additional corpus context
+            entities_json: Entities already serialized for the prompt, if available
 
+        Returns:
+            FutureOpportunities object
+        """
         try:
-            response = await self._call_llm_async(prompt, system=system, max_tokens=8192)
-            data = self._parse_json_response(response)
-
-            opportunities = []
-            for o in data.get("opportunities", []):
-                potential_code = None
-                if o.get("potential_code"):
-                    pc = o["potential_code"]
-                    potential_code = PotentialCode(
-                        code=pc["code"],
-                        description=pc.get("description", ""),
-                        wRVU=float(pc.get("wRVU", 0)),
-                        diagnosis=pc.get("diagnosis"),
-                    )
-
-                code_options = None
-                if o.get("code_options"):
-                    from .models import CodeOption
-                    code_options = [
-                        CodeOption(
-                            code=co["code"],
-                            description=co.get("description", ""),
-                            wRVU=float(co.get("wRVU", 0)),
-                            threshold=co.get("threshold", ""),
-                        )
-                        for co in o["code_options"]
-                    ]
-
-                opportunities.append(FutureOpportunity(
-                    category=o["category"],
-                    finding=o["finding"],
-                    opportunity=o["opportunity"],
-                    action=o["action"],
-                    potential_code=potential_code,
-                    code_options=code_options,
-                    teaching_point=o["teaching_point"],
-                ))
-
-            return FutureOpportunities(
-                opportunities=opportunities,
-                optimized_note=data.get("optimized_note"),
-                total_potential_additional_wRVU=float(data.get("total_potential_additional_wRVU", 0)),
+            return self._call_llm(
+                **self._opportunities_request(
+                    note_text, entities, scenario_content, corpus_context, entities_json
+                ),
+                parse=self._parse_opportunities,
             )
-        except Exception as e:
-            return FutureOpportunities(
-                opportunities=[],
-                optimized_note=None,
-                total_potential_additional_wRVU=0.0,
+        except self._fallback_errors:
+            return _opportunities_error()
+
+    async def identify_opportunities_async(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        scenario_content: str,
+        corpus_context: str,
+        entities_json: Optional[str] = None,
+    ) -> FutureOpportunities:
+        """Async version of identify_opportunities."""
+        try:
+            return await self._call_llm_async(
+                **self._opportunities_request(
+                    note_text, entities, scenario_content, corpus_context, entities_json
+                ),
+                parse=self._parse_opportunities,
             )
+        except self._fallback_errors:
+            return _opportunities_error()
+
+    async def iter_opportunities(
+        self,
+        note_text: str,
+        entities: ExtractedEntities,
+        scenario_content: str,
+        corpus_context: str,
+    ) -> AsyncIterator[FutureOpportunity]:
+        """
+        Stream the opportunities analysis, yielding each opportunity as soon as it is parsed.
+
+        Uses the same request as identify_opportunities, but reads the response
+        as a stream so the UI can render opportunity cards one at a time.
+
+        Args:
+            note_text: Original clinical note
+            entities: Extracted entities
+            scenario_content: Matched scenario file content
+            corpus_context: Additional corpus context
+
+        Yields:
+            FutureOpportunity objects in response order
+        """
+        request = self._opportunities_request(note_text, entities, scenario_content, corpus_context)
+        async for o in self._stream_array(request, "opportunities"):
+            yield FutureOpportunity(**_opportunity_fields(o))
 
     async def regenerate_note_async(
         self,
@@ -2149,44 +2232,18 @@ OUTPUT ONLY CLINICAL DOCUMENTATION - no time, no coding, no billing codes.
 
 OUTPUT THE COMPLETE OPTIMIZED NOTE:"""
 
-        system = """Medical documentation expert. Create minimal, defensible notes that support billing.
-
-ABSOLUTE RULE - NEVER HALLUCINATE NUMBERS:
-- NEVER invent counts, measurements, or quantities not in the original note
-- If original has no count, keep description vague (e.g., "vulvar condylomata" not "8 vulvar condylomata")
-- For extensive procedures, use QUALITATIVE language: "extensive treatment", "multiple lesions", "broad area"
-- Fabricating specific numbers is MEDICAL FRAUD and creates massive liability
-
-CRITICAL: Preserve the original note's format and structure:
-- If input has sections (HPI, Physical Exam, Assessment, Plan), keep those sections
-- If input is SOAP format, output SOAP format
-- If input is free-text paragraph, output paragraph
-
-Write the note AS IF all selected items were actually performed during the visit.
-- If an injection opportunity is selected, document that the injection WAS done
-- If an E/M upgrade is selected, document the MDM complexity that supports it
-- The note should be copy-paste ready to support billing all selected codes
-
-MEDICOLEGAL DOCUMENTATION PHILOSOPHY:
-- Document the MINIMUM NECESSARY to justify each billing code
-- Over-documentation creates malpractice liability - every detail can be cross-examined by attorneys
-- Concise, factual notes are legally safer than verbose, detailed ones
-- BUT: Always document safety-critical items (suspicious lesions, patient counseling, refusals, follow-up)
-- "If it wasn't documented, it wasn't done" - this applies to safety items especially
-- Use standard terminology, brief statements, objective findings
-
-NEVER include Time, Coding, or billing code sections. Output only pure clinical documentation.
-Output only the complete note text, no commentary."""
-
         try:
-            response = await self._call_llm_async(prompt, system=system, max_tokens=4096)
+            # Uncached: asking to regenerate again should not return the same text
+            response = await self._call_llm_async(
+                prompt, system=REGENERATE_NOTE_SYSTEM, max_tokens=4096, cache=False
+            )
             total_wRVU = sum(c.get("wRVU", 0) for c in billing_codes)
             return {
                 "optimized_note": response.strip(),
                 "billing_codes": billing_codes,
                 "total_wRVU": total_wRVU,
             }
-        except Exception as e:
+        except self._fallback_errors as e:
             return {
                 "optimized_note": f"Error regenerating note: {str(e)}",
                 "billing_codes": billing_codes,
@@ -2207,6 +2264,26 @@ def get_llm_client() -> LLMClient:
 
 
 def reset_llm_client() -> None:
-    """Reset the global LLM client (useful for testing)."""
+    """Reset the global LLM client (useful for testing); the shared connection pool stays open."""
     global _llm_client
     _llm_client = None
+
+
+async def close_llm_clients() -> None:
+    """
+    Close the shared connection pools and reset the global client.
+
+    Call once at process shutdown so open TLS connections and the disk cache
+    are released cleanly; a later get_llm_client() opens new pools.
+    """
+    if _llm_client is not None:
+        _llm_client.close_disk_cache()
+    reset_llm_client()
+    # Only the running loop's pool can still be closed; the others went with their loops
+    http_client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if http_client is not None:
+        await http_client.aclose()
+    _async_http_clients.clear()
+    if _shared_http_client.cache_info().currsize:
+        _shared_http_client().close()
+        _shared_http_client.cache_clear()
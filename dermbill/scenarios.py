@@ -5,13 +5,38 @@ Matches clinical conditions found in notes to the appropriate scenario files
 and returns relevant optimization opportunities.
 """
 
+import heapq
 import os
 import re
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 from dataclasses import dataclass
 
 
+# A keyword made only of word characters can be matched against the note's token set
+_WORD_RE = re.compile(r"\w+")
+
+# Scenario markdown structure: "## " section headers, CPT/HCPCS codes, and list items
+_SECTION_SPLIT_RE = re.compile(r'\n##\s+')
+_CODE_RE = re.compile(r'\b([0-9]{5}|[A-Z][0-9]{4})\b')
+_BULLET_RE = re.compile(r'[-*]\s+(.+?)(?:\n|$)')
+_TEACHING_ITEM_RE = re.compile(r'[-*>]\s*"?(.+?)"?\s*(?:\n|$)')
+
+
+@dataclass(frozen=True)
+class NormalizedNote:
+    """A clinical note normalized once for keyword matching."""
+    text: str
+    lower: str
+    tokens: frozenset[str]
+
+    @classmethod
+    def from_text(cls, text: str) -> "NormalizedNote":
+        """Lowercase and tokenize a clinical note."""
+        lower = text.lower()
+        return cls(text=text, lower=lower, tokens=frozenset(_WORD_RE.findall(lower)))
+
+
 @dataclass
 class ScenarioMatch:
     """A matched clinical scenario."""
@@ -153,6 +178,19 @@ class ScenarioMatcher:
         self.scenarios_dir = Path(scenarios_dir)
         self._scenario_cache: dict[str, str] = {}
 
+        # Per scenario: (keyword, compiled pattern or None if a token lookup suffices)
+        self._keyword_matchers: dict[str, list[tuple[str, Optional[re.Pattern]]]] = {}
+        for scenario_name, keywords in self.CONDITION_MAPPINGS.items():
+            matchers = []
+            for keyword in keywords:
+                keyword_lower = keyword.lower()
+                if _WORD_RE.fullmatch(keyword_lower):
+                    matchers.append((keyword, None))
+                else:
+                    # Use word boundary matching for more accurate results
+                    matchers.append((keyword, re.compile(r'\b' + re.escape(keyword_lower) + r'\b')))
+            self._keyword_matchers[scenario_name] = matchers
+
     def list_scenarios(self) -> list[str]:
         """List all available scenario names."""
         scenarios = []
@@ -189,28 +227,35 @@ class ScenarioMatcher:
         self._scenario_cache[scenario_name] = content
         return content
 
-    def match_scenarios(self, text: str, max_matches: int = 5) -> list[ScenarioMatch]:
+    def match_scenarios(
+        self,
+        text: Union[str, NormalizedNote],
+        max_matches: int = 5,
+    ) -> list[ScenarioMatch]:
         """
         Match clinical note text to relevant scenarios.
 
         Args:
-            text: Clinical note text
+            text: Clinical note text, or a NormalizedNote built from it
             max_matches: Maximum number of scenarios to return
 
         Returns:
             List of ScenarioMatch objects, sorted by relevance
         """
-        text_lower = text.lower()
+        note = text if isinstance(text, NormalizedNote) else NormalizedNote.from_text(text)
         matches = []
 
-        for scenario_name, keywords in self.CONDITION_MAPPINGS.items():
+        for scenario_name, keyword_matchers in self._keyword_matchers.items():
             matched_terms = []
             score = 0.0
 
-            for keyword in keywords:
-                # Use word boundary matching for more accurate results
-                pattern = r'\b' + re.escape(keyword.lower()) + r'\b'
-                if re.search(pattern, text_lower):
+            for keyword, pattern in keyword_matchers:
+                # Single-word keywords are a token lookup; phrases need the word-boundary regex
+                if pattern is None:
+                    matched = keyword.lower() in note.tokens
+                else:
+                    matched = pattern.search(note.lower) is not None
+                if matched:
                     matched_terms.append(keyword)
                     # Longer keywords get higher scores
                     score += len(keyword.split())
@@ -226,9 +271,8 @@ class ScenarioMatcher:
                         matched_terms=matched_terms,
                     ))
 
-        # Sort by score descending
-        matches.sort(key=lambda x: x.match_score, reverse=True)
-        return matches[:max_matches]
+        # Top matches by score descending (stable for ties, like a full sort)
+        return heapq.nlargest(max_matches, matches, key=lambda x: x.match_score)
 
     def get_relevant_scenarios_for_conditions(self, conditions: list[str]) -> list[ScenarioMatch]:
         """
@@ -263,7 +307,7 @@ class ScenarioMatcher:
         }
 
         # Extract sections using markdown headers
-        sections = re.split(r'\n##\s+', scenario_content)
+        sections = _SECTION_SPLIT_RE.split(scenario_content)
 
         for section in sections:
             section_lower = section.lower()
@@ -271,18 +315,18 @@ class ScenarioMatcher:
             # Extract procedure opportunities
             if "procedure" in section_lower or "opportunity" in section_lower:
                 # Look for code patterns (5 digits or 5 chars like G2211)
-                codes = re.findall(r'\b([0-9]{5}|[A-Z][0-9]{4})\b', section)
+                codes = _CODE_RE.findall(section)
                 opportunities["procedure_opportunities"].extend(codes)
 
             # Extract comorbidities
             if "comorbid" in section_lower or "look for" in section_lower:
                 # Look for bulleted items
-                items = re.findall(r'[-*]\s+(.+?)(?:\n|$)', section)
+                items = _BULLET_RE.findall(section)
                 opportunities["comorbidities_to_check"].extend(items)
 
             # Extract teaching points
             if "teaching" in section_lower or "next time" in section_lower:
-                items = re.findall(r'[-*>]\s*"?(.+?)"?\s*(?:\n|$)', section)
+                items = _TEACHING_ITEM_RE.findall(section)
                 opportunities["teaching_points"].extend(items)
 
         # Remove duplicates while preserving order
@@ -0,0 +1,63 @@
+"""Corpus context trimming must never drop the rules a note's procedures trigger."""
+
+import unittest
+
+from dermbill.analyzer import (
+    INSIGHTS_HEADING,
+    DermBillAnalyzer,
+    _relevance_terms,
+    _rules_to_load,
+    _trim_corpus_context,
+)
+from dermbill.models import ExtractedEntities
+
+
+EXCISION_REPAIR = ExtractedEntities(
+    diagnoses=["basal cell carcinoma"],
+    procedures=["excision of basal cell carcinoma, left cheek", "intermediate layered repair"],
+    anatomic_sites=["left cheek"],
+)
+
+REQUIRED_SECTIONS = [
+    "## Excision Medical Necessity",
+    "## Biopsy Medical Necessity",
+    "## E/M Medical Necessity",
+    "## Repair Medical Necessity",
+    "## Section 1: Excision Measurements",
+    "## Section 2: Repair Measurements",
+    "## High-Impact Modifiers for Dermatology",
+]
+
+
+class TrimCorpusContextTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.analyzer = DermBillAnalyzer()
+        cls.rules = _rules_to_load(EXCISION_REPAIR)
+        categories = cls.analyzer._procedure_categories([p.lower() for p in EXCISION_REPAIR.procedures])
+        cls.context = cls.analyzer._build_corpus_context(categories, cls.rules)
+
+    def test_excision_and_repair_trigger_their_rules(self):
+        self.assertIn("Measurement_Rules", self.rules)
+        self.assertIn("Repair_Aggregation", self.rules)
+        self.assertIn("Medical_Necessity", self.rules)
+
+    def test_trimming_is_off_by_default(self):
+        self.assertIsNone(self.analyzer.context_char_budget)
+
+    def test_triggered_rule_sections_survive_a_tight_budget(self):
+        trimmed = _trim_corpus_context(self.context, _relevance_terms(EXCISION_REPAIR), budget=1000)
+        for heading in REQUIRED_SECTIONS:
+            self.assertIn(heading, trimmed)
+        head = self.context.partition(INSIGHTS_HEADING)[0]
+        self.assertTrue(trimmed.startswith(head))
+        self.assertLess(len(trimmed), len(self.context))
+
+    def test_context_within_budget_is_unchanged(self):
+        terms = _relevance_terms(EXCISION_REPAIR)
+        self.assertEqual(_trim_corpus_context(self.context, terms, budget=None), self.context)
+        self.assertEqual(_trim_corpus_context(self.context, terms, budget=len(self.context)), self.context)
+
+
+if __name__ == "__main__":
+    unittest.main()